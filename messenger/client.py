@@ -1,4 +1,5 @@
 import os.path
+import socket
 import sys
 import json
 import argparse
@@ -11,6 +12,7 @@ from PyQt5.QtWidgets import QApplication, QMessageBox
 import common.settings as settings
 from client.qt.login_dialog import LoginDialog
 from client.qt.main_window import MainWindow
+from common import codec, schemas
 from common.tcp_socket import TCPSocket
 from common.meta import ClientVerifier
 from common.descriptors import Port, Address
@@ -37,6 +39,17 @@ class MsgClient(TCPSocket, QObject):
         self.db = None
         self.user = {settings.REQUEST_ACCOUNT_NAME: None, settings.REQUEST_PASSWORD: None}
         self.main_window = None
+        self.codec = codec.CODEC_JSON
+        self.compression = None
+        self.server_address = None
+        self.resume_token = None
+        self.received_seq = 0
+        self.users_sync_version = None
+        self.users_sync_names = []
+        self.resume_lock = threading.Lock()
+        # ответ pong отправляется из потока чтения, запись в сокет из двух потоков разделяется блокировкой
+        self.send_lock = threading.Lock()
+        self.handlers = self._init_handlers()
 
         self.to_server_messages = []
         self.sending_wait_flag = None
@@ -68,6 +81,7 @@ class MsgClient(TCPSocket, QObject):
             sys.exit(1)
         try:
             self.sock.connect((address, port))
+            self.server_address = (address, port)
             self.user[settings.REQUEST_ACCOUNT_NAME] = account_name
             self.user[settings.REQUEST_PASSWORD] = password
             self.logger.info(f'Подключились к серверу {address}:{port}')
@@ -130,7 +144,10 @@ class MsgClient(TCPSocket, QObject):
         self.db = ClientDB(os.path.join(os.getcwd(), 'client', filename))
 
     def _send_presence(self):
-        request = self._action_request(settings.ACTION_PRESENCE)
+        request = self._action_request(settings.ACTION_PRESENCE, data={
+            settings.REQUEST_CODECS: codec.available_codecs(),
+            settings.REQUEST_COMPRESSION: codec.available_compressions()
+        })
         self.to_server_messages.append(request)
 
     def _sending_server_messages(self):
@@ -138,10 +155,12 @@ class MsgClient(TCPSocket, QObject):
             time.sleep(0.5)
             if (not self.sending_wait_flag) and self.to_server_messages:
                 message = self.to_server_messages.pop(0)
+                sock = self.sock
                 try:
-                    self.send_message(self.sock, message)
+                    with self.send_lock:
+                        self.send_message(sock, message, self.codec, self.compression)
                 except (ConnectionResetError, ConnectionError, ConnectionAbortedError):
-                    self._lost_connection()
+                    self._lost_connection(sock)
                 else:
                     if settings.REQUEST_ACTION in message:
                         self.sending_wait_flag = message[settings.REQUEST_ACTION]
@@ -154,62 +173,66 @@ class MsgClient(TCPSocket, QObject):
                     self.logger.info(response)
 
     def _get_message_response(self):
+        sock = self.sock
         try:
-            message = self.get_message(self.sock)
+            message = self.get_message(sock)
 
             if settings.REQUEST_ACTION not in message:
                 raise ValueError(settings.REQUEST_ACTION)
 
             # print(f'={message[settings.REQUEST_ACTION]}')
+            # счётчик кадров сессии для возобновления после обрыва, ответы presence и resume не считаются
+            if message[settings.REQUEST_ACTION] not in [settings.ACTION_PRESENCE, settings.ACTION_RESUME]:
+                self.received_seq += 1
             if self.sending_wait_flag == message[settings.REQUEST_ACTION]:
                 self.sending_wait_flag = None
 
-            if message[settings.REQUEST_ACTION] == settings.ACTION_RESPONSE:
-                if settings.REQUEST_DATA not in message:
-                    raise ValueError(settings.REQUEST_DATA)
-                return self._get_response(message[settings.REQUEST_DATA])
-
-            elif message[settings.REQUEST_ACTION] == settings.ACTION_PRESENCE:
-                self._clear_status_message()
-                return f'{self.account_name} Online'
-
-            elif message[settings.REQUEST_ACTION] == settings.ACTION_P2P_MESSAGE:
-                if settings.REQUEST_DATA not in message:
-                    raise ValueError(settings.REQUEST_DATA)
-                return self._get_p2p_message(message[settings.REQUEST_DATA])
-
-            elif message[settings.REQUEST_ACTION] == settings.ACTION_GET_USERS:
-                if settings.REQUEST_DATA not in message:
-                    raise ValueError(settings.REQUEST_DATA)
-                return self._get_users(message[settings.REQUEST_DATA])
-
-            elif message[settings.REQUEST_ACTION] == settings.ACTION_GET_CONTACTS:
-                if settings.REQUEST_DATA not in message:
-                    raise ValueError(settings.REQUEST_DATA)
-                return self._get_contacts(message[settings.REQUEST_DATA])
-
-            elif message[settings.REQUEST_ACTION] == settings.ACTION_ADD_CONTACT:
-                if settings.REQUEST_DATA not in message:
-                    raise ValueError(settings.REQUEST_DATA)
-                if settings.REQUEST_USERNAME not in message[settings.REQUEST_DATA]:
-                    raise ValueError(settings.REQUEST_USERNAME)
-                return self._proc_add_contact(message[settings.REQUEST_DATA][settings.REQUEST_USERNAME])
-
-            elif message[settings.REQUEST_ACTION] == settings.ACTION_DEL_CONTACT:
-                if settings.REQUEST_DATA not in message:
-                    raise ValueError(settings.REQUEST_DATA)
-                if settings.REQUEST_USERNAME not in message[settings.REQUEST_DATA]:
-                    raise ValueError(settings.REQUEST_USERNAME)
-                return self._proc_del_contact(message[settings.REQUEST_DATA][settings.REQUEST_USERNAME])
-
-            raise ValueError
+            if not (handler := self.handlers.get(message[settings.REQUEST_ACTION])):
+                raise ValueError(settings.REQUEST_ACTION)
+            validate, process = handler
+            if invalid := validate(message):
+                raise ValueError(invalid)
+            return process(message.get(settings.REQUEST_DATA))
         except (OSError, ConnectionError, ConnectionAbortedError, ConnectionResetError):
-            self._lost_connection()
+            self._lost_connection(sock)
         except json.JSONDecodeError:
             return None
         except ValueError as e:
             return f'Неверный ответ сервера! {e}'
 
+    def _init_handlers(self):
+        """Обработчики сообщений сервера и проверки их полей по действию"""
+        handlers = {
+            settings.ACTION_RESPONSE: self._get_response,
+            settings.ACTION_PRESENCE: self._get_presence,
+            settings.ACTION_P2P_MESSAGE: self._get_p2p_message,
+            # ответ на resume читает _resume_session
+            settings.ACTION_RESUME: lambda data: None,
+            settings.ACTION_PING: self._send_pong,
+            settings.ACTION_OFFLINE_MESSAGES: self._get_offline_messages,
+            settings.ACTION_GET_USERS: self._get_users,
+            settings.ACTION_GET_CONTACTS: self._get_contacts,
+            settings.ACTION_ADD_CONTACT: lambda data: self._proc_add_contact(data[settings.REQUEST_USERNAME]),
+            settings.ACTION_DEL_CONTACT: lambda data: self._proc_del_contact(data[settings.REQUEST_USERNAME]),
+        }
+        return {action: (schemas.SERVER_MESSAGE_VALIDATORS[action], handler) for action, handler in handlers.items()}
+
+    def _get_presence(self, data):
+        # сервер, поддерживающий бинарный кодек и сжатие, сообщает выбранные в ответе на presence
+        negotiated = data or {}
+        self.codec = negotiated.get(settings.REQUEST_CODEC, self.codec)
+        self.compression = negotiated.get(settings.REQUEST_COMPRESSION, self.compression)
+        self.resume_token = negotiated.get(settings.REQUEST_TOKEN)
+        self.received_seq = 0
+        self._clear_status_message()
+        return f'{self.account_name} Online'
+
+    def _send_pong(self, data):
+        # ответ на проверку сервера не ждёт очереди отправки и не блокирует её
+        with self.send_lock:
+            self.send_message(self.sock, self._action_request(settings.ACTION_PONG), self.codec, self.compression)
+        return None
+
     def _action_request(self, action, data=None):
         return self.compose_action_request(action, data=data)
 
@@ -262,31 +285,50 @@ class MsgClient(TCPSocket, QObject):
         except (ValueError, json.JSONDecodeError):
             return 'Неизвестный статус ответа сервера!'
 
+    def _get_offline_messages(self, data):
+        senders = set()
+        for item in data[settings.REQUEST_MESSAGES]:
+            sender_username = item[settings.REQUEST_SENDER]
+            if sender_username not in senders and not self.db.get_user_by_name(sender_username):
+                self.db.add_users([sender_username])
+            senders.add(sender_username)
+            self.db.save_message(sender_username, self.account_name, item[settings.REQUEST_MESSAGE])
+        for sender_username in senders:
+            self._load_user_chat(sender_username, True)
+        return None
+
     def _get_users(self, data):
-        try:
-            if not (settings.REQUEST_USERS in data):
-                raise ValueError
-        except (ValueError, json.JSONDecodeError):
-            return 'Неизвестный статус ответа сервера!'
-        else:
+        # сервер отвечает страницей полного списка, разницей с известной клиенту версией или статусом 304
+        if settings.REQUEST_USERS in data:
             self.db.add_users(data[settings.REQUEST_USERS])
-            # if self.users_loaded_flag:
-            #     users = [user.username for user in self.db.get_users(self.account_name)]
-            #     self.load_data_signal.emit([None], sorted(users))
-            # self.users_loaded_flag = True
-            return None
+            # сохраняется версия первой страницы: изменения, сделанные во время загрузки, придут разницей
+            if self.users_sync_version is None:
+                self.users_sync_version = data[settings.REQUEST_VERSION]
+                self.users_sync_names = []
+            self.users_sync_names.extend(data[settings.REQUEST_USERS])
+            if cursor := data.get(settings.REQUEST_CURSOR):
+                self._users_request(cursor)
+                return None
+            version, self.users_sync_version = self.users_sync_version, None
+            # полный список приходит, когда разница недоступна: удаления в нём не передаются
+            self.db.keep_users(self.users_sync_names)
+            self.users_sync_names = []
+        else:
+            self.db.add_users(data.get(settings.REQUEST_ADDED, []))
+            self.db.del_users(data.get(settings.REQUEST_REMOVED, []))
+            version = data[settings.REQUEST_VERSION]
+        self.db.set_users_version(version)
+        # if self.users_loaded_flag:
+        #     users = [user.username for user in self.db.get_users(self.account_name)]
+        #     self.load_data_signal.emit([None], sorted(users))
+        # self.users_loaded_flag = True
+        return None
 
     def _get_contacts(self, data):
-        try:
-            if not (settings.REQUEST_CONTACTS in data):
-                raise ValueError
-        except (ValueError, json.JSONDecodeError):
-            return 'Неизвестный статус ответа сервера!'
-        else:
-            for contact in data[settings.REQUEST_CONTACTS]:
-                self.db.add_contact(contact)
-            self._update_window_contacts(data[settings.REQUEST_CONTACTS])
-            return None
+        for contact in data[settings.REQUEST_CONTACTS]:
+            self.db.add_contact(contact)
+        self._update_window_contacts(data[settings.REQUEST_CONTACTS])
+        return None
 
     def _update_window_contacts(self, contacts=None):
         if not contacts:
@@ -329,8 +371,14 @@ class MsgClient(TCPSocket, QObject):
             messages.append(item)
         self.fill_chat_signal.emit(username, messages, clear_field)
 
-    def _users_request(self):
-        request = self._action_request(settings.ACTION_GET_USERS)
+    def _users_request(self, cursor=None):
+        if cursor:
+            data = {settings.REQUEST_CURSOR: cursor}
+        elif (version := self.db.get_users_version()) is not None:
+            data = {settings.REQUEST_VERSION: version}
+        else:
+            data = None
+        request = self._action_request(settings.ACTION_GET_USERS, data=data)
         self.to_server_messages.append(request)
 
     def _contacts_request(self):
@@ -340,7 +388,41 @@ class MsgClient(TCPSocket, QObject):
     def _clear_status_message(self):
         self.status_message_signal.emit(self.account_name, False)
 
-    def _lost_connection(self):
+    def _resume_session(self, failed_sock):
+        """Переподключение после обрыва failed_sock; если его уже заменил другой поток, ничего не делается"""
+        with self.resume_lock:
+            if self.sock is not failed_sock:
+                return True
+            if not self.resume_token:
+                return False
+            for _ in range(settings.RESUME_ATTEMPTS):
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                try:
+                    sock.connect(self.server_address)
+                    self.send_message(sock, self._action_request(settings.ACTION_RESUME, data={
+                        settings.REQUEST_TOKEN: self.resume_token,
+                        settings.REQUEST_SEQ: self.received_seq
+                    }), self.codec, self.compression)
+                    response = self.get_message(sock)
+                except (OSError, ValueError):
+                    sock.close()
+                    time.sleep(settings.RESUME_DELAY)
+                    continue
+                if response.get(settings.REQUEST_ACTION) == settings.ACTION_RESUME and \
+                        response.get(settings.REQUEST_DATA, {}).get(settings.RESPONSE_STATUS) == 200:
+                    self.sock.close()
+                    self.sock = sock
+                    self.sending_wait_flag = None
+                    self.logger.info('Сессия с сервером возобновлена.')
+                    return True
+                sock.close()
+                break
+            self.resume_token = None
+            return False
+
+    def _lost_connection(self, failed_sock):
+        if self._resume_session(failed_sock):
+            return
         self.logger.error(f'Соединение с сервером было потеряно.')
         self.receiving_stop_flag = True
         self.lost_connection_signal.emit({})
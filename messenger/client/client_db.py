@@ -44,6 +44,15 @@ class ClientDB:
         def __init__(self, contact_user_id):
             self.contact_user_id = contact_user_id
 
+    class Directory(Base):
+        # версия списка пользователей сервера, с которой синхронизирована таблица users
+        __tablename__ = 'directory'
+        id = Column(Integer, primary_key=True)
+        version = Column(Integer)
+
+        def __init__(self, version):
+            self.version = version
+
     def __init__(self, db_path):
         uri = f'sqlite:///{db_path}'
         self.engine = create_engine(uri, echo=False, pool_recycle=7200,
@@ -77,11 +86,39 @@ class ClientDB:
             self.session.commit()
 
     def add_users(self, users_list):
+        # одна выборка на всю страницу имён вместо запроса на каждое имя
+        existing = {row.username for row in
+                    self.session.query(self.User.username).filter(self.User.username.in_(users_list))}
+        self.session.add_all([self.User(username) for username in dict.fromkeys(users_list)
+                              if username not in existing])
+        self.session.commit()
+
+    def del_users(self, users_list):
+        # пользователи, с которыми есть переписка, остаются ради истории сообщений
         for username in users_list:
             user = self.get_user_by_name(username)
             if not user:
-                user = self.User(username)
-                self.session.add(user)
+                continue
+            self.session.query(self.Contact).filter_by(contact_user_id=user.id).delete()
+            if not self.session.query(self.Message).filter(
+                    or_(self.Message.sender_id == user.id, self.Message.recipient_id == user.id)).count():
+                self.session.delete(user)
+        self.session.commit()
+
+    def keep_users(self, users_list):
+        # после загрузки полного списка удаляются пользователи, которых на сервере больше нет
+        usernames = set(users_list)
+        self.del_users([user.username for user in self.get_users() if user.username not in usernames])
+
+    def get_users_version(self):
+        directory = self.session.query(self.Directory).first()
+        return directory.version if directory else None
+
+    def set_users_version(self, version):
+        if directory := self.session.query(self.Directory).first():
+            directory.version = version
+        else:
+            self.session.add(self.Directory(version))
         self.session.commit()
 
     def save_message(self, sender_username, recipient_username, message):
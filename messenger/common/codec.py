@@ -0,0 +1,125 @@
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from . import settings
+
+CODEC_JSON = 'json'
+CODEC_MSGPACK = 'msgpack'
+COMPRESSION_ZLIB = 'zlib'
+
+# ключи и действия протокола, которые в бинарном кодеке передаются целыми числами.
+# Новые значения добавляются только в конец списков, иначе разойдутся коды у старых клиентов.
+_KEYS = [
+    settings.REQUEST_ACTION, settings.REQUEST_TIME, settings.REQUEST_USER, settings.REQUEST_DATA,
+    settings.REQUEST_ACCOUNT_NAME, settings.REQUEST_PASSWORD, settings.REQUEST_RECIPIENT, settings.REQUEST_SENDER,
+    settings.REQUEST_MESSAGE, settings.REQUEST_USERS, settings.REQUEST_CONTACTS, settings.REQUEST_USERNAME,
+    settings.REQUEST_STATUS, settings.RESPONSE_STATUS, settings.RESPONSE_MESSAGE, settings.RESPONSE_ERROR,
+    settings.REQUEST_CODEC, settings.REQUEST_CODECS, settings.REQUEST_COMPRESSION,
+    settings.REQUEST_ROOM, settings.REQUEST_MEMBERS, settings.REQUEST_MESSAGES, settings.REQUEST_TOKEN,
+    settings.REQUEST_SEQ, settings.REQUEST_VERSION, settings.REQUEST_ADDED, settings.REQUEST_REMOVED,
+    settings.REQUEST_CURSOR, settings.REQUEST_LIMIT,
+]
+_ACTIONS = [
+    settings.ACTION_PRESENCE, settings.ACTION_P2P_MESSAGE, settings.ACTION_RESPONSE, settings.ACTION_EXIT,
+    settings.ACTION_GET_USERS, settings.ACTION_GET_CONTACTS, settings.ACTION_ADD_CONTACT, settings.ACTION_DEL_CONTACT,
+    settings.ACTION_CREATE_ROOM, settings.ACTION_JOIN_ROOM, settings.ACTION_LEAVE_ROOM, settings.ACTION_ROOM_MESSAGE,
+    settings.ACTION_OFFLINE_MESSAGES, settings.ACTION_RESUME, settings.ACTION_PING, settings.ACTION_PONG,
+]
+
+KEY_CODES = {key: code for code, key in enumerate(dict.fromkeys(_KEYS))}
+KEY_NAMES = {code: key for key, code in KEY_CODES.items()}
+ACTION_CODES = {action: code for code, action in enumerate(_ACTIONS)}
+ACTION_NAMES = {code: action for action, code in ACTION_CODES.items()}
+_ACTION_CODE = KEY_CODES[settings.REQUEST_ACTION]
+
+# общий словарь zlib: типичные фрагменты JSON-сообщений протокола, помогает сжимать и короткие ответы
+ZLIB_DICT = ''.join(
+    [f'"{action}", ' for action in _ACTIONS] + [f'{{"{key}": ' for key in KEY_CODES]
+).encode(settings.ENCODING)
+
+
+def available_codecs():
+    """Кодеки, которые поддерживает эта сторона, в порядке предпочтения"""
+    return [CODEC_MSGPACK, CODEC_JSON] if msgpack else [CODEC_JSON]
+
+
+def choose_codec(client_codecs):
+    # список приходит от клиента, любое другое значение означает кодек по умолчанию
+    if not isinstance(client_codecs, (list, tuple)):
+        return CODEC_JSON
+    supported = available_codecs()
+    for codec in client_codecs:
+        if codec in supported:
+            return codec
+    return CODEC_JSON
+
+
+def available_compressions():
+    return [COMPRESSION_ZLIB]
+
+
+def choose_compression(client_compressions):
+    if isinstance(client_compressions, (list, tuple)) and COMPRESSION_ZLIB in client_compressions:
+        return COMPRESSION_ZLIB
+    return None
+
+
+def compress(payload):
+    compressor = zlib.compressobj(settings.COMPRESSION_LEVEL, zdict=ZLIB_DICT)
+    return compressor.compress(payload) + compressor.flush()
+
+
+def decompress(payload):
+    decompressor = zlib.decompressobj(zdict=ZLIB_DICT)
+    try:
+        data = decompressor.decompress(payload, settings.MAX_MESSAGE_LENGTH)
+    except zlib.error as e:
+        raise ValueError(e)
+    if decompressor.unconsumed_tail:
+        raise ValueError('Превышена длина сообщения после распаковки')
+    return data
+
+
+def encode(message, codec=CODEC_JSON):
+    if codec == CODEC_MSGPACK:
+        return msgpack.packb(_pack_keys(message, True))
+    return json.dumps(message).encode(settings.ENCODING)
+
+
+def decode(payload):
+    # JSON-объект всегда начинается с '{', map в msgpack - с 0x80-0x8f, 0xde или 0xdf
+    if payload[:1] == b'{' or not msgpack:
+        return json.loads(payload.decode(settings.ENCODING))
+    try:
+        return _unpack_keys(msgpack.unpackb(payload, strict_map_key=False), True)
+    except (msgpack.UnpackException, TypeError) as e:
+        raise ValueError(e)
+
+
+def _pack_keys(message, top_level=False):
+    packed = {}
+    for key, value in message.items():
+        if isinstance(value, dict):
+            value = _pack_keys(value)
+        packed[KEY_CODES.get(key, key)] = value
+    if top_level and (action := packed.get(_ACTION_CODE)) in ACTION_CODES:
+        packed[_ACTION_CODE] = ACTION_CODES[action]
+    return packed
+
+
+def _unpack_keys(message, top_level=False):
+    if not isinstance(message, dict):
+        raise ValueError
+    unpacked = {}
+    for key, value in message.items():
+        if isinstance(value, dict):
+            value = _unpack_keys(value)
+        unpacked[KEY_NAMES.get(key, key)] = value
+    if top_level and isinstance(action := unpacked.get(settings.REQUEST_ACTION), int):
+        unpacked[settings.REQUEST_ACTION] = ACTION_NAMES.get(action, action)
+    return unpacked
@@ -0,0 +1,101 @@
+"""Описания сообщений протокола по действиям и их проверка.
+
+Схема сообщения - словарь обязательных полей: значение поля задаёт тип (или кортеж типов),
+NAME - непустую строку, вложенный словарь - поле-словарь со своими обязательными полями.
+Схемы компилируются один раз при импорте модуля в функции проверки, которые возвращают
+имя первого неверного поля или None.
+"""
+from . import settings
+
+# непустая строка: имя пользователя, получателя, комнаты
+NAME = 'name'
+
+_MISSING = object()
+
+
+def compile_schema(schema):
+    checks = []
+    for key, rule in schema.items():
+        if isinstance(rule, dict):
+            checks.append((key, dict, False, compile_schema(rule)))
+        elif rule is NAME:
+            checks.append((key, str, True, None))
+        else:
+            checks.append((key, rule, False, None))
+    checks = tuple(checks)
+
+    def validate(message):
+        for key, types, required, nested in checks:
+            value = message.get(key, _MISSING)
+            if not isinstance(value, types) or (required and not value):
+                return key
+            if nested and (invalid := nested(value)):
+                return invalid
+        return None
+
+    return validate
+
+
+def compile_schemas(schemas):
+    return {action: compile_schema(schema) for action, schema in schemas.items()}
+
+
+def request_action(message):
+    """Действие запроса или None, если это не строка (список или словарь нельзя искать в таблице)"""
+    action = message.get(settings.REQUEST_ACTION)
+    return action if isinstance(action, str) else None
+
+
+# поля, обязательные в любом запросе клиента
+_REQUEST = {
+    settings.REQUEST_ACTION: str,
+    settings.REQUEST_TIME: (int, float),
+    settings.REQUEST_USER: {settings.REQUEST_ACCOUNT_NAME: NAME},
+}
+
+# запросы клиента серверу
+CLIENT_REQUESTS = {
+    settings.ACTION_PRESENCE: {
+        **_REQUEST,
+        settings.REQUEST_USER: {settings.REQUEST_ACCOUNT_NAME: NAME, settings.REQUEST_PASSWORD: NAME},
+    },
+    settings.ACTION_RESUME: {
+        **_REQUEST,
+        settings.REQUEST_DATA: {settings.REQUEST_TOKEN: str, settings.REQUEST_SEQ: int},
+    },
+    settings.ACTION_PING: _REQUEST,
+    settings.ACTION_PONG: _REQUEST,
+    settings.ACTION_EXIT: _REQUEST,
+    settings.ACTION_P2P_MESSAGE: {
+        **_REQUEST,
+        settings.REQUEST_DATA: {settings.REQUEST_RECIPIENT: NAME, settings.REQUEST_MESSAGE: str},
+    },
+    settings.ACTION_GET_USERS: _REQUEST,
+    settings.ACTION_GET_CONTACTS: _REQUEST,
+    settings.ACTION_ADD_CONTACT: {**_REQUEST, settings.REQUEST_DATA: {settings.REQUEST_USERNAME: NAME}},
+    settings.ACTION_DEL_CONTACT: {**_REQUEST, settings.REQUEST_DATA: {settings.REQUEST_USERNAME: NAME}},
+    settings.ACTION_CREATE_ROOM: {**_REQUEST, settings.REQUEST_DATA: {settings.REQUEST_ROOM: NAME}},
+    settings.ACTION_JOIN_ROOM: {**_REQUEST, settings.REQUEST_DATA: {settings.REQUEST_ROOM: NAME}},
+    settings.ACTION_LEAVE_ROOM: {**_REQUEST, settings.REQUEST_DATA: {settings.REQUEST_ROOM: NAME}},
+    settings.ACTION_ROOM_MESSAGE: {
+        **_REQUEST,
+        settings.REQUEST_DATA: {settings.REQUEST_ROOM: NAME, settings.REQUEST_MESSAGE: str},
+    },
+}
+
+# сообщения сервера клиенту
+SERVER_MESSAGES = {
+    settings.ACTION_RESPONSE: {settings.REQUEST_DATA: {settings.RESPONSE_STATUS: int}},
+    settings.ACTION_PRESENCE: {},
+    settings.ACTION_RESUME: {},
+    settings.ACTION_PING: {},
+    settings.ACTION_P2P_MESSAGE: {settings.REQUEST_DATA: dict},
+    settings.ACTION_OFFLINE_MESSAGES: {settings.REQUEST_DATA: {settings.REQUEST_MESSAGES: list}},
+    settings.ACTION_GET_USERS: {settings.REQUEST_DATA: {settings.REQUEST_VERSION: int}},
+    settings.ACTION_GET_CONTACTS: {settings.REQUEST_DATA: {settings.REQUEST_CONTACTS: list}},
+    settings.ACTION_ADD_CONTACT: {settings.REQUEST_DATA: {settings.REQUEST_USERNAME: NAME}},
+    settings.ACTION_DEL_CONTACT: {settings.REQUEST_DATA: {settings.REQUEST_USERNAME: NAME}},
+}
+
+CLIENT_REQUEST_VALIDATORS = compile_schemas(CLIENT_REQUESTS)
+SERVER_MESSAGE_VALIDATORS = compile_schemas(SERVER_MESSAGES)
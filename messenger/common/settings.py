@@ -6,20 +6,69 @@ DEFAULT_IP_ADDRESS = '127.0.0.1'
 # Порт по умолчанию
 DEFAULT_PORT = 7777
 
-# Максимальная длинна сообщения в байтах
-MAX_PACKAGE_LENGTH = 4096
+# Размер буфера чтения из сокета в байтах
+MAX_PACKAGE_LENGTH = 65536
+
+# Максимальная длинна сообщения (тела кадра) в байтах
+MAX_MESSAGE_LENGTH = 16 * 1024 * 1024
+
+# сжатие zlib применяется к телам сообщений не короче этого размера в байтах
+COMPRESSION_MIN_SIZE = 512
+COMPRESSION_LEVEL = 6
 
 # уровень логирования
 LOGGING_LEVEL = logging.INFO
 LOGGING_STREAM_COLORED = False
 SERVER_LOGGER_NAME = 'server'
 CLIENT_LOGGER_NAME = 'client'
+TRACE_LOGGER_NAME = 'server_trace'
 
 # кодировка
 ENCODING = 'utf-8'
 
 # Максимальная очередь подключений
-MAX_CONNECTIONS = 5
+MAX_CONNECTIONS = 1024
+
+# наибольшее число кадров, отправляемых клиенту одним системным вызовом
+MAX_WRITE_BATCH = 64
+
+# пределы исходящей очереди клиента в байтах и политика для медленного клиента:
+# pause, drop_oldest или disconnect (см. server.backpressure)
+OUTBOUND_HIGH_WATERMARK = 1024 * 1024
+OUTBOUND_LOW_WATERMARK = 256 * 1024
+SLOW_CONSUMER_POLICY = 'pause'
+
+# число сообщений в одном кадре при доставке накопленных офлайн сообщений
+OFFLINE_BATCH_SIZE = 100
+
+# попытки клиента возобновить сессию после обрыва соединения и пауза между ними в секундах
+RESUME_ATTEMPTS = 3
+RESUME_DELAY = 1
+
+# интервал в секундах, после которого сервер проверяет молчащего клиента сообщением ping,
+# и время без входящих данных, после которого подключение закрывается
+IDLE_PING_INTERVAL = 30
+IDLE_TIMEOUT = 90
+
+# как часто (сек) список пользователей в сети сохраняется в таблицу connections, 0 - не сохраняется
+PRESENCE_SNAPSHOT_INTERVAL = 0
+
+# порт HTTP метрик Prometheus (0 - выключен) и период сводки метрик в журнале (0 - не пишется)
+METRICS_PORT = 0
+STATS_INTERVAL = 0
+
+# доля трассируемых запросов (0 - трассировка выключена) и время обработки в секундах,
+# начиная с которого трасса пишется в журнал трасс
+TRACE_SAMPLE_RATE = 0
+TRACE_THRESHOLD = 0.05
+
+# наибольшее число имён в одной странице списка пользователей
+USERS_PAGE_SIZE = 500
+
+# сетевой движок сервера
+ENGINE_SELECTORS = 'selectors'
+ENGINE_ASYNCIO = 'asyncio'
+DEFAULT_ENGINE = ENGINE_SELECTORS
 
 # параметры действий клиента
 ACTION_PRESENCE = 'presence'
@@ -30,6 +79,14 @@ ACTION_GET_USERS = 'get_users'
 ACTION_GET_CONTACTS = 'get_contacts'
 ACTION_ADD_CONTACT = 'add_contact'
 ACTION_DEL_CONTACT = 'del_contact'
+ACTION_CREATE_ROOM = 'create_room'
+ACTION_JOIN_ROOM = 'join_room'
+ACTION_LEAVE_ROOM = 'leave_room'
+ACTION_ROOM_MESSAGE = 'room_message'
+ACTION_OFFLINE_MESSAGES = 'offline_messages'
+ACTION_RESUME = 'resume'
+ACTION_PING = 'ping'
+ACTION_PONG = 'pong'
 
 # параметры запроса
 REQUEST_ACTION = 'action'
@@ -45,6 +102,19 @@ REQUEST_USERS = 'users'
 REQUEST_CONTACTS = 'contacts'
 REQUEST_USERNAME = 'username'
 REQUEST_STATUS = 'status'
+REQUEST_CODECS = 'codecs'
+REQUEST_CODEC = 'codec'
+REQUEST_COMPRESSION = 'compression'
+REQUEST_ROOM = 'room'
+REQUEST_MEMBERS = 'members'
+REQUEST_MESSAGES = 'messages'
+REQUEST_TOKEN = 'token'
+REQUEST_SEQ = 'seq'
+REQUEST_VERSION = 'version'
+REQUEST_ADDED = 'added'
+REQUEST_REMOVED = 'removed'
+REQUEST_CURSOR = 'cursor'
+REQUEST_LIMIT = 'limit'
 
 # параметры ответа
 RESPONSE_STATUS = 'status'
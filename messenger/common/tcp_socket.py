@@ -1,11 +1,56 @@
 import binascii
 import hashlib
-import json
 import time
 import socket
-from .settings import MAX_PACKAGE_LENGTH, ENCODING, REQUEST_ACCOUNT_NAME, REQUEST_PASSWORD
+import struct
+from . import codec
+from .settings import MAX_PACKAGE_LENGTH, MAX_MESSAGE_LENGTH, COMPRESSION_MIN_SIZE, REQUEST_ACCOUNT_NAME, REQUEST_PASSWORD
 from .settings import REQUEST_ACTION, REQUEST_TIME, REQUEST_USER, REQUEST_DATA
 
+# заголовок кадра: длина тела сообщения в байтах, старший бит - признак сжатого тела
+FRAME_HEADER = struct.Struct('!I')
+FRAME_COMPRESSED = 0x80000000
+
+
+def frame_length(header):
+    length = header & ~FRAME_COMPRESSED
+    if length > MAX_MESSAGE_LENGTH:
+        raise ValueError(f'Превышена длина сообщения: {length}')
+    return length
+
+
+def frame_payload(header, payload):
+    if header & FRAME_COMPRESSED:
+        return codec.decompress(payload)
+    return payload
+
+
+class FrameDecoder:
+    """Потоковый декодер кадров одного подключения.
+
+    Накапливает прочитанные байты и возвращает тела всех полностью пришедших кадров,
+    остаток неполного кадра ждёт следующего чтения.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        payloads = []
+        offset = 0
+        while len(self.buffer) - offset >= FRAME_HEADER.size:
+            header, = FRAME_HEADER.unpack_from(self.buffer, offset)
+            length = frame_length(header)
+            end = offset + FRAME_HEADER.size + length
+            if end > len(self.buffer):
+                break
+            payloads.append(frame_payload(header, bytes(self.buffer[offset + FRAME_HEADER.size:end])))
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return payloads
+
 
 class TCPSocket:
     def __init__(self):
@@ -13,22 +58,48 @@ class TCPSocket:
 
     @staticmethod
     def get_message(sock: socket):
-        encoded_response = sock.recv(MAX_PACKAGE_LENGTH)
+        header, = FRAME_HEADER.unpack(TCPSocket._recv_exact(sock, FRAME_HEADER.size))
+        payload = TCPSocket._recv_exact(sock, frame_length(header))
+        return TCPSocket.decode_message(frame_payload(header, payload))
+
+    @staticmethod
+    def _recv_exact(sock: socket, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(min(size - len(data), MAX_PACKAGE_LENGTH))
+            if not isinstance(chunk, bytes):
+                raise ValueError
+            if not chunk:
+                raise ConnectionResetError('Соединение закрыто')
+            data += chunk
+        return bytes(data)
+
+    @staticmethod
+    def decode_message(encoded_response):
         if isinstance(encoded_response, bytes):
-            json_response = encoded_response.decode(ENCODING)
-            response = json.loads(json_response)
+            response = codec.decode(encoded_response)
             if isinstance(response, dict):
                 return response
             raise ValueError
         raise ValueError
 
     @staticmethod
-    def send_message(sock: socket, message: dict):
+    def send_message(sock: socket, message: dict, message_codec=codec.CODEC_JSON, compression=None):
+        sock.sendall(TCPSocket.encode_message(message, message_codec, compression))
+        return True
+
+    @staticmethod
+    def encode_message(message: dict, message_codec=codec.CODEC_JSON, compression=None):
         if not isinstance(message, dict):
             raise ValueError
-        js_message = json.dumps(message)
-        sock.send(js_message.encode(ENCODING))
-        return True
+        payload = codec.encode(message, message_codec)
+        flags = 0
+        # мелкие служебные сообщения не сжимаются, сжатое тело отправляется только если оно короче
+        if compression and len(payload) >= COMPRESSION_MIN_SIZE:
+            compressed = codec.compress(payload)
+            if len(compressed) < len(payload):
+                payload, flags = compressed, FRAME_COMPRESSED
+        return FRAME_HEADER.pack(len(payload) | flags) + payload
 
     def compose_action_request(self, action, user=None, data=None):
         request = {
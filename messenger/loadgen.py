@@ -0,0 +1,338 @@
+"""Нагрузочный генератор: тысячи имитированных клиентов мессенджера без Qt.
+
+Клиенты входят через presence, обмениваются p2p сообщениями с заданной частотой и по заданной
+схеме выбора получателей, в конце печатается пропускная способность и задержка доставки
+(p50/p99/p999) от отправки до получения сообщения другим клиентом.
+
+Запуск из каталога messenger:
+python loadgen.py 7777 127.0.0.1 -c 1000 -r 5 -d 30 --register
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+
+import common.settings as settings
+from common import codec
+from common.tcp_socket import TCPSocket, FRAME_HEADER, frame_length, frame_payload
+from server.metrics import Histogram
+
+# схемы выбора получателя: пары (0-1, 2-3, ...), случайный клиент, несколько «популярных» клиентов
+PATTERN_PAIRS = 'pairs'
+PATTERN_RANDOM = 'random'
+PATTERN_HOTSPOT = 'hotspot'
+PATTERNS = (PATTERN_PAIRS, PATTERN_RANDOM, PATTERN_HOTSPOT)
+
+# интервалы между сообщениями клиента: равные или экспоненциальные (пуассоновский поток)
+ARRIVAL_FIXED = 'fixed'
+ARRIVAL_POISSON = 'poisson'
+ARRIVALS = (ARRIVAL_FIXED, ARRIVAL_POISSON)
+
+# текст сообщения: loadgen:<time.monotonic_ns() отправки>:<заполнитель до --size символов>
+MESSAGE_PREFIX = 'loadgen'
+
+# сколько клиентов одновременно подключаются и входят
+CONNECT_CONCURRENCY = 200
+# после этого объёма неотправленных байт клиент ждёт, пока транспорт их отправит
+WRITE_BUFFER_LIMIT = 256 * 1024
+# сколько секунд после остановки отправки ждать доставки оставшихся сообщений
+DRAIN_TIMEOUT = 5
+
+# как и сервер, запускается из каталога messenger
+BASE_DIR = os.getcwd()
+CONFIG_FILE = f'{BASE_DIR}/server/server.ini'
+
+
+def choose_recipient(pattern, index, clients, hot=10):
+    """Номер получателя сообщения клиента index из clients"""
+    if pattern == PATTERN_PAIRS:
+        recipient = index ^ 1
+        return recipient if recipient < clients else 0
+    if pattern == PATTERN_HOTSPOT:
+        hot = max(min(hot, clients), 1)
+        recipient = random.randrange(hot)
+    else:
+        recipient = random.randrange(clients)
+    # себе сообщения не отправляются
+    return recipient if recipient != index else (recipient + 1) % clients
+
+
+def register_users(db_file, names, password):
+    """Заводит в базе сервера недостающих пользователей, хеши паролей считаются в пуле процессов"""
+    from server.server_db import ServerDB
+    db = ServerDB(db_file, clear_connections=False)
+    with ProcessPoolExecutor() as executor:
+        hashes = executor.map(TCPSocket.get_password_hash, names, [password] * len(names), chunksize=256)
+        return db.add_users(zip(names, hashes))
+
+
+def get_db_file():
+    config = ConfigParser()
+    config.read(CONFIG_FILE)
+    if 'SETTINGS' not in config:
+        return 'server.sqlite3'
+    return os.path.join(config['SETTINGS'].get('db_path', ''), config['SETTINGS'].get('db_file', 'server.sqlite3'))
+
+
+class LoadStats:
+    """Счётчики нагрузки и гистограммы задержки: за всё время и за последний интервал отчёта"""
+
+    def __init__(self):
+        self.logged_in = 0
+        self.login_errors = 0
+        self.sent = 0
+        self.acked = 0
+        self.received = 0
+        self.errors = 0
+        self.disconnected = 0
+        self.latency = Histogram()
+        self.interval_latency = Histogram()
+
+    def delivered(self, latency):
+        self.received += 1
+        self.latency.record(latency)
+        self.interval_latency.record(latency)
+
+
+class LoadClient:
+    """Имитированный клиент: вход через presence, p2p сообщения и ответы на ping сервера"""
+
+    def __init__(self, generator, index, account_name):
+        self.generator = generator
+        self.stats = generator.stats
+        self.index = index
+        self.account_name = account_name
+        self.user = {settings.REQUEST_ACCOUNT_NAME: account_name, settings.REQUEST_PASSWORD: generator.password}
+        self.codec = codec.CODEC_JSON
+        self.reader = None
+        self.writer = None
+
+    def _request(self, action, data=None):
+        request = {
+            settings.REQUEST_ACTION: action,
+            settings.REQUEST_TIME: time.time(),
+            settings.REQUEST_USER: self.user
+        }
+        if data:
+            request[settings.REQUEST_DATA] = data
+        return request
+
+    async def _read_message(self):
+        header, = FRAME_HEADER.unpack(await self.reader.readexactly(FRAME_HEADER.size))
+        payload = await self.reader.readexactly(frame_length(header))
+        return TCPSocket.decode_message(frame_payload(header, payload))
+
+    def _send(self, message):
+        self.writer.write(TCPSocket.encode_message(message, self.codec))
+
+    async def login(self):
+        self.reader, self.writer = await asyncio.open_connection(self.generator.address, self.generator.port)
+        self._send(self._request(settings.ACTION_PRESENCE, data={settings.REQUEST_CODECS: [self.generator.codec]}))
+        response = await self._read_message()
+        data = response.get(settings.REQUEST_DATA) or {}
+        if response.get(settings.REQUEST_ACTION) != settings.ACTION_PRESENCE:
+            raise ConnectionError(data.get(settings.RESPONSE_MESSAGE, response))
+        self.codec = data.get(settings.REQUEST_CODEC, self.codec)
+
+    async def read_loop(self):
+        try:
+            while True:
+                self._process(await self._read_message())
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            if not self.generator.stopping:
+                self.stats.disconnected += 1
+
+    def _process(self, message):
+        action = message.get(settings.REQUEST_ACTION)
+        data = message.get(settings.REQUEST_DATA) or {}
+        if action == settings.ACTION_PING:
+            self._send(self._request(settings.ACTION_PONG))
+        elif action == settings.ACTION_P2P_MESSAGE:
+            if settings.REQUEST_SENDER in data:
+                text = data.get(settings.REQUEST_MESSAGE, '')
+                prefix, sent_at, _ = text.split(':', 2) if text.count(':') >= 2 else ('', '', '')
+                if prefix == MESSAGE_PREFIX and sent_at.isdigit():
+                    self.stats.delivered((time.monotonic_ns() - int(sent_at)) / 1e9)
+            elif data.get(settings.REQUEST_STATUS) == 200:
+                self.stats.acked += 1
+            else:
+                self.stats.errors += 1
+        elif action == settings.ACTION_RESPONSE and data.get(settings.RESPONSE_STATUS, 200) >= 400:
+            self.stats.errors += 1
+
+    async def send_loop(self):
+        generator = self.generator
+        interval = 1 / generator.rate
+        # случайная фаза, чтобы клиенты не отправляли сообщения одновременно
+        await asyncio.sleep(random.uniform(0, interval))
+        while not generator.stopping and not self.writer.is_closing():
+            recipient = generator.names[choose_recipient(generator.pattern, self.index, len(generator.names),
+                                                         generator.hot)]
+            self._send(self._request(settings.ACTION_P2P_MESSAGE, data={
+                settings.REQUEST_RECIPIENT: recipient,
+                settings.REQUEST_MESSAGE: f'{MESSAGE_PREFIX}:{time.monotonic_ns()}:{generator.padding}'
+            }))
+            self.stats.sent += 1
+            if self.writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                await self.writer.drain()
+            await asyncio.sleep(random.expovariate(generator.rate) if generator.arrival == ARRIVAL_POISSON
+                                else interval)
+
+    async def close(self):
+        if self.writer and not self.writer.is_closing():
+            # явный выход: сервер не держит сессию для возобновления
+            self._send(self._request(settings.ACTION_EXIT))
+            self.writer.close()
+
+
+class LoadGenerator:
+    def __init__(self, address, port, names, password, rate, duration, pattern=PATTERN_PAIRS,
+                 arrival=ARRIVAL_FIXED, hot=10, size=32, message_codec=codec.CODEC_JSON, report=5):
+        self.address = address
+        self.port = port
+        self.names = names
+        self.password = password
+        self.rate = rate
+        self.duration = duration
+        self.pattern = pattern
+        self.arrival = arrival
+        self.hot = hot
+        # 21 - два разделителя и 19 цифр отметки времени
+        self.padding = 'x' * max(size - len(MESSAGE_PREFIX) - 21, 0)
+        self.codec = message_codec
+        self.report = report
+        self.stats = LoadStats()
+        self.stopping = False
+        self.clients = []
+
+    async def run(self):
+        started = time.monotonic()
+        await self._login_all()
+        print(f'Вошли {self.stats.logged_in} из {len(self.names)} клиентов за {time.monotonic() - started:.1f} с, '
+              f'ошибок входа {self.stats.login_errors}')
+        if not self.clients:
+            return
+
+        readers = [asyncio.create_task(client.read_loop()) for client in self.clients]
+        senders = [asyncio.create_task(client.send_loop()) for client in self.clients]
+        reporter = asyncio.create_task(self._report_loop())
+        started = time.monotonic()
+        await asyncio.sleep(self.duration)
+        self.stopping = True
+        elapsed = time.monotonic() - started
+        await asyncio.gather(*senders, return_exceptions=True)
+
+        # доставка уже отправленных сообщений
+        drain_until = time.monotonic() + DRAIN_TIMEOUT
+        while self.stats.received < self.stats.sent and time.monotonic() < drain_until:
+            await asyncio.sleep(0.05)
+        reporter.cancel()
+        for client in self.clients:
+            await client.close()
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        self._print_summary(elapsed)
+
+    async def _login_all(self):
+        semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+        async def login(client):
+            async with semaphore:
+                try:
+                    await client.login()
+                except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError) as e:
+                    self.stats.login_errors += 1
+                    if self.stats.login_errors <= 3:
+                        print(f'Ошибка входа {client.account_name}: {e}')
+                    await client.close()
+                    return
+                self.stats.logged_in += 1
+                self.clients.append(client)
+
+        await asyncio.gather(*[login(LoadClient(self, index, name)) for index, name in enumerate(self.names)])
+        # порядок важен для схемы пар: номер клиента - его позиция в списке имён
+        self.clients.sort(key=lambda client: client.index)
+
+    async def _report_loop(self):
+        started = last_time = time.monotonic()
+        last_sent = last_received = 0
+        while True:
+            await asyncio.sleep(self.report)
+            now = time.monotonic()
+            stats, elapsed = self.stats, now - last_time
+            latency, stats.interval_latency = stats.interval_latency, Histogram()
+            print(f'{now - started:5.0f} с: отправлено {(stats.sent - last_sent) / elapsed:.0f}/с, '
+                  f'доставлено {(stats.received - last_received) / elapsed:.0f}/с, '
+                  f'p50 {latency.percentile(0.5) * 1000:.2f} мс, p99 {latency.percentile(0.99) * 1000:.2f} мс, '
+                  f'ошибок {stats.errors}, обрывов {stats.disconnected}')
+            last_time, last_sent, last_received = now, stats.sent, stats.received
+
+    def _print_summary(self, elapsed):
+        stats = self.stats
+        latency = stats.latency
+        print(f'Клиентов {len(self.clients)}, схема {self.pattern}, {self.rate} сообщ/с на клиента, {elapsed:.1f} с')
+        print(f'Отправлено {stats.sent} ({stats.sent / elapsed:.0f}/с), доставлено {stats.received} '
+              f'({stats.received / elapsed:.0f}/с), подтверждено {stats.acked}, не доставлено '
+              f'{stats.sent - stats.received}, ошибок {stats.errors}, обрывов {stats.disconnected}')
+        print(f'Задержка доставки, мс: p50 {latency.percentile(0.5) * 1000:.3f}, '
+              f'p99 {latency.percentile(0.99) * 1000:.3f}, p999 {latency.percentile(0.999) * 1000:.3f}, '
+              f'max {latency.max * 1000:.3f}')
+
+
+def raise_open_files_limit(clients):
+    # каждому клиенту нужен дескриптор сокета
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = clients + 100
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted if hard == resource.RLIM_INFINITY else min(wanted, hard), hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный генератор мессенджера')
+    parser.add_argument('port', default=settings.DEFAULT_PORT, type=int, nargs='?')
+    parser.add_argument('address', default=settings.DEFAULT_IP_ADDRESS, nargs='?')
+    parser.add_argument('-c', '--clients', default=100, type=int, help='число клиентов')
+    parser.add_argument('-r', '--rate', default=1.0, type=float, help='сообщений в секунду от одного клиента')
+    parser.add_argument('-d', '--duration', default=10.0, type=float, help='длительность нагрузки в секундах')
+    parser.add_argument('--pattern', default=PATTERN_PAIRS, choices=PATTERNS, help='выбор получателя')
+    parser.add_argument('--arrival', default=ARRIVAL_FIXED, choices=ARRIVALS, help='интервалы между сообщениями')
+    parser.add_argument('--hot', default=10, type=int, help='число получателей для схемы hotspot')
+    parser.add_argument('--size', default=32, type=int, help='длина текста сообщения')
+    parser.add_argument('--codec', default=codec.CODEC_JSON, choices=codec.available_codecs())
+    parser.add_argument('--prefix', default='load', help='префикс имён пользователей: load0, load1, ...')
+    parser.add_argument('--password', default='123456')
+    parser.add_argument('--report', default=5.0, type=float, help='период промежуточного отчёта в секундах')
+    parser.add_argument('--register', action='store_true', help='завести недостающих пользователей в базе сервера')
+    parser.add_argument('--db', default=None, help='файл базы сервера (по умолчанию из server/server.ini)')
+    namespace = parser.parse_args()
+
+    if namespace.clients < 2 or namespace.rate <= 0:
+        parser.error('нужно не меньше 2 клиентов и положительная частота сообщений')
+    names = [f'{namespace.prefix}{index}' for index in range(namespace.clients)]
+    if namespace.register:
+        db_file = namespace.db or get_db_file()
+        started = time.monotonic()
+        added = register_users(db_file, names, namespace.password)
+        print(f'Добавлено пользователей: {added} ({db_file}, {time.monotonic() - started:.1f} с)')
+
+    raise_open_files_limit(namespace.clients)
+    generator = LoadGenerator(namespace.address, namespace.port, names, namespace.password, namespace.rate,
+                              namespace.duration, namespace.pattern, namespace.arrival, namespace.hot,
+                              namespace.size, namespace.codec, namespace.report)
+    try:
+        asyncio.run(generator.run())
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,8 @@ import os
 import logging
 import logging.handlers
 sys.path.append(os.path.join(os.getcwd(), '../..'))
-from common.settings import LOGGING_LEVEL, LOGGING_STREAM_COLORED, SERVER_LOGGER_NAME, CLIENT_LOGGER_NAME
+from common.settings import LOGGING_LEVEL, LOGGING_STREAM_COLORED, SERVER_LOGGER_NAME, CLIENT_LOGGER_NAME, \
+    TRACE_LOGGER_NAME
 from logs.settings.colored_formatter import ColoredFormatter
 
 
@@ -11,7 +12,10 @@ class SocketLogger:
     FILE_FORMATTER = {
         SERVER_LOGGER_NAME: '%(asctime)s %(levelname)s %(filename)s %(message)s (%(filename)s:%(lineno)d)',
         CLIENT_LOGGER_NAME: '%(asctime)s %(levelname)s %(filename)s %(message)s',
+        TRACE_LOGGER_NAME: '%(asctime)s %(process)d %(message)s',
     }
+    # журналы, которые пишутся только в файл
+    FILE_ONLY = (TRACE_LOGGER_NAME,)
 
     def __init__(self, logger_name):
         if not (logger_name in self.FILE_FORMATTER):
@@ -28,10 +32,15 @@ class SocketLogger:
                                                              interval=1, when='midnight')
         log_file.setFormatter(logging.Formatter(self.FILE_FORMATTER[logger_name]))
 
-        # создаём регистратор и настраиваем его
+        # создаём регистратор и настраиваем его (повторно не добавляем обработчики,
+        # например, в процессах-воркерах сервера)
         self.logger = logging.getLogger(logger_name)
-        self.logger.addHandler(stream_handler)
-        self.logger.addHandler(log_file)
+        if not self.logger.handlers:
+            if logger_name not in self.FILE_ONLY:
+                self.logger.addHandler(stream_handler)
+            self.logger.addHandler(log_file)
+        else:
+            log_file.close()
         self.logger.setLevel(LOGGING_LEVEL)
 
 
@@ -1,64 +1,142 @@
-import json
 import os
+import signal
 import socket
 import sys
-import select
 import argparse
 import threading
+import time
+import multiprocessing
+from datetime import datetime
 
-from PyQt5.QtCore import QTimer
-from PyQt5.QtWidgets import QApplication, QMessageBox
 from configparser import ConfigParser
 import common.settings as settings
+from common import codec, schemas
 from common.tcp_socket import TCPSocket
 from common.meta import ServerVerifier
 from common.descriptors import Port, Address
-from server.qt.config_window import ConfigWindow
-from server.qt.history_window import HistoryWindow
-from server.qt.main_window import MainWindow
-from server.qt.users_window import UsersWindow
 from logs.settings.socket_logger import SocketLogger
 from server.server_db import ServerDB
+from server.async_engine import AsyncEngine
+from server.selector_engine import SelectorEngine
+from server.connections import ConnectionRegistry
+from server.workers import PresenceRouter, WorkerLink, get_router_path
+from server.auth import PasswordHasher
+from server.backpressure import SlowConsumerLimiter
+from server.rooms import RoomRegistry
+from server.sessions import SessionStore
+from server.timer_wheel import TimerWheel
+from server.directory import UserDirectory
+from server.presence import PresenceRegistry
+from server.metrics import Metrics, MetricsServer
+from server.tracing import Tracer, STAGE_DB, OUTCOME_CLOSED
+from server import control
 # from logs.settings.log_decorator import LogDecorator
 
 BASE_DIR = os.getcwd()
 CONFIG_FILE = f'{BASE_DIR}/server/server.ini'
 
+ENGINES = {
+    settings.ENGINE_SELECTORS: SelectorEngine,
+    settings.ENGINE_ASYNCIO: AsyncEngine,
+}
+
 
 class MsgServer(TCPSocket, metaclass=ServerVerifier):
     port = Port()
     address = Address()
 
-    def __init__(self):
+    def __init__(self, worker_id=None):
         super().__init__()
         socket_logger = SocketLogger(settings.SERVER_LOGGER_NAME)
         self.logger = socket_logger.logger
 
-        self.clients = []
-        self.messages = []
-        self.names = {}
+        self.connections = ConnectionRegistry()
+        self.worker_id = worker_id
+        self.workers = 1
+        self.router_link = None
+        self.presence_router = None
+        self.worker_processes = []
+        self.engine = None
+        self.password_hasher = None
+        self.current_sender = None
+        self.handlers = self._init_handlers()
 
         self.config = ConfigParser()
         self._load_config()
 
+        self.metrics = Metrics()
+        self.metrics_server = None
+        self.metrics_port = self.config['SETTINGS'].getint('metrics_port', settings.METRICS_PORT)
+        self.stats_interval = self.config['SETTINGS'].getfloat('stats_interval', settings.STATS_INTERVAL)
+        self.trace_sample_rate = self.config['SETTINGS'].getfloat('trace_sample_rate', settings.TRACE_SAMPLE_RATE)
+        self.trace_threshold = self.config['SETTINGS'].getfloat('trace_threshold', settings.TRACE_THRESHOLD)
+        # журнал трасс открывается в create_engine, только если трассировка включена
+        self.tracer = Tracer(None)
+        self.current_trace = None
         self.db = ServerDB(os.path.join(self.config['SETTINGS']['db_path'],
-                                        self.config['SETTINGS']['db_file']))
+                                        self.config['SETTINGS']['db_file']),
+                           clear_connections=worker_id is None, metrics=self.metrics)
+        self.rooms = RoomRegistry(self.db.get_rooms())
+        self.directory = UserDirectory(self.db)
+        # снимок пользователей в сети пишет в таблицу connections только процесс с полным списком
+        self.presence = PresenceRegistry(
+            self.db.save_connections if worker_id is None else None,
+            self.config['SETTINGS'].getfloat('presence_snapshot_interval', settings.PRESENCE_SNAPSHOT_INTERVAL)
+        )
+        self.sessions = SessionStore()
+        self.ping_interval = self.config['SETTINGS'].getfloat('ping_interval', settings.IDLE_PING_INTERVAL)
+        self.idle_timeout = self.config['SETTINGS'].getfloat('idle_timeout', settings.IDLE_TIMEOUT)
+        self.idle_timers = TimerWheel()
+        self.limiter = SlowConsumerLimiter(
+            self._disconnect_slow_consumer,
+            self.config['SETTINGS'].getint('high_watermark', settings.OUTBOUND_HIGH_WATERMARK),
+            self.config['SETTINGS'].getint('low_watermark', settings.OUTBOUND_LOW_WATERMARK),
+            self.config['SETTINGS'].get('slow_consumer_policy', settings.SLOW_CONSUMER_POLICY)
+        )
 
-        self.new_connection = False
-        self.lock_flag = threading.Lock()
+        # вызывается из сетевого потока при входе и выходе пользователя, окно администратора
+        # подписывается на эти события вместо опроса таблицы подключений
+        self.connection_listener = None
         self.main_window = None
+        self.headless = False
+        self.control_server = None
 
     @classmethod
     def bind_from_args(cls):
         parser = argparse.ArgumentParser()
-        parser.add_argument('-p', default=settings.DEFAULT_PORT, type=int, nargs='?')
-        parser.add_argument('-a', default=settings.DEFAULT_IP_ADDRESS, nargs='?')
+        parser.add_argument('-p', default=None, type=int, nargs='?')
+        parser.add_argument('-a', default=None, nargs='?')
+        parser.add_argument('-e', '--engine', default=None,
+                            choices=list(ENGINES))
+        parser.add_argument('-w', '--workers', default=1, type=int)
+        parser.add_argument('--headless', action='store_true',
+                            help='без окна администратора, управление через python -m server.control')
+        parser.add_argument('--metrics-port', default=None, type=int,
+                            help='порт HTTP метрик Prometheus на 127.0.0.1, воркеры слушают следующие порты')
+        parser.add_argument('--stats-interval', default=None, type=float,
+                            help='период (сек) записи сводки метрик в журнал')
+        parser.add_argument('--trace-sample-rate', default=None, type=float,
+                            help='доля трассируемых запросов от 0 до 1')
+        parser.add_argument('--trace-threshold', default=None, type=float,
+                            help='время обработки (сек), начиная с которого трасса пишется в журнал')
         namespace = parser.parse_args(sys.argv[1:])
         address = namespace.a
         port = namespace.p
 
         sock = cls()
-        sock.bind(address, port)
+        if namespace.engine:
+            sock.config['SETTINGS']['engine'] = namespace.engine
+        sock.workers = max(namespace.workers, 1)
+        sock.headless = namespace.headless
+        if namespace.metrics_port is not None:
+            sock.metrics_port = namespace.metrics_port
+        if namespace.stats_interval is not None:
+            sock.stats_interval = namespace.stats_interval
+        if namespace.trace_sample_rate is not None:
+            sock.trace_sample_rate = namespace.trace_sample_rate
+        if namespace.trace_threshold is not None:
+            sock.trace_threshold = namespace.trace_threshold
+        sock.bind(address, port, reuse_port=sock.workers > 1)
         return sock
 
     @classmethod
@@ -68,7 +146,7 @@ class MsgServer(TCPSocket, metaclass=ServerVerifier):
         return sock
 
     # @LogDecorator(settings.SERVER_LOGGER_NAME)
-    def bind(self, address=None, port=None):
+    def bind(self, address=None, port=None, reuse_port=False):
         if not address:
             address = self.config['SETTINGS']['listen_address']
             if not address:
@@ -82,32 +160,158 @@ class MsgServer(TCPSocket, metaclass=ServerVerifier):
             sys.exit(1)
         self.address = address
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                self.logger.critical('Режим воркеров не поддерживается: нет SO_REUSEPORT')
+                sys.exit(1)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind((self.address, self.port))
-        self.sock.settimeout(1)
         self.logger.info(f'Сервер запушен на {address}:{port}')
 
     def mainloop(self):
-
-        client_listener = threading.Thread(target=self._start_listen)
-        client_listener.daemon = True
-        client_listener.start()
+        if self.headless:
+            self._run_headless()
+            return
+        if self.workers > 1:
+            self._start_workers()
+        else:
+            client_listener = threading.Thread(target=self.create_engine().run)
+            client_listener.daemon = True
+            client_listener.start()
 
         self._show_main_window()
 
+    def create_engine(self):
+        engine_name = self.config['SETTINGS'].get('engine', settings.DEFAULT_ENGINE)
+        self.engine = ENGINES.get(engine_name, ENGINES[settings.DEFAULT_ENGINE])(self)
+        self.password_hasher = PasswordHasher(self.engine.call_soon_threadsafe)
+        self.engine.call_every(self.idle_timers.tick, self.idle_timers.advance)
+        self._init_metrics()
+        if self.trace_sample_rate > 0:
+            self.tracer = Tracer(SocketLogger(settings.TRACE_LOGGER_NAME).logger,
+                                 self.trace_sample_rate, self.trace_threshold)
+            self.logger.info(f'Трассировка запросов: доля {self.trace_sample_rate}, порог {self.trace_threshold} с')
+        return self.engine
+
+    def _init_metrics(self):
+        self.metrics.gauge('connections_open', lambda: len(self.connections))
+        self.metrics.gauge('users_online', lambda: len(self.presence))
+        self.metrics.gauge('queued_frames', lambda: sum(el.queue_depth for el in self.connections))
+        self.metrics.gauge('queued_bytes', lambda: sum(el.queued_bytes for el in self.connections))
+        self.metrics.gauge('max_queued_bytes', lambda: max((el.queued_bytes for el in self.connections), default=0))
+        self.metrics.gauge('slow_consumer_events', lambda: dict(self.limiter.counters))
+        if self.stats_interval > 0:
+            self.engine.call_every(self.stats_interval, self._log_stats)
+        if self.metrics_port:
+            # у каждого воркера свой реестр, он слушает порт metrics_port + 1 + номер воркера
+            port = self.metrics_port if self.worker_id is None else self.metrics_port + 1 + self.worker_id
+            try:
+                self.metrics_server = MetricsServer(self.metrics, port)
+            except OSError as e:
+                self.logger.error(f'Не удалось открыть порт метрик {port}: {e}')
+                return
+            self.metrics_server.start()
+            self.logger.info(f'Метрики: http://127.0.0.1:{port}/metrics')
+
+    def _log_stats(self):
+        for line in self.metrics.summary():
+            self.logger.info(f'Статистика: {line}')
+
+    def _start_workers(self):
+        # слушают воркеры, мастер держит маршрутизатор и окно администратора
+        self.sock.close()
+        self.presence_router = PresenceRouter(get_router_path(self.port), self.logger, self._on_remote_presence)
+        self.presence_router.start()
+        for worker_id in range(self.workers):
+            worker = multiprocessing.Process(target=run_worker, args=(
+                worker_id, self.presence_router.path, self.address, self.port,
+                self.config['SETTINGS'].get('engine', settings.DEFAULT_ENGINE), self.metrics_port, self.stats_interval,
+                self.trace_sample_rate, self.trace_threshold))
+            # не daemon: воркеру нужен собственный пул процессов для хеширования паролей
+            worker.start()
+            self.worker_processes.append(worker)
+        self.logger.info(f'Запущено воркеров: {self.workers}')
+
+    def _stop_workers(self):
+        for worker in self.worker_processes:
+            worker.terminate()
+        for worker in self.worker_processes:
+            worker.join()
+
+    def _on_remote_presence(self, account_name, online, address=None):
+        self._notify_connection(account_name, address if online else None)
+
+    def _notify_connection(self, account_name, address=None, connected_at=None):
+        if address:
+            self.presence.set_online(account_name, address, connected_at)
+        else:
+            self.presence.set_offline(account_name)
+        if not self.connection_listener:
+            return
+        connection = None
+        if address:
+            connection = self._connection_row(account_name, address[0], address[1], connected_at or time.time())
+        self.connection_listener(account_name, connection)
+
+    @staticmethod
+    def _connection_row(account_name, ip, port, connected_at):
+        return {
+            'username': account_name,
+            'time': datetime.fromtimestamp(connected_at).strftime('%H:%M %d.%m.%Y'),
+            'ip': ip,
+            'port': f'{port}',
+        }
+
+    def _run_headless(self):
+        # PyQt5 не импортируется: окна администратора подключаются только в _show_main_window
+        self.control_server = control.ControlServer(control.get_control_path(self.port), self.logger, {
+            control.CONTROL_ADD_USER: self._add_user,
+            control.CONTROL_DEL_USER: self._del_user,
+            control.CONTROL_USERS: self._get_del_users_list,
+            control.CONTROL_CONNECTIONS: self._get_connections_data,
+            control.CONTROL_STATS: self._get_history_data,
+        })
+        self.control_server.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            if self.workers > 1:
+                self._start_workers()
+                for worker in self.worker_processes:
+                    worker.join()
+            else:
+                self.create_engine().run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.control_server.stop()
+            self._stop_workers()
+            if self.password_hasher:
+                self.password_hasher.shutdown()
+            self.db.close_stats()
+
     def _show_main_window(self):
+        from PyQt5.QtWidgets import QApplication
+        from server.qt.main_window import MainWindow
+        from server.qt.connections_model import ConnectionEvents
+
         server_app = QApplication(sys.argv)
 
         self.main_window = MainWindow(self._show_history_window, self._show_config_window, self._show_users_window)
         self.main_window.show_status_message(f'Сервер запущен на {self.address}:{self.port}')
-        self._update_connections()
-
-        timer = QTimer()
-        timer.timeout.connect(self._update_connections)
-        timer.start(1000)
+        events = ConnectionEvents()
+        events.connected.connect(self.main_window.connections_model.add)
+        events.disconnected.connect(self.main_window.connections_model.remove)
+        # подписка до начального заполнения: повторное событие о том же пользователе только обновит строку
+        self.connection_listener = events.notify
+        self.main_window.fill_table(self._get_connections_data())
 
         server_app.exec_()
+        self.connection_listener = None
+        self._stop_workers()
+        self.db.close_stats()
 
     def _get_history_data(self):
+        self.db.flush_stats()
         return [{
             'username': el.username,
             'sent': f'{el.sent}',
@@ -116,9 +320,11 @@ class MsgServer(TCPSocket, metaclass=ServerVerifier):
         } for el in self.db.get_users()]
 
     def _show_history_window(self):
+        from server.qt.history_window import HistoryWindow
         HistoryWindow(self._get_history_data)
 
     def _show_users_window(self):
+        from server.qt.users_window import UsersWindow
         self.users_window = UsersWindow(self._add_user, self._del_user, self._get_del_users_list)
 
     def _get_del_users_list(self):
@@ -129,12 +335,32 @@ class MsgServer(TCPSocket, metaclass=ServerVerifier):
             return f'Пользователь {username} уже существует!'
         password_hash = self.get_password_hash(username, password)
         self.db.add_user(username, password_hash)
+        self._directory_changed()
         return True
 
     def _del_user(self, username):
-        return self.db.del_user(username)
+        if result := self.db.del_user(username):
+            self._directory_changed(username)
+        return result
+
+    def _directory_changed(self, deleted=None):
+        # список меняет окно администратора в своём потоке, кеш ответов сбрасывается в потоке сервера
+        if self.presence_router:
+            self.presence_router.directory_changed(deleted)
+        elif self.engine:
+            self.engine.call_soon_threadsafe(self._reload_directory, deleted)
+        else:
+            self._reload_directory(deleted)
+
+    def _reload_directory(self, deleted=None):
+        self.directory.reload()
+        # участие в комнатах удалено из базы, имя не должно остаться и в памяти: иначе новый
+        # пользователь с тем же именем получал бы сообщения этих комнат
+        if deleted:
+            self.rooms.remove_user(deleted)
 
     def _show_config_window(self):
+        from server.qt.config_window import ConfigWindow
         self.config_window = ConfigWindow(os.path.realpath(
             self.config['SETTINGS']['db_path']),
             self.config['SETTINGS']['db_file'],
@@ -144,6 +370,7 @@ class MsgServer(TCPSocket, metaclass=ServerVerifier):
         )
 
     def _save_config(self):
+        from PyQt5.QtWidgets import QMessageBox
         message = QMessageBox()
         self.config['SETTINGS']['db_path'] = self.config_window.db_path.text()
         self.config['SETTINGS']['Database_file'] = self.config_window.db_file.text()
@@ -161,182 +388,301 @@ class MsgServer(TCPSocket, metaclass=ServerVerifier):
                 self.config.write(conf)
                 message.information(self.config_window, 'OK', 'Настройки успешно сохранены!')
 
-    def _update_connections(self):
-        if self.new_connection:
-            connections = [{
-                'username': el.user.username,
-                'ip': el.ip,
-                'port': f'{el.port}',
-                'time': f'{el.ru_dt}',
-            } for el in self.db.get_connections()]
-            self.main_window.fill_table(connections)
-            with self.lock_flag:
-                self.new_connection = False
-
-    def _start_listen(self):
-        self.sock.listen(settings.MAX_CONNECTIONS)
-        self.logger.info(f'Слушаем запросы от клиента...')
-
-        try:
-            while True:
-                try:
-                    client_socket, client_address = self.sock.accept()
-                except OSError:
-                    pass
-                else:
-                    self.clients.append(client_socket)
-
-                sender_list = []
-                recipient_list = []
-                try:
-                    if self.clients:
-                        sender_list, recipient_list, _ = select.select(self.clients, self.clients, [], 0)
-                except OSError:
-                    pass
-
-                if sender_list:
-                    for client_socket in sender_list:
-                        try:
-                            message = self.get_message(client_socket)
-                        except (ConnectionResetError, ConnectionError, ConnectionAbortedError):
-                            self._close_client_socket(client_socket)
-                        except json.JSONDecodeError:
-                            self.logger.error(f'Неверный запрос от клиента: {client_socket}')
-                            self._close_client_socket(client_socket)
-                        else:
-                            self._process_message_from_client(client_socket, message)
-
-                while self.messages:
-                    message_tuple = self.messages.pop(0)
-                    try:
-                        self._process_message_to_client(message_tuple, recipient_list)
-                    except (ConnectionResetError, ConnectionError, ConnectionAbortedError):
-                        self._close_client_socket(message_tuple[0])
-
-        except KeyboardInterrupt:
-            self._close()
+    def _get_connections_data(self):
+        return [self._connection_row(account_name, ip, port, connected_at)
+                for account_name, (ip, port, connected_at) in self.presence.items()]
 
     def _close(self):
         self.sock.close()
+        self.db.close_stats()
         self.logger.info('Завершение работы сервера.')
         sys.exit(0)
 
     def _get_socket_by_name(self, account_name):
-        if account_name not in self.names:
+        if not (connection := self.connections.get_by_name(account_name)):
             self.logger.error(f'Пользователь {account_name} не найден!')
-            return None
-        return self.names[account_name]
+        return connection
+
+    def _add_client_socket(self, client_socket):
+        self.metrics.inc('connections_accepted')
+        self.connections.add(client_socket)
+        self.idle_timers.schedule(client_socket, self.ping_interval, self._check_idle)
+
+    def _check_idle(self, client_socket):
+        """Проверка молчащего подключения: ping после ping_interval, отключение после idle_timeout.
 
-    def _get_account_name_by_socket(self, client_socket):
-        for name in self.names:
-            if self.names[name] == client_socket:
-                return name
-        return None
+        Таймер не переставляется на каждое входящее сообщение, при срабатывании он сверяется с
+        last_activity подключения и переносится на оставшееся время.
+        """
+        if client_socket.closed:
+            return
+        idle = time.monotonic() - client_socket.last_activity
+        if client_socket.paused:
+            # чтение приостановлено из-за медленного получателя, молчание клиента тут ни при чём
+            self.idle_timers.schedule(client_socket, self.ping_interval, self._check_idle)
+        elif idle >= self.idle_timeout:
+            self.logger.info(f'Клиент {client_socket.address} не отвечает {int(idle)} с, подключение закрывается.')
+            self._close_client_socket(client_socket)
+        elif idle >= self.ping_interval:
+            self._send_to(client_socket, self.compose_action_request(settings.ACTION_PING))
+            self.idle_timers.schedule(client_socket, min(self.ping_interval, self.idle_timeout - idle),
+                                      self._check_idle)
+        else:
+            self.idle_timers.schedule(client_socket, self.ping_interval - idle, self._check_idle)
 
     def _close_client_socket(self, client_socket):
         if isinstance(client_socket, str):
             client_socket = self._get_socket_by_name(client_socket)
-        if client_socket:
-            self.logger.info(f'Клиент {client_socket.getpeername()} отключился от сервера.')
+        if client_socket and client_socket in self.connections:
+            self.logger.info(f'Клиент {client_socket.address} отключился от сервера.')
             client_socket.close()
-            if account_name := self._get_account_name_by_socket(client_socket):
-                self.db.user_logout(account_name)
-                with self.lock_flag:
-                    self.new_connection = True
-            self.names = {key: value for (key, value) in self.names.items() if value != client_socket}
-            self.clients.remove(client_socket)
-
-    def _process_message_to_client(self, message_tuple, recipient_list):
-        if isinstance(message_tuple[0], str):
-            account_name = message_tuple[0]
-            client_socket = self._get_socket_by_name(account_name)
-        else:
-            client_socket = message_tuple[0]
-            account_name = None
-        if client_socket in recipient_list:
-            self.send_message(client_socket, message_tuple[1])
-            # if account_name:
-            #     if message_tuple[1][settings.REQUEST_ACTION] == settings.ACTION_P2P_MESSAGE:
-            #         self.logger.info(f'Сообщение отправлено пользователю {account_name}.')
-        else:
-            self._close_client_socket(client_socket)
-
-    def _process_message_from_client(self, client_socket, message):
+            self.metrics.inc('connections_closed')
+            self.connections.remove(client_socket)
+            self.idle_timers.cancel(client_socket)
+            self.sessions.detach(client_socket)
+            self.limiter.release(client_socket)
+            client_socket.abandon_traces(OUTCOME_CLOSED)
+            if account_name := client_socket.account_name:
+                if self.router_link:
+                    self.router_link.offline(account_name)
+                if not self.connections.get_by_name(account_name):
+                    self._notify_connection(account_name)
+
+    def _send_to(self, recipient, message):
+        client_socket = self._get_socket_by_name(recipient) if isinstance(recipient, str) else recipient
+        if client_socket:
+            self._send_frame(client_socket, self.encode_message(message, client_socket.codec, client_socket.compression),
+                             message[settings.REQUEST_ACTION])
+
+    def _send_frame(self, client_socket, frame, action):
+        self.metrics.inc('frames_out', action)
+        self.metrics.inc('bytes_out', None, len(frame))
+        client_socket.enqueue(frame)
+        if self.current_trace:
+            client_socket.trace(self.current_trace)
+        self.limiter.check(client_socket, self.current_sender)
+
+    def _trace_stage(self, stage):
+        if self.current_trace:
+            self.current_trace.stamp(stage)
+
+    def _fan_out(self, recipients, message):
+        # кадр кодируется один раз на каждое сочетание кодека и сжатия, получателям ставятся те же байты
+        frames = {}
+        for recipient in recipients:
+            if not (client_socket := self.connections.get_by_name(recipient)):
+                continue
+            frame_format = (client_socket.codec, client_socket.compression)
+            if (frame := frames.get(frame_format)) is None:
+                frame = frames[frame_format] = self.encode_message(message, *frame_format)
+            self._send_frame(client_socket, frame, message[settings.REQUEST_ACTION])
+
+    def _disconnect_slow_consumer(self, client_socket):
+        self.logger.warning(f'Клиент {client_socket.address} не успевает читать сообщения и будет отключён.')
+        self._close_client_socket(client_socket)
+
+    def get_queue_depths(self):
+        return {connection.address: connection.queue_depth for connection in self.connections}
+
+    def _process_message_from_client(self, client_socket, message, received_at, decoded_at):
+        if client_socket.deferred is not None:
+            client_socket.deferred.append((message, received_at, decoded_at))
+            return
+        # отправитель запоминается, чтобы при переполнении очереди получателя приостановить его чтение
+        sender, self.current_sender = self.current_sender, client_socket
+        try:
+            self._dispatch_message(client_socket, message, received_at, decoded_at)
+        finally:
+            self.current_sender = sender
+
+    def _init_handlers(self):
+        """Обработчики запросов клиента и проверки их полей по действию"""
+        handlers = {
+            settings.ACTION_PRESENCE: self._process_presence,
+            settings.ACTION_RESUME: self._process_resume,
+            settings.ACTION_PING: self._process_ping,
+            settings.ACTION_PONG: self._process_pong,
+            settings.ACTION_EXIT: self._process_exit,
+            settings.ACTION_P2P_MESSAGE: self._process_p2p_message,
+            settings.ACTION_GET_USERS: self._process_users,
+            settings.ACTION_GET_CONTACTS: self._process_contacts,
+            settings.ACTION_ADD_CONTACT: self._process_contact,
+            settings.ACTION_DEL_CONTACT: self._process_contact,
+            settings.ACTION_CREATE_ROOM: self._process_room,
+            settings.ACTION_JOIN_ROOM: self._process_room,
+            settings.ACTION_LEAVE_ROOM: self._process_room,
+            settings.ACTION_ROOM_MESSAGE: self._process_room_message,
+        }
+        return {action: (schemas.CLIENT_REQUEST_VALIDATORS[action], handler) for action, handler in handlers.items()}
+
+    def _dispatch_message(self, client_socket, message, received_at, decoded_at):
         self.logger.debug(message)
-        for param in [settings.REQUEST_ACTION, settings.REQUEST_TIME, settings.REQUEST_USER]:
-            if not (param in message):
-                self._process_error(client_socket, f'Неверный параметр {param}!')
-                return
-
-        if not (account_name := self.get_name_from_message(message)):
-            self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_ACCOUNT_NAME}!')
+        action = schemas.request_action(message)
+        if not (handler := self.handlers.get(action)):
+            # в метку попадают только известные действия, иначе число рядов метрик не ограничено
+            self.metrics.inc('frames_in', 'unknown')
+            self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_ACTION}!')
+            return
+        started = time.perf_counter()
+        self.metrics.inc('frames_in', action)
+        validate, process = handler
+        if invalid := validate(message):
+            self._process_error(client_socket, f'Неверный параметр {invalid}!')
             return
-        if account_name not in self.names.keys():
-            self.names[account_name] = client_socket
-
-        password = None
-        if message[settings.REQUEST_ACTION] in [settings.ACTION_PRESENCE]:
-            if not (password := self.get_password_from_message(message)):
-                self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_ACCOUNT_NAME}!')
-                return
 
-        if message[settings.REQUEST_ACTION] == settings.ACTION_PRESENCE:
-            self._process_presence(client_socket, account_name, password)
+        account_name = self.get_name_from_message(message)
+        if not self.connections.get_by_name(account_name):
+            self.connections.login(client_socket, account_name)
+        previous_trace = self.current_trace
+        self.current_trace = trace = self.tracer.start(action, account_name, received_at, decoded_at)
+        try:
+            process(client_socket, account_name, message)
+        finally:
+            self.current_trace = previous_trace
+        if trace:
+            trace.done()
+        self.metrics.observe('request_seconds', action, time.perf_counter() - started)
+
+    def _process_ping(self, client_socket, account_name, message_from_client):
+        self._send_to(client_socket, self.compose_action_request(settings.ACTION_PONG))
+
+    def _process_pong(self, client_socket, account_name, message_from_client):
+        # время последней активности уже обновил сетевой движок
+        pass
+
+    def _process_exit(self, client_socket, account_name, message_from_client):
+        # явный выход завершает сессию, возобновить её уже нельзя
+        self.sessions.discard(client_socket)
+        self._close_client_socket(client_socket)
+
+    def _process_presence(self, client_socket, account_name, message_from_client):
+        password = self.get_password_from_message(message_from_client)
+        options = message_from_client.get(settings.REQUEST_DATA)
+        if not isinstance(options, dict):
+            options = {}
+        client_socket.deferred = []
+        self.password_hasher.hash_password(
+            account_name, password,
+            lambda password_hash: self._finish_presence(client_socket, account_name, password, password_hash, options)
+        )
 
-        elif message[settings.REQUEST_ACTION] == settings.ACTION_EXIT:
+    def _finish_presence(self, client_socket, account_name, password, password_hash, options=None):
+        if client_socket.closed:
+            return
+        # запросы после presence больше не откладываются, даже если вход не удался
+        deferred, client_socket.deferred = client_socket.deferred, None
+        try:
+            self._login(client_socket, account_name, password, password_hash, options)
+        except Exception:
+            self.logger.exception(f'Ошибка входа клиента {client_socket.address}')
             self._close_client_socket(client_socket)
-
-        elif message[settings.REQUEST_ACTION] == settings.ACTION_P2P_MESSAGE:
-            self._process_p2p_message(client_socket, message)
-
-        elif message[settings.REQUEST_ACTION] == settings.ACTION_GET_USERS:
-            self._process_users(account_name)
-
-        elif message[settings.REQUEST_ACTION] == settings.ACTION_GET_CONTACTS:
-            self._process_contacts(account_name)
-
-        elif message[settings.REQUEST_ACTION] == settings.ACTION_ADD_CONTACT:
-            self._process_contact(client_socket, account_name, message, 'add')
-
-        elif message[settings.REQUEST_ACTION] == settings.ACTION_DEL_CONTACT:
-            self._process_contact(client_socket, account_name, message, 'del')
-
-        else:
-            self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_ACTION}!')
-
-    def _process_presence(self, client_socket, account_name, password):
-        client_ip, client_port = client_socket.getpeername()
-        password_hash = self.get_password_hash(account_name, password)
+            return
+        for message, received_at, decoded_at in deferred:
+            if client_socket.closed:
+                break
+            try:
+                self._process_message_from_client(client_socket, message, received_at, decoded_at)
+            except Exception:
+                self.logger.exception(f'Ошибка обработки запроса клиента {client_socket.address}')
+                self._close_client_socket(client_socket)
+                break
+
+    def _login(self, client_socket, account_name, password, password_hash, options=None):
+        if password_hash is None:
+            self._process_error(client_socket, 'Ошибка проверки пароля.')
+            return
+        client_ip, client_port = client_socket.address[:2]
         login_result = self.db.user_login(account_name, password_hash, client_ip, client_port)
         if login_result is not True:
             self._process_error(client_socket, login_result)
             return
+        self.password_hasher.remember(account_name, password, password_hash)
         self.logger.info(f'Пользователь {account_name} онлайн')
-        with self.lock_flag:
-            self.new_connection = True
-        response = self.compose_action_request(settings.ACTION_PRESENCE)
-        self.messages.append((account_name, response))
-
-    def _process_p2p_message(self, client_socket, message_from_client):
-        if settings.REQUEST_DATA not in message_from_client:
-            self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_DATA}!')
-            return
-        if settings.REQUEST_RECIPIENT not in message_from_client[settings.REQUEST_DATA]:
-            self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_RECIPIENT}!')
+        if self.router_link:
+            self.router_link.online(account_name, client_socket.address)
+        self._notify_connection(account_name, client_socket.address, client_socket.connected_at)
+        session = self.sessions.create(client_socket)
+        response_data = self._negotiate(client_socket, options or {})
+        response_data[settings.REQUEST_TOKEN] = session.token
+        response = self.compose_action_request(settings.ACTION_PRESENCE, data=response_data)
+        self._send_to(client_socket, response)
+        # нумеруются кадры после ответа на presence
+        self.sessions.attach(session, client_socket)
+        self._send_offline_messages(client_socket, account_name)
+
+    def _process_resume(self, client_socket, account_name, message_from_client):
+        data = message_from_client[settings.REQUEST_DATA]
+        session, frames = self.sessions.resume(data[settings.REQUEST_TOKEN], account_name, data[settings.REQUEST_SEQ])
+        if not session:
+            self._send_to(client_socket, self.compose_action_request(settings.ACTION_RESUME, data={
+                settings.RESPONSE_STATUS: 400,
+                settings.RESPONSE_MESSAGE: 'Сессия не найдена, требуется вход.'
+            }))
             return
-        if settings.REQUEST_MESSAGE not in message_from_client[settings.REQUEST_DATA]:
-            self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_MESSAGE}!')
+
+        if (previous := session.connection) and previous is not client_socket:
+            self._close_client_socket(previous)
+        self.connections.login(client_socket, account_name)
+        client_socket.codec, client_socket.compression = session.codec, session.compression
+        client_ip, client_port = client_socket.address[:2]
+        self.db.user_resume(account_name, client_ip, client_port)
+        self.logger.info(f'Пользователь {account_name} возобновил сессию')
+        if self.router_link:
+            self.router_link.online(account_name, client_socket.address)
+        self._notify_connection(account_name, client_socket.address, client_socket.connected_at)
+
+        # ответ и повторно отправляемые кадры не нумеруются заново
+        self._send_to(client_socket, self.compose_action_request(settings.ACTION_RESUME, data={
+            settings.RESPONSE_STATUS: 200,
+            settings.REQUEST_SEQ: session.seq
+        }))
+        # кадры идут через общую проверку очереди; выброшенный повтор делает сессию невозобновляемой
+        dropped = self.limiter.counters['dropped']
+        for frame in frames:
+            self._send_frame(client_socket, frame, settings.ACTION_RESUME)
+        if client_socket.closed:
             return
+        session.broken = self.limiter.counters['dropped'] != dropped
+        self.sessions.attach(session, client_socket)
+        self._send_offline_messages(client_socket, account_name)
 
+    def _send_offline_messages(self, client_socket, account_name):
+        messages = [{
+            settings.REQUEST_SENDER: sender,
+            settings.REQUEST_MESSAGE: message,
+            settings.REQUEST_TIME: created_at
+        } for sender, message, created_at in self.db.pop_offline_messages(account_name)]
+        for start in range(0, len(messages), settings.OFFLINE_BATCH_SIZE):
+            message_to_client = self.compose_action_request(settings.ACTION_OFFLINE_MESSAGES, data={
+                settings.REQUEST_MESSAGES: messages[start:start + settings.OFFLINE_BATCH_SIZE]
+            })
+            self._send_to(client_socket, message_to_client)
+
+    @staticmethod
+    def _negotiate(client_socket, options):
+        # кодек и сжатие выбираются только если клиент прислал списки поддерживаемых,
+        # старые клиенты и неверные значения остаются на JSON без сжатия
+        negotiated = {}
+        if isinstance(codecs := options.get(settings.REQUEST_CODECS), (list, tuple)) and codecs:
+            client_socket.codec = codec.choose_codec(codecs)
+            negotiated[settings.REQUEST_CODEC] = client_socket.codec
+        if compression := codec.choose_compression(options.get(settings.REQUEST_COMPRESSION)):
+            client_socket.compression = compression
+            negotiated[settings.REQUEST_COMPRESSION] = compression
+        return negotiated
+
+    def _process_p2p_message(self, client_socket, sender, message_from_client):
         recipient = message_from_client[settings.REQUEST_DATA][settings.REQUEST_RECIPIENT]
-        sender = self.get_name_from_message(message_from_client)
         msg = message_from_client[settings.REQUEST_DATA][settings.REQUEST_MESSAGE]
-        if recipient not in self.names:
+        recipient_connection = self.connections.get_by_name(recipient)
+        remote = not recipient_connection and self.router_link and self.router_link.is_online(recipient)
+        # получателю не в сети сообщение сохраняется и доставляется при следующем входе
+        if not (recipient_connection or remote) and not self.db.save_offline_message(sender, recipient, msg):
             message_to_sender = self.compose_action_request(
                 settings.ACTION_P2P_MESSAGE,
-                data={settings.REQUEST_STATUS: 400, settings.REQUEST_MESSAGE: 'Польватель не в сети!'}
+                data={settings.REQUEST_STATUS: 400, settings.REQUEST_MESSAGE: 'Пользователь не найден!'}
             )
-            self.messages.append((sender, message_to_sender))
+            self._send_to(sender, message_to_sender)
             return
 
         message_to_sender = self.compose_action_request(
@@ -347,51 +693,113 @@ class MsgServer(TCPSocket, metaclass=ServerVerifier):
                 settings.REQUEST_MESSAGE: msg
             }
         )
-        self.messages.append((client_socket, message_to_sender))
+        self._send_to(client_socket, message_to_sender)
 
         message_to_recipient = self.compose_action_request(settings.ACTION_P2P_MESSAGE, data={
             settings.REQUEST_SENDER: sender,
             settings.REQUEST_MESSAGE: msg
         })
-        self.messages.append((recipient, message_to_recipient))
+        if recipient_connection:
+            self._send_to(recipient_connection, message_to_recipient)
+        elif remote:
+            self.router_link.route(recipient, message_to_recipient)
 
         self.db.process_message(sender, recipient)
+        self._trace_stage(STAGE_DB)
+
+    def _process_users(self, client_socket, account_name, message_from_client):
+        data = message_from_client.get(settings.REQUEST_DATA)
+        if not isinstance(data, dict):
+            data = {}
+        frame_format = (client_socket.codec, client_socket.compression)
+        frame = self.directory.get_frame(
+            data.get(settings.REQUEST_VERSION), frame_format,
+            lambda users_data: self.encode_message(
+                self.compose_action_request(settings.ACTION_GET_USERS, data=users_data), *frame_format),
+            data.get(settings.REQUEST_CURSOR), data.get(settings.REQUEST_LIMIT)
+        )
+        self._send_frame(client_socket, frame, settings.ACTION_GET_USERS)
 
-    def _process_users(self, account_name):
-        users = [user.username for user in self.db.get_users()]
-        message_to_client = self.compose_action_request(settings.ACTION_GET_USERS, data={
-            settings.REQUEST_USERS: users
-        })
-        self.messages.append((account_name, message_to_client))
-
-    def _process_contacts(self, account_name):
+    def _process_contacts(self, client_socket, account_name, message_from_client):
         contacts = [contact.contact_user.username for contact in self.db.get_contacts_by_username(account_name)]
         message_to_client = self.compose_action_request(settings.ACTION_GET_CONTACTS, data={
             settings.REQUEST_CONTACTS: contacts
         })
-        self.messages.append((account_name, message_to_client))
+        self._send_to(account_name, message_to_client)
 
-    def _process_contact(self, client_socket, account_name, message_from_client, mode):
-        if settings.REQUEST_DATA not in message_from_client:
-            self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_DATA}!')
-            return
-        if settings.REQUEST_USERNAME not in message_from_client[settings.REQUEST_DATA]:
-            self._process_error(client_socket, f'Неверный параметр {settings.REQUEST_USERNAME}!')
-            return
+    def _process_contact(self, client_socket, account_name, message_from_client):
         contact_user_name = message_from_client[settings.REQUEST_DATA][settings.REQUEST_USERNAME]
-        if mode == 'del':
+        action = message_from_client[settings.REQUEST_ACTION]
+        if action == settings.ACTION_DEL_CONTACT:
             self.db.del_contact(account_name, contact_user_name)
-            action = settings.ACTION_DEL_CONTACT
         else:
             self.db.add_contact(account_name, contact_user_name)
-            action = settings.ACTION_ADD_CONTACT
         message_to_client = self.compose_action_request(action, data={
             settings.REQUEST_USERNAME: contact_user_name
         })
-        self.messages.append((account_name, message_to_client))
+        self._send_to(account_name, message_to_client)
+
+    def _process_room(self, client_socket, account_name, message_from_client):
+        room_name = message_from_client[settings.REQUEST_DATA][settings.REQUEST_ROOM]
+        action = message_from_client[settings.REQUEST_ACTION]
+        if action == settings.ACTION_CREATE_ROOM:
+            if room_name in self.rooms or not self.db.add_room(room_name, account_name):
+                self._process_error(client_socket, f'Комната {room_name} уже существует!')
+                return
+            self.rooms.create(room_name, account_name)
+        elif room_name not in self.rooms:
+            self._process_error(client_socket, f'Комната {room_name} не найдена!')
+            return
+        elif action == settings.ACTION_JOIN_ROOM:
+            if self.rooms.join(room_name, account_name):
+                self.db.add_room_member(room_name, account_name)
+        elif self.rooms.leave(room_name, account_name):
+            self.db.del_room_member(room_name, account_name)
+
+        if self.router_link:
+            self.router_link.room_changed(room_name, account_name, action != settings.ACTION_LEAVE_ROOM)
+        message_to_client = self.compose_action_request(action, data={
+            settings.REQUEST_ROOM: room_name,
+            settings.REQUEST_MEMBERS: sorted(self.rooms.members(room_name))
+        })
+        self._send_to(client_socket, message_to_client)
+
+    def _process_room_message(self, client_socket, account_name, message_from_client):
+        room_name = message_from_client[settings.REQUEST_DATA][settings.REQUEST_ROOM]
+        if not self.rooms.is_member(room_name, account_name):
+            self._process_error(client_socket, f'Вы не участник комнаты {room_name}!')
+            return
+        msg = message_from_client[settings.REQUEST_DATA][settings.REQUEST_MESSAGE]
+
+        message_to_sender = self.compose_action_request(settings.ACTION_ROOM_MESSAGE, data={
+            settings.REQUEST_STATUS: 200,
+            settings.REQUEST_ROOM: room_name,
+            settings.REQUEST_MESSAGE: msg
+        })
+        self._send_to(client_socket, message_to_sender)
+
+        local, remote = [], []
+        for member in self.rooms.members(room_name):
+            if member == account_name:
+                continue
+            if self.connections.get_by_name(member):
+                local.append(member)
+            elif self.router_link and self.router_link.is_online(member):
+                remote.append(member)
+        message_to_members = self.compose_action_request(settings.ACTION_ROOM_MESSAGE, data={
+            settings.REQUEST_ROOM: room_name,
+            settings.REQUEST_SENDER: account_name,
+            settings.REQUEST_MESSAGE: msg
+        })
+        self._fan_out(local, message_to_members)
+        if remote:
+            self.router_link.fan_out(remote, message_to_members)
+
+        self.db.process_room_message(account_name, local + remote)
+        self._trace_stage(STAGE_DB)
 
     def _process_error(self, client_socket, message):
-        self.messages.append((client_socket, self._compose_response(400, message=message)))
+        self._send_to(client_socket, self._compose_response(400, message=message))
 
     def _compose_response(self, status, message=None):
         data = {settings.RESPONSE_STATUS: status}
@@ -408,12 +816,46 @@ class MsgServer(TCPSocket, metaclass=ServerVerifier):
                 'db_path': '',
                 'db_file': 'server.sqlite3',
                 'listen_port': settings.DEFAULT_PORT,
-                'listen_address': ''
+                'listen_address': '',
+                'engine': settings.DEFAULT_ENGINE,
+                'write_batch': settings.MAX_WRITE_BATCH,
+                'high_watermark': settings.OUTBOUND_HIGH_WATERMARK,
+                'low_watermark': settings.OUTBOUND_LOW_WATERMARK,
+                'slow_consumer_policy': settings.SLOW_CONSUMER_POLICY,
+                'ping_interval': settings.IDLE_PING_INTERVAL,
+                'idle_timeout': settings.IDLE_TIMEOUT,
+                'presence_snapshot_interval': settings.PRESENCE_SNAPSHOT_INTERVAL,
+                'metrics_port': settings.METRICS_PORT,
+                'stats_interval': settings.STATS_INTERVAL,
+                'trace_sample_rate': settings.TRACE_SAMPLE_RATE,
+                'trace_threshold': settings.TRACE_THRESHOLD
             }
             with open(CONFIG_FILE, 'w') as conf:
                 self.config.write(conf)
 
 
+def run_worker(worker_id, router_path, address, port, engine_name, metrics_port=0, stats_interval=0,
+               trace_sample_rate=0, trace_threshold=settings.TRACE_THRESHOLD):
+    worker = MsgServer(worker_id)
+    worker.config['SETTINGS']['engine'] = engine_name
+    worker.metrics_port = metrics_port
+    worker.stats_interval = stats_interval
+    worker.trace_sample_rate = trace_sample_rate
+    worker.trace_threshold = trace_threshold
+    worker.bind(address, port, reuse_port=True)
+    engine = worker.create_engine()
+    worker.router_link = WorkerLink(worker, worker_id, router_path)
+    worker.router_link.attach(engine)
+    # мастер завершает воркеры через SIGTERM, статистика должна успеть записаться
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        engine.run()
+    finally:
+        # пул нужно остановить до того, как multiprocessing начнёт ждать дочерние процессы воркера
+        worker.password_hasher.shutdown()
+        worker.db.close_stats()
+
+
 if __name__ == '__main__':
-    server = MsgServer.bind_from_config()
+    server = MsgServer.bind_from_args()
     server.mainloop()
@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import common.settings as settings
+from server.connections import ClientConnection
+
+
+class ClientProtocol(asyncio.Protocol):
+    def __init__(self, engine):
+        self.engine = engine
+        self.server = engine.server
+        self.connection = None
+
+    def connection_made(self, transport):
+        self.connection = ClientConnection(self.engine, transport.get_extra_info('peername'), transport=transport)
+        self.server._add_client_socket(self.connection)
+
+    def data_received(self, data):
+        connection = self.connection
+        connection.last_activity = received_at = time.monotonic()
+        self.server.metrics.inc('bytes_in', None, len(data))
+        try:
+            messages = [self.server.decode_message(payload) for payload in connection.decoder.feed(data)]
+            decoded_at = time.monotonic()
+        except ValueError:
+            self.server.logger.error(f'Неверный запрос от клиента: {connection.address}')
+            self.server._close_client_socket(connection)
+            return
+        for message in messages:
+            if connection.closed:
+                break
+            try:
+                self.server._process_message_from_client(connection, message, received_at, decoded_at)
+            except Exception:
+                # ошибка в обработчике закрывает только это подключение, а не весь сетевой цикл
+                self.server.logger.exception(f'Ошибка обработки запроса клиента {connection.address}')
+                self.server._close_client_socket(connection)
+                break
+
+    def pause_writing(self):
+        self.engine.write_paused.add(self.connection)
+
+    def resume_writing(self):
+        self.engine.write_paused.discard(self.connection)
+        if self.connection.out_queue:
+            self.engine.want_write(self.connection)
+
+    def connection_lost(self, exc):
+        self.connection.closed = True
+        self.engine.write_paused.discard(self.connection)
+        self.server._close_client_socket(self.connection)
+
+
+class AsyncEngine:
+    """Сетевой цикл сервера на asyncio: приём и чтение по событиям готовности, без опроса.
+
+    Исходящие кадры копятся в очередях подключений и отправляются один раз за итерацию цикла
+    только для тех подключений, у которых что-то есть в очереди, пачками по write_batch кадров.
+    Пока буфер транспорта переполнен (pause_writing), кадры остаются в очереди подключения.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.write_batch = server.config['SETTINGS'].getint('write_batch', settings.MAX_WRITE_BATCH)
+        self.loop = None
+        self.readers = []
+        self.writers = {}
+        self.periodic = []
+        self.pending = {}
+        self.flush_scheduled = False
+        self.write_paused = set()
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    def call_soon_threadsafe(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def add_reader(self, sock, callback):
+        self.readers.append((sock, callback))
+        if self.loop:
+            self.loop.add_reader(sock, callback)
+
+    def add_writer(self, sock, callback):
+        self.writers[sock] = callback
+        if self.loop:
+            self.loop.add_writer(sock, callback)
+
+    def remove_writer(self, sock):
+        self.writers.pop(sock, None)
+        if self.loop:
+            self.loop.remove_writer(sock)
+
+    def call_every(self, interval, callback):
+        self.periodic.append((interval, callback))
+        if self.loop:
+            self._schedule_periodic(interval, callback)
+
+    def _schedule_periodic(self, interval, callback):
+        def run():
+            self.loop.call_later(interval, run)
+            callback()
+        self.loop.call_later(interval, run)
+
+    def want_write(self, connection):
+        self.pending[connection] = None
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def pause_reading(self, connection):
+        connection.transport.pause_reading()
+
+    def resume_reading(self, connection):
+        if not connection.transport.is_closing():
+            connection.transport.resume_reading()
+
+    def release(self, connection):
+        connection.transport.close()
+
+    def _flush(self):
+        self.flush_scheduled = False
+        pending, self.pending = self.pending, {}
+        for connection in pending:
+            if connection.closed:
+                continue
+            out_queue = connection.out_queue
+            while out_queue and connection not in self.write_paused:
+                batch = [out_queue.popleft() for _ in range(min(self.write_batch, len(out_queue)))]
+                connection.dequeued(sum(map(len, batch)))
+                connection.transport.writelines(batch)
+            self.server.limiter.drained(connection)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        for sock, callback in self.readers:
+            self.loop.add_reader(sock, callback)
+        for sock, callback in self.writers.items():
+            self.loop.add_writer(sock, callback)
+        for interval, callback in self.periodic:
+            self._schedule_periodic(interval, callback)
+        listener = await self.loop.create_server(lambda: ClientProtocol(self),
+                                                 sock=self.server.sock, backlog=settings.MAX_CONNECTIONS)
+        self.server.logger.info(f'Слушаем запросы от клиента (asyncio)...')
+        async with listener:
+            await listener.serve_forever()
@@ -0,0 +1,61 @@
+import hashlib
+import hmac
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from common.tcp_socket import TCPSocket
+
+# число процессов для вычисления хешей (None - по числу ядер) и размер кеша проверенных паролей
+PASSWORD_HASH_WORKERS = None
+PASSWORD_CACHE_SIZE = 4096
+
+
+class PasswordHasher:
+    """Вычисление PBKDF2-хеша пароля в пуле процессов.
+
+    Результат передаётся в callback через dispatch (call_soon_threadsafe движка), поэтому сетевой
+    цикл не блокируется на время вычисления. Хеши успешно проверенных паролей хранятся в
+    ограниченном LRU-кеше, ключ кеша - HMAC от имени и пароля, сам пароль не хранится.
+    """
+
+    def __init__(self, dispatch, workers=PASSWORD_HASH_WORKERS, cache_size=PASSWORD_CACHE_SIZE):
+        self.dispatch = dispatch
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_secret = os.urandom(32)
+        self.executor = None
+
+    def hash_password(self, username, password, callback):
+        key = self._cache_key(username, password)
+        if (password_hash := self.cache.get(key)) is not None:
+            self.cache.move_to_end(key)
+            callback(password_hash)
+            return
+        if not self.executor:
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        future = self.executor.submit(TCPSocket.get_password_hash, username, password)
+        future.add_done_callback(lambda done: self.dispatch(self._on_hashed, done, callback))
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def remember(self, username, password, password_hash):
+        self.cache[self._cache_key(username, password)] = password_hash
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _cache_key(self, username, password):
+        return hmac.new(self.cache_secret, f'{username}\0{password}'.encode('utf-8'), hashlib.sha256).digest()
+
+    @staticmethod
+    def _on_hashed(future, callback):
+        try:
+            password_hash = future.result()
+        except Exception:
+            password_hash = None
+        callback(password_hash)
@@ -0,0 +1,68 @@
+import common.settings as settings
+
+# политики для клиента, который не успевает читать исходящие сообщения
+POLICY_PAUSE = 'pause'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_DISCONNECT = 'disconnect'
+POLICIES = (POLICY_PAUSE, POLICY_DROP_OLDEST, POLICY_DISCONNECT)
+
+
+class SlowConsumerLimiter:
+    """Ограничение исходящих очередей подключений.
+
+    Когда в очереди получателя больше high_watermark байт, применяется политика:
+    pause - перестать читать запросы отправителя, пока очередь не опустится ниже low_watermark
+    (если отправитель неизвестен, например сообщение пришло от другого воркера, - drop_oldest);
+    drop_oldest - выбросить самые старые кадры до low_watermark; disconnect - отключить получателя.
+    """
+
+    def __init__(self, disconnect, high_watermark=settings.OUTBOUND_HIGH_WATERMARK,
+                 low_watermark=settings.OUTBOUND_LOW_WATERMARK, policy=settings.SLOW_CONSUMER_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f'Неизвестная политика медленного клиента: {policy}')
+        self.disconnect = disconnect
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.policy = policy
+        self.counters = {'paused': 0, 'resumed': 0, 'dropped': 0, 'disconnected': 0}
+
+    def check(self, consumer, sender=None):
+        if consumer.queued_bytes <= self.high_watermark or consumer.closed:
+            return
+        if self.policy == POLICY_DISCONNECT:
+            self.counters['disconnected'] += 1
+            self.disconnect(consumer)
+        elif self.policy == POLICY_PAUSE and sender is not None and not sender.closed:
+            if consumer not in sender.paused_by:
+                paused = sender.paused
+                sender.paused_by.add(consumer)
+                consumer.blocked_senders.add(sender)
+                if not paused:
+                    sender.engine.pause_reading(sender)
+                    self.counters['paused'] += 1
+        else:
+            self._drop_oldest(consumer)
+
+    def drained(self, consumer):
+        if consumer.blocked_senders and consumer.queued_bytes <= self.low_watermark:
+            self.release(consumer)
+
+    def release(self, consumer):
+        blocked_senders, consumer.blocked_senders = consumer.blocked_senders, set()
+        for sender in blocked_senders:
+            sender.paused_by.discard(consumer)
+            # чтение возобновляется, только когда отправителя не держит ни один получатель
+            if not sender.paused and not sender.closed:
+                sender.engine.resume_reading(sender)
+                self.counters['resumed'] += 1
+
+    def _drop_oldest(self, consumer):
+        # первый кадр мог быть отправлен частично, поэтому он остаётся в очереди
+        out_queue = consumer.out_queue
+        if consumer.session:
+            consumer.session.broken = True
+        while consumer.queued_bytes > self.low_watermark and len(out_queue) > 1:
+            frame = out_queue[1]
+            del out_queue[1]
+            consumer.discard(len(frame))
+            self.counters['dropped'] += 1
@@ -0,0 +1,151 @@
+import time
+from collections import deque
+
+from common.codec import CODEC_JSON
+from common.tcp_socket import FrameDecoder
+from server.tracing import OUTCOME_DROPPED
+
+
+class ClientConnection:
+    """Состояние одного клиентского подключения.
+
+    sock - неблокирующий сокет (движок selectors), transport - транспорт asyncio.
+    deferred - запросы (со временем чтения и разбора), пришедшие пока проверяется пароль,
+    обрабатываются после входа по порядку.
+    codec и compression - кодек и сжатие исходящих сообщений, согласованные при входе.
+    queued_bytes - объём неотправленных кадров, paused_by - медленные получатели, из-за которых
+    приостановлено чтение этого подключения, blocked_senders - отправители, приостановленные из-за него.
+    session - возобновляемая сессия, в которую записываются отправленные кадры.
+    dequeued_bytes и traces нужны трассировке: сколько байт всего ушло из очереди и трассы,
+    ждущие отправки своих кадров.
+    """
+    __slots__ = ('engine', 'sock', 'transport', 'address', 'account_name', 'decoder', 'out_queue',
+                 'connected_at', 'last_activity', 'closed', 'deferred', 'codec', 'compression',
+                 'queued_bytes', 'paused_by', 'blocked_senders', 'session', 'dequeued_bytes', 'traces')
+
+    def __init__(self, engine, address, sock=None, transport=None):
+        self.engine = engine
+        self.sock = sock
+        self.transport = transport
+        self.address = address
+        self.account_name = None
+        self.decoder = FrameDecoder()
+        self.out_queue = deque()
+        self.connected_at = time.time()
+        self.last_activity = time.monotonic()
+        self.closed = False
+        self.deferred = None
+        self.codec = CODEC_JSON
+        self.compression = None
+        self.queued_bytes = 0
+        self.paused_by = set()
+        self.blocked_senders = set()
+        self.session = None
+        self.dequeued_bytes = 0
+        self.traces = deque()
+
+    def __repr__(self):
+        return f'<ClientConnection {self.account_name} {self.address}>'
+
+    @property
+    def paused(self):
+        return bool(self.paused_by)
+
+    @property
+    def queue_depth(self):
+        return len(self.out_queue)
+
+    def enqueue(self, frame):
+        self.out_queue.append(frame)
+        self.queued_bytes += len(frame)
+        if self.session:
+            self.session.record(frame)
+        if len(self.out_queue) == 1:
+            self.engine.want_write(self)
+
+    def dequeued(self, size):
+        """size байт отправлены из очереди"""
+        self.queued_bytes -= size
+        self.dequeued_bytes += size
+        # кадр трассы отправлен, когда из очереди ушли все байты до его конца
+        while self.traces and self.traces[0][0] <= self.dequeued_bytes:
+            self.traces.popleft()[1].sent(self)
+
+    def discard(self, nbytes):
+        """Кадр из nbytes байт, стоявший сразу за первым кадром очереди, выброшен неотправленным.
+
+        Счётчик отправленных байт не меняется, метки более поздних трасс сдвигаются на nbytes,
+        трассы выброшенного кадра закрываются с исходом dropped.
+        """
+        self.queued_bytes -= nbytes
+        if not self.traces:
+            return
+        start = self.dequeued_bytes + len(self.out_queue[0])
+        traces = deque()
+        for mark, trace in self.traces:
+            if mark <= start:
+                traces.append((mark, trace))
+            elif mark > start + nbytes:
+                traces.append((mark - nbytes, trace))
+            else:
+                trace.abandoned(self, OUTCOME_DROPPED)
+        self.traces = traces
+
+    def abandon_traces(self, outcome):
+        """Кадры ждущих трасс уже не будут отправлены"""
+        traces, self.traces = self.traces, deque()
+        for _, trace in traces:
+            trace.abandoned(self, outcome)
+
+    def trace(self, trace):
+        """Только что поставленный в очередь кадр относится к трассе trace"""
+        trace.enqueued(self)
+        self.traces.append((self.dequeued_bytes + self.queued_bytes, trace))
+
+    def getpeername(self):
+        return self.address
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.engine.release(self)
+
+
+class ConnectionRegistry:
+    """Реестр подключений сервера с прямым и обратным индексом подключение <-> имя пользователя.
+
+    Добавление, вход, поиск по имени и отключение выполняются за O(1).
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.by_name = {}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __iter__(self):
+        return iter(list(self.connections))
+
+    def __contains__(self, connection):
+        return connection in self.connections
+
+    def add(self, connection):
+        self.connections[connection] = None
+
+    def login(self, connection, account_name):
+        if connection.account_name and self.by_name.get(connection.account_name) is connection:
+            del self.by_name[connection.account_name]
+        connection.account_name = account_name
+        self.by_name[account_name] = connection
+
+    def remove(self, connection):
+        self.connections.pop(connection, None)
+        if connection.account_name and self.by_name.get(connection.account_name) is connection:
+            del self.by_name[connection.account_name]
+
+    def get_by_name(self, account_name):
+        return self.by_name.get(account_name)
+
+    def names(self):
+        return self.by_name.keys()
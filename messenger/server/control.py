@@ -0,0 +1,133 @@
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+import common.settings as settings
+from common.tcp_socket import TCPSocket
+
+# команды сокета управления
+CONTROL_ADD_USER = 'add_user'
+CONTROL_DEL_USER = 'del_user'
+CONTROL_USERS = 'users'
+CONTROL_CONNECTIONS = 'connections'
+CONTROL_STATS = 'stats'
+
+# сколько секунд сокет управления ждёт команду от подключившегося клиента
+CONTROL_TIMEOUT = 5
+
+
+def get_control_path(port):
+    return os.path.join(tempfile.gettempdir(), f'msg_server_{port}.ctl')
+
+
+class ControlServer:
+    """Локальный сокет управления сервером, запущенным без окна администратора.
+
+    По unix-сокету принимает одну команду на подключение и отвечает на неё. Команды
+    выполняются в отдельном потоке, как и действия окна администратора.
+    """
+
+    def __init__(self, path, logger, commands):
+        self.path = path
+        self.logger = logger
+        self.commands = commands
+        self.sock = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        # управлять сервером может только владелец процесса
+        os.chmod(self.path, 0o600)
+        self.sock.listen(settings.MAX_CONNECTIONS)
+
+        control_thread = threading.Thread(target=self._run)
+        control_thread.daemon = True
+        control_thread.start()
+        self.logger.info(f'Сокет управления: {self.path}')
+
+    def stop(self):
+        if self.sock:
+            self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _run(self):
+        while True:
+            try:
+                client_socket, _ = self.sock.accept()
+            except OSError:
+                return
+            with client_socket:
+                client_socket.settimeout(CONTROL_TIMEOUT)
+                try:
+                    request = TCPSocket.get_message(client_socket)
+                    TCPSocket.send_message(client_socket, self._process(request))
+                except (OSError, ValueError) as e:
+                    self.logger.error(f'Ошибка команды управления: {e}')
+                except Exception:
+                    # поток управления один на процесс и должен пережить любую команду
+                    self.logger.exception('Ошибка команды управления')
+
+    def _process(self, request):
+        action = request.get(settings.REQUEST_ACTION)
+        data = request.get(settings.REQUEST_DATA) or {}
+        if not (command := self.commands.get(action)) or not isinstance(data, dict):
+            return {settings.RESPONSE_STATUS: 400, settings.RESPONSE_MESSAGE: f'Неизвестная команда {action}'}
+        # параметры всех команд - строки, как их передаёт командная строка
+        if not all(isinstance(value, str) for value in data.values()):
+            return {settings.RESPONSE_STATUS: 400, settings.RESPONSE_MESSAGE: 'Параметры команды должны быть строками'}
+        try:
+            result = command(**data)
+        except TypeError as e:
+            return {settings.RESPONSE_STATUS: 400, settings.RESPONSE_MESSAGE: f'Неверные параметры команды: {e}'}
+        except Exception as e:
+            self.logger.exception(f'Ошибка команды управления {action}')
+            return {settings.RESPONSE_STATUS: 500, settings.RESPONSE_MESSAGE: f'Ошибка выполнения команды: {e}'}
+        self.logger.info(f'Выполнена команда управления {action}')
+        return {settings.RESPONSE_STATUS: 200, settings.REQUEST_DATA: result}
+
+
+def send_command(path, action, **data):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONTROL_TIMEOUT)
+        sock.connect(path)
+        TCPSocket.send_message(sock, {settings.REQUEST_ACTION: action, settings.REQUEST_DATA: data})
+        return TCPSocket.get_message(sock)
+
+
+def main():
+    # запуск из каталога messenger: python -m server.control -p 7777 add_user user1 password
+    parser = argparse.ArgumentParser(description='Управление сервером, запущенным с --headless')
+    parser.add_argument('-p', default=settings.DEFAULT_PORT, type=int, help='порт сервера')
+    commands = parser.add_subparsers(dest='action', required=True)
+    add_user = commands.add_parser(CONTROL_ADD_USER, help='добавить пользователя')
+    add_user.add_argument('username')
+    add_user.add_argument('password')
+    del_user = commands.add_parser(CONTROL_DEL_USER, help='удалить пользователя')
+    del_user.add_argument('username')
+    commands.add_parser(CONTROL_USERS, help='список пользователей')
+    commands.add_parser(CONTROL_CONNECTIONS, help='подключённые пользователи')
+    commands.add_parser(CONTROL_STATS, help='статистика сообщений')
+    namespace = vars(parser.parse_args())
+
+    port = namespace.pop('p')
+    try:
+        response = send_command(get_control_path(port), namespace.pop('action'), **namespace)
+    except OSError as e:
+        print(f'Нет связи с сервером на порту {port}: {e}')
+        sys.exit(1)
+    if response.get(settings.RESPONSE_STATUS) != 200:
+        print(response.get(settings.RESPONSE_MESSAGE))
+        sys.exit(1)
+    result = response.get(settings.REQUEST_DATA)
+    for item in result if isinstance(result, list) else [result]:
+        print(item)
+
+
+if __name__ == '__main__':
+    main()
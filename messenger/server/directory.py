@@ -0,0 +1,57 @@
+import common.settings as settings
+
+
+class UserDirectory:
+    """Список пользователей сервера с номером версии.
+
+    Клиент присылает известную ему версию и получает ответ «не изменился», разницу
+    (добавленные и удалённые пользователи) или полный список. Полный список отдаётся
+    страницами по алфавиту: страница содержит курсор следующей, который клиент присылает
+    в следующем запросе. Закодированные ответы на первый запрос кешируются по версии
+    клиента и формату кадра до следующего изменения списка, поэтому одновременный вход
+    многих клиентов не обращается к базе.
+    """
+
+    def __init__(self, db, page_size=settings.USERS_PAGE_SIZE):
+        self.db = db
+        self.page_size = page_size
+        self.version = 0
+        self.frames = {}
+        self.reload()
+
+    def reload(self):
+        self.version = self.db.get_directory_version()
+        self.frames.clear()
+
+    def get_frame(self, known_version, frame_format, encode, cursor=None, limit=None):
+        """Кадр ответа для клиента с версией known_version, encode(data) кодирует его при промахе кеша"""
+        if not isinstance(limit, int) or not 0 < limit < self.page_size:
+            limit = self.page_size
+        if isinstance(cursor, str):
+            # продолжение полного списка, страницы после первой не кешируются
+            return encode(self._compose_page(cursor, limit))
+        if not isinstance(known_version, int) or known_version > self.version:
+            known_version = None
+        key = (known_version, limit, frame_format)
+        if (frame := self.frames.get(key)) is None:
+            frame = self.frames[key] = encode(self._compose_data(known_version, limit))
+        return frame
+
+    def _compose_data(self, known_version, limit):
+        if known_version == self.version:
+            return {settings.REQUEST_VERSION: self.version, settings.RESPONSE_STATUS: 304}
+        changes = self.db.get_directory_changes(known_version) if known_version is not None else None
+        if changes is None:
+            return self._compose_page(None, limit)
+        return {
+            settings.REQUEST_VERSION: self.version,
+            settings.REQUEST_ADDED: changes[0],
+            settings.REQUEST_REMOVED: changes[1]
+        }
+
+    def _compose_page(self, cursor, limit):
+        usernames, next_cursor = self.db.get_users_page(cursor, limit)
+        data = {settings.REQUEST_VERSION: self.version, settings.REQUEST_USERS: usernames}
+        if next_cursor is not None:
+            data[settings.REQUEST_CURSOR] = next_cursor
+        return data
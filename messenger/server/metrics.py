@@ -0,0 +1,210 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# имя: (тип, описание, имя метки)
+METRICS = {
+    'frames_in': ('counter', 'Принятые кадры', 'action'),
+    'frames_out': ('counter', 'Отправленные кадры', 'action'),
+    'bytes_in': ('counter', 'Принятые байты', None),
+    'bytes_out': ('counter', 'Байты, поставленные в исходящие очереди', None),
+    'connections_accepted': ('counter', 'Принятые подключения', None),
+    'connections_closed': ('counter', 'Закрытые подключения', None),
+    'slow_consumer_events': ('counter', 'Срабатывания ограничения исходящих очередей', 'event'),
+    'connections_open': ('gauge', 'Открытые подключения', None),
+    'users_online': ('gauge', 'Пользователи в сети', None),
+    'queued_frames': ('gauge', 'Кадры в исходящих очередях', None),
+    'queued_bytes': ('gauge', 'Байты в исходящих очередях', None),
+    'max_queued_bytes': ('gauge', 'Самая длинная исходящая очередь в байтах', None),
+    'request_seconds': ('histogram', 'Время обработки запроса', 'action'),
+    'db_commit_seconds': ('histogram', 'Время фиксации транзакции базы', None),
+}
+
+METRICS_PREFIX = 'msg_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# корзины гистограммы: до LINEAR_LIMIT мкс по одной на микросекунду, дальше каждый
+# интервал [2^k, 2^(k+1)) делится на SUB_BUCKETS равных частей (погрешность до 1/8)
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+LINEAR_LIMIT = SUB_BUCKETS * 2
+
+
+def bucket_index(micros):
+    if micros < LINEAR_LIMIT:
+        return max(micros, 0)
+    shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+    return LINEAR_LIMIT + (shift - 1) * SUB_BUCKETS + (micros >> shift) - SUB_BUCKETS
+
+
+def bucket_upper(index):
+    """Верхняя граница корзины в микросекундах (не включая её)"""
+    if index < LINEAR_LIMIT:
+        return index + 1
+    shift, sub = divmod(index - LINEAR_LIMIT, SUB_BUCKETS)
+    return (sub + SUB_BUCKETS + 1) << (shift + 1)
+
+
+class Histogram:
+    """Гистограмма времени в духе HDR: логарифмические корзины с линейным делением внутри.
+
+    Запись - одно вычисление индекса и одно увеличение счётчика, память растёт только
+    на реально встретившиеся корзины.
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bucket_index(int(seconds * 1000000))] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def buckets(self):
+        """[(верхняя граница в секундах, число значений не больше неё), ...]"""
+        result = []
+        total = 0
+        for index, count in sorted(self.counts.items()):
+            total += count
+            result.append((bucket_upper(index) / 1000000, total))
+        return result
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        # граница корзины не может быть больше самого большого записанного значения
+        rank = max(math.ceil(q * self.count), 1)
+        for upper, total in self.buckets():
+            if total >= rank:
+                return min(upper, self.max)
+        return self.max
+
+
+class Metrics:
+    """Счётчики, гистограммы и вычисляемые показатели сервера.
+
+    Запись идёт из сетевого потока без блокировок; чтение (HTTP, журнал) - из других потоков,
+    копии словарей в CPython делаются атомарно. Метки - только действия из таблицы
+    обработчиков и фиксированные имена, поэтому число рядов ограничено.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.histograms = {}
+        self.gauges = {}
+        self.last_summary = (time.monotonic(), {})
+
+    def inc(self, name, label=None, value=1):
+        self.counters[(name, label)] += value
+
+    def observe(self, name, label, seconds):
+        key = (name, label)
+        if (histogram := self.histograms.get(key)) is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.record(seconds)
+
+    def gauge(self, name, callback):
+        """callback возвращает число или словарь {метка: число}, вызывается при чтении"""
+        self.gauges[name] = callback
+
+    def collect(self):
+        """{имя: {метка: значение или Histogram}} по всем показателям"""
+        values = defaultdict(dict)
+        for (name, label), value in list(self.counters.items()):
+            values[name][label] = value
+        for (name, label), histogram in list(self.histograms.items()):
+            values[name][label] = histogram
+        for name, callback in list(self.gauges.items()):
+            value = callback()
+            values[name].update(value if isinstance(value, dict) else {None: value})
+        return values
+
+    def render(self):
+        """Текстовый формат Prometheus"""
+        lines = []
+        values = self.collect()
+        for name, (kind, description, label_name) in METRICS.items():
+            if name not in values:
+                continue
+            full_name = f'{METRICS_PREFIX}{name}'
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            if kind == 'counter':
+                full_name += '_total'
+            for label, value in sorted(values[name].items(), key=lambda item: item[0] or ''):
+                labels = f'{label_name}="{label}"' if label is not None and label_name else ''
+                if kind != 'histogram':
+                    lines.append(f'{full_name}{{{labels}}} {value}' if labels else f'{full_name} {value}')
+                    continue
+                prefix = f'{labels},' if labels else ''
+                for upper, total in value.buckets():
+                    lines.append(f'{full_name}_bucket{{{prefix}le="{upper:g}"}} {total}')
+                lines.append(f'{full_name}_bucket{{{prefix}le="+Inf"}} {value.count}')
+                suffix = f'{{{labels}}}' if labels else ''
+                lines.append(f'{full_name}_sum{suffix} {value.sum}')
+                lines.append(f'{full_name}_count{suffix} {value.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Строки для журнала: скорости с прошлой сводки, показатели и процентили времени"""
+        now = time.monotonic()
+        last_time, last_totals = self.last_summary
+        elapsed = max(now - last_time, 1e-9)
+        values = self.collect()
+        totals = {name: sum(values.get(name, {}).values()) for name in ('frames_in', 'frames_out', 'bytes_in', 'bytes_out')}
+        self.last_summary = (now, totals)
+
+        rates = ', '.join(f'{name} {total} ({(total - last_totals.get(name, 0)) / elapsed:.0f}/с)'
+                          for name, total in totals.items())
+        gauges = ', '.join(f'{name} {sum(values[name].values())}' for name in self.gauges if name in values)
+        lines = [rates, gauges]
+        for (name, label), histogram in sorted(list(self.histograms.items()), key=lambda item: (item[0][0], item[0][1] or '')):
+            lines.append(f'{name}{f"[{label}]" if label else ""}: n={histogram.count} '
+                         f'p50={histogram.percentile(0.5) * 1000:.3f} p99={histogram.percentile(0.99) * 1000:.3f} '
+                         f'p999={histogram.percentile(0.999) * 1000:.3f} мс')
+        return lines
+
+
+class MetricsServer:
+    """Локальный HTTP для Prometheus: GET /metrics отдаёт Metrics.render()"""
+
+    def __init__(self, metrics, port, address='127.0.0.1'):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] != '/metrics':
+                    handler.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', CONTENT_TYPE)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((address, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        metrics_thread = threading.Thread(target=self.httpd.serve_forever)
+        metrics_thread.daemon = True
+        metrics_thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class PresenceRegistry:
+    """Пользователи в сети: имя -> (ip, порт, время входа).
+
+    Меняется сетевым потоком (в режиме воркеров - потоком маршрутизатора мастера), читается
+    окном администратора и сокетом управления. Если задан snapshot, отдельный поток раз
+    в interval секунд передаёт ему текущий список, только когда тот изменился.
+    """
+
+    def __init__(self, snapshot=None, interval=0):
+        self.online = {}
+        self.lock = threading.Lock()
+        self.snapshot = snapshot
+        self.interval = interval
+        self.version = 0
+        self.saved_version = 0
+
+        if snapshot and interval > 0:
+            snapshot_thread = threading.Thread(target=self._run)
+            snapshot_thread.daemon = True
+            snapshot_thread.start()
+
+    def __len__(self):
+        return len(self.online)
+
+    def __contains__(self, account_name):
+        return account_name in self.online
+
+    def set_online(self, account_name, address, connected_at=None):
+        with self.lock:
+            self.online[account_name] = (address[0], address[1], connected_at or time.time())
+            self.version += 1
+
+    def set_offline(self, account_name):
+        with self.lock:
+            if self.online.pop(account_name, None):
+                self.version += 1
+
+    def items(self):
+        with self.lock:
+            return list(self.online.items())
+
+    def save(self):
+        with self.lock:
+            version = self.version
+            connections = list(self.online.items())
+        if version != self.saved_version:
+            self.snapshot(connections)
+            self.saved_version = version
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.save()
@@ -0,0 +1,81 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, pyqtSignal
+
+
+class ConnectionEvents(QObject):
+    """События подключения и отключения пользователей.
+
+    Сервер вызывает notify из сетевого потока (или потока маршрутизатора), сигналы доставляются
+    в поток окна администратора через очередь событий Qt.
+    """
+    connected = pyqtSignal(dict)
+    disconnected = pyqtSignal(str)
+
+    def notify(self, account_name, connection=None):
+        if connection:
+            self.connected.emit(connection)
+        else:
+            self.disconnected.emit(account_name)
+
+
+class ConnectionsTableModel(QAbstractTableModel):
+    """Таблица подключённых пользователей, которая меняется по одной строке"""
+    COLUMNS = [
+        ('username', 'Имя Клиента'),
+        ('time', 'Время подключения'),
+        ('ip', 'IP Адрес'),
+        ('port', 'Порт'),
+    ]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.row_by_name = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.rows[index.row()][self.COLUMNS[index.column()][0]]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][1]
+        return None
+
+    def fill(self, connections):
+        self.beginResetModel()
+        self.rows = []
+        self.row_by_name = {}
+        for connection in connections:
+            self.row_by_name[connection['username']] = len(self.rows)
+            self.rows.append(connection)
+        self.endResetModel()
+
+    def add(self, connection):
+        if (row := self.row_by_name.get(connection['username'])) is not None:
+            self.rows[row] = connection
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+            return
+        row = len(self.rows)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.row_by_name[connection['username']] = row
+        self.rows.append(connection)
+        self.endInsertRows()
+
+    def remove(self, username):
+        if (row := self.row_by_name.pop(username, None)) is None:
+            return
+        # на место удалённой строки встаёт последняя, чтобы не сдвигать индексы всех следующих строк
+        last = len(self.rows) - 1
+        if row != last:
+            self.rows[row] = self.rows[last]
+            self.row_by_name[self.rows[row]['username']] = row
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+        self.beginRemoveRows(QModelIndex(), last, last)
+        self.rows.pop()
+        self.endRemoveRows()
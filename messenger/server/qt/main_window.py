@@ -1,8 +1,10 @@
 import os
 from sys import argv
-from PyQt5.QtGui import QIcon, QStandardItemModel, QStandardItem
+from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QMainWindow, QApplication, QAction, qApp, QLabel, QTableView, QHeaderView
 
+from server.qt.connections_model import ConnectionsTableModel
+
 
 class MainWindow(QMainWindow):
 
@@ -46,6 +48,9 @@ class MainWindow(QMainWindow):
         self.connections_table.move(18, 90)
         self.connections_table.setFixedSize(764, 470)
         self.connections_table.setStyleSheet('font-size: 13px;')
+        self.connections_model = ConnectionsTableModel(self)
+        self.connections_table.setModel(self.connections_model)
+        self.connections_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
 
         self.show()
 
@@ -55,18 +60,7 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage(f'   {message}')
 
     def fill_table(self, clients):
-        clients_list = QStandardItemModel(self)
-        clients_list.setHorizontalHeaderLabels(['Имя Клиента', 'Время подключения', 'IP Адрес', 'Порт'])
-        for client in clients:
-            row = [QStandardItem(client[key]) for key in ['username', 'time', 'ip', 'port']]
-            clients_list.appendRow(row)
-        self.connections_table.setModel(clients_list)
-        header = self.connections_table.horizontalHeader()
-        header.setSectionResizeMode(0, QHeaderView.Stretch)
-        header.setSectionResizeMode(1, QHeaderView.Stretch)
-        header.setSectionResizeMode(2, QHeaderView.Stretch)
-        header.setSectionResizeMode(3, QHeaderView.Stretch)
-        # self.connections_table.resizeColumnsToContents()
+        self.connections_model.fill(clients)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,44 @@
+class RoomRegistry:
+    """Состав комнат группового чата в памяти сервера.
+
+    Загружается из базы при старте, изменения сервер сохраняет в ServerDB сам.
+    """
+
+    def __init__(self, rooms=None):
+        self.rooms = {name: set(members) for name, members in (rooms or {}).items()}
+
+    def __contains__(self, room_name):
+        return room_name in self.rooms
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def create(self, room_name, owner_name):
+        if room_name in self.rooms:
+            return False
+        self.rooms[room_name] = {owner_name}
+        return True
+
+    def join(self, room_name, account_name):
+        members = self.rooms.setdefault(room_name, set())
+        if account_name in members:
+            return False
+        members.add(account_name)
+        return True
+
+    def leave(self, room_name, account_name):
+        members = self.rooms.get(room_name)
+        if not members or account_name not in members:
+            return False
+        members.discard(account_name)
+        return True
+
+    def members(self, room_name):
+        return self.rooms.get(room_name, set())
+
+    def is_member(self, room_name, account_name):
+        return account_name in self.rooms.get(room_name, ())
+
+    def remove_user(self, account_name):
+        for members in self.rooms.values():
+            members.discard(account_name)
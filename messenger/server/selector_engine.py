@@ -0,0 +1,212 @@
+import selectors
+import socket
+import time
+from collections import deque
+from itertools import islice
+
+import common.settings as settings
+from server.connections import ClientConnection
+
+
+class SelectorEngine:
+    """Сетевой цикл сервера на selectors (epoll/kqueue, если доступны).
+
+    На запись сокет регистрируется только пока в очереди подключения есть неотправленные кадры,
+    поэтому медленный клиент не блокирует остальных и не отключается. Накопленные кадры
+    отправляются пачкой до write_batch штук одним вызовом sendmsg.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        # sendmsg принимает не больше IOV_MAX (1024 в Linux) буферов за вызов
+        self.write_batch = min(server.config['SETTINGS'].getint('write_batch', settings.MAX_WRITE_BATCH), 1024)
+        self.selector = selectors.DefaultSelector()
+        self.callbacks = deque()
+        self.periodic = []
+        self.waker, self.waker_trigger = socket.socketpair()
+        self.waker.setblocking(False)
+        self.waker_trigger.setblocking(False)
+        # у служебных сокетов в data пара (чтение, запись), у клиентских - ClientConnection
+        self.selector.register(self.waker, selectors.EVENT_READ, (self._run_callbacks, None))
+
+    def run(self):
+        listen_socket = self.server.sock
+        listen_socket.setblocking(False)
+        listen_socket.listen(settings.MAX_CONNECTIONS)
+        self.selector.register(listen_socket, selectors.EVENT_READ, (self._accept, None))
+        self.server.logger.info(f'Слушаем запросы от клиента ({type(self.selector).__name__})...')
+
+        try:
+            while True:
+                for key, mask in self.selector.select(self._run_periodic()):
+                    connection = key.data
+                    if not isinstance(connection, ClientConnection):
+                        reader, writer = connection
+                        if mask & selectors.EVENT_READ:
+                            reader()
+                        if mask & selectors.EVENT_WRITE and writer:
+                            writer()
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        self._read(connection)
+                    if mask & selectors.EVENT_WRITE and not connection.closed:
+                        self._write(connection)
+        except KeyboardInterrupt:
+            self.server._close()
+
+    def call_soon_threadsafe(self, callback, *args):
+        self.callbacks.append((callback, args))
+        try:
+            self.waker_trigger.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def call_every(self, interval, callback):
+        self.periodic.append([time.monotonic() + interval, interval, callback])
+
+    def _run_periodic(self):
+        """Запуск наступивших периодических вызовов, возвращает время ожидания до следующего"""
+        if not self.periodic:
+            return None
+        now = time.monotonic()
+        for timer in self.periodic:
+            if timer[0] <= now:
+                timer[0] = now + timer[1]
+                timer[2]()
+        return max(0, min(timer[0] for timer in self.periodic) - time.monotonic())
+
+    def _run_callbacks(self):
+        try:
+            while self.waker.recv(settings.MAX_PACKAGE_LENGTH):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self.callbacks:
+            callback, args = self.callbacks.popleft()
+            try:
+                callback(*args)
+            except Exception:
+                # вызовы из других потоков (результаты хеширования паролей) не должны останавливать цикл
+                self.server.logger.exception(f'Ошибка отложенного вызова {callback}')
+
+    def add_reader(self, sock, callback):
+        self.selector.register(sock, selectors.EVENT_READ, (callback, None))
+
+    def add_writer(self, sock, callback):
+        """callback вызывается, пока сокет готов к записи; сокет уже должен быть в add_reader"""
+        reader, _ = self.selector.get_key(sock).data
+        self.selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, (reader, callback))
+
+    def remove_writer(self, sock):
+        reader, _ = self.selector.get_key(sock).data
+        self.selector.modify(sock, selectors.EVENT_READ, (reader, None))
+
+    def want_write(self, connection):
+        if not connection.closed:
+            self._update_events(connection)
+
+    def pause_reading(self, connection):
+        self._update_events(connection)
+
+    def resume_reading(self, connection):
+        self._update_events(connection)
+
+    def _update_events(self, connection):
+        if connection.closed:
+            return
+        events = 0 if connection.paused else selectors.EVENT_READ
+        if connection.out_queue:
+            events |= selectors.EVENT_WRITE
+        try:
+            key = self.selector.get_key(connection.sock)
+        except KeyError:
+            key = None
+        if not events:
+            if key:
+                self.selector.unregister(connection.sock)
+        elif key is None:
+            self.selector.register(connection.sock, events, connection)
+        elif key.events != events:
+            self.selector.modify(connection.sock, events, connection)
+
+    def release(self, connection):
+        try:
+            self.selector.unregister(connection.sock)
+        except (KeyError, ValueError):
+            pass
+        connection.sock.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client_socket, client_address = self.server.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.server.logger.error(f'Ошибка подключения клиента: {e}')
+                return
+            client_socket.setblocking(False)
+            connection = ClientConnection(self, client_address, sock=client_socket)
+            self.selector.register(client_socket, selectors.EVENT_READ, connection)
+            self.server._add_client_socket(connection)
+
+    def _read(self, connection):
+        try:
+            data = connection.sock.recv(settings.MAX_PACKAGE_LENGTH)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = None
+        if not data:
+            self.server._close_client_socket(connection)
+            return
+
+        connection.last_activity = received_at = time.monotonic()
+        self.server.metrics.inc('bytes_in', None, len(data))
+        try:
+            messages = [self.server.decode_message(payload) for payload in connection.decoder.feed(data)]
+            decoded_at = time.monotonic()
+        except ValueError:
+            self.server.logger.error(f'Неверный запрос от клиента: {connection.address}')
+            self.server._close_client_socket(connection)
+            return
+        for message in messages:
+            if connection.closed:
+                break
+            try:
+                self.server._process_message_from_client(connection, message, received_at, decoded_at)
+            except Exception:
+                # ошибка в обработчике закрывает только это подключение, а не весь сетевой цикл
+                self.server.logger.exception(f'Ошибка обработки запроса клиента {connection.address}')
+                self.server._close_client_socket(connection)
+                break
+
+    def _write(self, connection):
+        out_queue = connection.out_queue
+        batch = list(islice(out_queue, self.write_batch))
+        try:
+            sent = self._send_batch(connection.sock, batch)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self.server._close_client_socket(connection)
+            return
+        connection.dequeued(sent)
+        for frame in batch:
+            if sent < len(frame):
+                # остаток частично отправленного кадра уйдёт при следующей готовности сокета
+                out_queue[0] = frame[sent:]
+                break
+            sent -= len(frame)
+            out_queue.popleft()
+        if not out_queue:
+            self._update_events(connection)
+        self.server.limiter.drained(connection)
+
+    @staticmethod
+    def _send_batch(sock, batch):
+        if len(batch) == 1:
+            return sock.send(batch[0])
+        if hasattr(sock, 'sendmsg'):
+            return sock.sendmsg(batch)
+        return sock.send(b''.join(batch))
@@ -1,6 +1,101 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, Text
+import logging
+import threading
+import time
+from sqlalchemy import event, create_engine, Column, Integer, String, ForeignKey, DateTime, Text, Boolean, UniqueConstraint, func
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship, backref
-from datetime import datetime
+from datetime import datetime, timedelta
+from common.settings import SERVER_LOGGER_NAME
+
+# период (сек) и порог (число сообщений) сброса накопленной статистики в базу
+STATS_FLUSH_INTERVAL = 1.0
+STATS_FLUSH_THRESHOLD = 1000
+
+# сколько сообщений хранится для одного пользователя не в сети и сколько они живут
+OFFLINE_MESSAGES_LIMIT = 1000
+OFFLINE_MESSAGE_TTL = timedelta(days=7)
+
+# сколько последних изменений списка пользователей хранится для разностной синхронизации клиентов
+DIRECTORY_CHANGES_LIMIT = 1000
+
+
+class MessageStats:
+    """Отложенная запись статистики сообщений.
+
+    Счётчики sent/received копятся в памяти и сбрасываются в таблицу users одной транзакцией
+    из отдельного потока по таймеру или при накоплении порога, поэтому обработка сообщений
+    не ждёт базу.
+    """
+
+    def __init__(self, session_factory, user_model, interval=STATS_FLUSH_INTERVAL, threshold=STATS_FLUSH_THRESHOLD):
+        self.session_factory = session_factory
+        self.User = user_model
+        self.interval = interval
+        self.threshold = threshold
+        self.pending = {}
+        self.pending_count = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+
+        self.writer = threading.Thread(target=self._run)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def add(self, sender_name, recipient_name):
+        self.add_many(sender_name, [recipient_name])
+
+    def add_many(self, sender_name, recipient_names):
+        with self.lock:
+            self.pending.setdefault(sender_name, [0, 0])[0] += 1
+            for recipient_name in recipient_names:
+                self.pending.setdefault(recipient_name, [0, 0])[1] += 1
+            self.pending_count += 1
+            if self.pending_count >= self.threshold:
+                self.wake.set()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                self.pending_count = 0
+            if not pending:
+                return
+            session = self.session_factory()
+            try:
+                for username, (sent, received) in pending.items():
+                    session.query(self.User).filter_by(username=username).update({
+                        self.User.sent: self.User.sent + sent,
+                        self.User.received: self.User.received + received,
+                    }, synchronize_session=False)
+                session.commit()
+            except Exception:
+                # несохранённые счётчики возвращаются в очередь и уйдут следующим сбросом
+                with self.lock:
+                    for username, (sent, received) in pending.items():
+                        counters = self.pending.setdefault(username, [0, 0])
+                        counters[0] += sent
+                        counters[1] += received
+                    self.pending_count += sum(sent for sent, _ in pending.values())
+                raise
+            finally:
+                session.close()
+
+    def close(self):
+        """Останавливает поток записи и сбрасывает остаток счётчиков"""
+        self.closed = True
+        self.wake.set()
+        self.writer.join()
+        self.flush()
+
+    def _run(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logging.getLogger(SERVER_LOGGER_NAME).exception('Ошибка записи статистики сообщений')
 
 
 class ServerDB:
@@ -78,17 +173,88 @@ class ServerDB:
             self.user_id = user_id
             self.contact_user_id = contact_user_id
 
-    def __init__(self, db_path):
+    class Room(Base):
+        __tablename__ = 'rooms'
+        id = Column(Integer, primary_key=True)
+        name = Column(String, unique=True)
+        owner_id = Column(Integer, ForeignKey('users.id'))
+        owner = relationship('User')
+        created_at = Column(DateTime)
+
+        def __init__(self, name, owner_id):
+            self.name = name
+            self.owner_id = owner_id
+            self.created_at = datetime.now()
+
+    class RoomMember(Base):
+        __tablename__ = 'room_members'
+        __table_args__ = (UniqueConstraint('room_id', 'user_id'),)
+        id = Column(Integer, primary_key=True)
+        room_id = Column(Integer, ForeignKey('rooms.id'), index=True)
+        room = relationship('Room', backref=backref('members'))
+        user_id = Column(Integer, ForeignKey('users.id'), index=True)
+        user = relationship('User')
+
+        def __init__(self, room_id, user_id):
+            self.room_id = room_id
+            self.user_id = user_id
+
+    class OfflineMessage(Base):
+        __tablename__ = 'offline_messages'
+        id = Column(Integer, primary_key=True)
+        recipient_id = Column(Integer, ForeignKey('users.id'), index=True)
+        sender = Column(String)
+        message = Column(Text)
+        created_at = Column(DateTime, index=True)
+
+        def __init__(self, recipient_id, sender, message):
+            self.recipient_id = recipient_id
+            self.sender = sender
+            self.message = message
+            self.created_at = datetime.now()
+
+    class UserChange(Base):
+        # номер последней записи журнала - версия списка пользователей
+        __tablename__ = 'user_changes'
+        id = Column(Integer, primary_key=True)
+        username = Column(String)
+        added = Column(Boolean)
+        created_at = Column(DateTime)
+
+        def __init__(self, username, added):
+            self.username = username
+            self.added = added
+            self.created_at = datetime.now()
+
+    def __init__(self, db_path, clear_connections=True, metrics=None):
         uri = f'sqlite:///{db_path}'
         self.engine = create_engine(uri, echo=False, pool_recycle=7200,
                                     connect_args={'check_same_thread': False})
         self.Base.metadata.create_all(self.engine)
 
         Session = sessionmaker(bind=self.engine)
+        self.session_factory = Session
         self.session = Session()
+        if metrics:
+            self._watch_commits(Session, metrics)
+        self.stats = MessageStats(Session, self.User)
 
-        self.session.query(self.Connection).delete()
-        self.session.commit()
+        if clear_connections:
+            self.session.query(self.Connection).delete()
+            self.session.commit()
+            self.purge_offline_messages()
+
+    @staticmethod
+    def _watch_commits(Session, metrics):
+        # время считается во всех сессиях фабрики, включая потоки статистики и снимков подключений
+        @event.listens_for(Session, 'before_commit')
+        def before_commit(session):
+            session.info['commit_started'] = time.perf_counter()
+
+        @event.listens_for(Session, 'after_commit')
+        def after_commit(session):
+            if (started := session.info.pop('commit_started', None)) is not None:
+                metrics.observe('db_commit_seconds', None, time.perf_counter() - started)
 
     def user_login(self, username, password_hash, ip, port):
         user = self.get_user_by_name(username)
@@ -96,42 +262,66 @@ class ServerDB:
             return f'Неверное имя пользователя.'
         if user.password_hash != password_hash:
             return f'Неверный пароль.'
-        user.last_connection_time = datetime.now()
-
-        connection = self.Connection(user.id, ip, port, datetime.now())
-        self.session.add(connection)
+        self._add_authorization(user, ip, port)
+        return True
 
-        history = self.Authorization(user.id, ip, port, datetime.now())
-        self.session.add(history)
+    def user_resume(self, username, ip, port):
+        if user := self.get_user_by_name(username):
+            self._add_authorization(user, ip, port)
 
+    def _add_authorization(self, user, ip, port):
+        # кто сейчас в сети, сервер держит в памяти, в базу пишется только история входов
+        user.last_connection_time = datetime.now()
+        self.session.add(self.Authorization(user.id, ip, port, datetime.now()))
         self.session.commit()
-        return True
 
-    def user_logout(self, username):
-        # не работает в один запрос (почему? all() с таким фильтром работает)
-        # self.session.query(self.Online).filter(self.Online.user.has(username=username)).delete()
+    def process_message(self, sender_name, recipient_name):
+        self.stats.add(sender_name, recipient_name)
 
-        # так работает, но получается тоже 2 запроса
-        # connection = self.session.query(self.Connection).filter(self.Connection.user.has(username=username)).first()
-        # self.session.delete(connection)
+    def process_room_message(self, sender_name, recipient_names):
+        self.stats.add_many(sender_name, recipient_names)
 
-        if user := self.get_user_by_name(username):
-            self.session.query(self.Connection).filter_by(user_id=user.id).delete()
-            self.session.commit()
+    def flush_stats(self):
+        self.stats.flush()
 
-    def process_message(self, sender_name, recipient_name):
-        sender = self.get_user_by_name(sender_name)
-        recipient = self.get_user_by_name(recipient_name)
-        sender.sent += 1
-        recipient.received += 1
-        self.session.commit()
+    def close_stats(self):
+        self.stats.close()
 
     def get_users(self):
-        return self.session.query(self.User).all()
+        # счётчики обновляются потоком статистики в другой сессии
+        return self.session.query(self.User).populate_existing().all()
+
+    def get_users_page(self, cursor=None, limit=100):
+        """Страница имён пользователей по алфавиту после cursor и курсор следующей страницы или None"""
+        query = self.session.query(self.User.username)
+        if cursor is not None:
+            query = query.filter(self.User.username > cursor)
+        usernames = [row.username for row in query.order_by(self.User.username).limit(limit + 1)]
+        if len(usernames) > limit:
+            return usernames[:limit], usernames[limit - 1]
+        return usernames, None
 
     def get_connections(self):
         return self.session.query(self.Connection).all()
 
+    def save_connections(self, connections):
+        """Заменяет таблицу подключений снимком [(имя, (ip, порт, время входа)), ...] одной транзакцией.
+
+        Вызывается из потока снимков, поэтому работает в своей сессии.
+        """
+        session = self.session_factory()
+        try:
+            user_ids = dict(session.query(self.User.username, self.User.id).filter(
+                self.User.username.in_([username for username, _ in connections])))
+            session.query(self.Connection).delete()
+            session.add_all([
+                self.Connection(user_ids[username], ip, port, datetime.fromtimestamp(connected_at))
+                for username, (ip, port, connected_at) in connections if username in user_ids
+            ])
+            session.commit()
+        finally:
+            session.close()
+
     def get_authorizations(self, username=None):
         query = self.session.query(self.Authorization)
         if username:
@@ -165,13 +355,89 @@ class ServerDB:
             self.session.delete(contact)
             self.session.commit()
 
+    def save_offline_message(self, sender_name, recipient_name, message):
+        if not (recipient := self.get_user_by_name(recipient_name)):
+            return False
+        self.session.add(self.OfflineMessage(recipient.id, sender_name, message))
+        self.session.flush()
+        # при превышении лимита удаляются самые старые сообщения
+        overflow = self.session.query(self.OfflineMessage.id).filter_by(recipient_id=recipient.id).\
+            order_by(self.OfflineMessage.id.desc()).offset(OFFLINE_MESSAGES_LIMIT).first()
+        if overflow:
+            self.session.query(self.OfflineMessage).filter(
+                self.OfflineMessage.recipient_id == recipient.id,
+                self.OfflineMessage.id <= overflow.id
+            ).delete(synchronize_session=False)
+        self.session.commit()
+        return True
+
+    def pop_offline_messages(self, recipient_name):
+        if not (recipient := self.get_user_by_name(recipient_name)):
+            return []
+        query = self.session.query(self.OfflineMessage).filter(
+            self.OfflineMessage.recipient_id == recipient.id,
+            self.OfflineMessage.created_at >= datetime.now() - OFFLINE_MESSAGE_TTL
+        ).order_by(self.OfflineMessage.id)
+        messages = [(item.sender, item.message, item.created_at.timestamp()) for item in query]
+        # обычный вход без отложенных сообщений не пишет в базу; устаревшие удаляет purge_offline_messages
+        if not messages:
+            return messages
+        self.session.query(self.OfflineMessage).filter_by(recipient_id=recipient.id).delete(synchronize_session=False)
+        self.session.commit()
+        return messages
+
+    def purge_offline_messages(self):
+        self.session.query(self.OfflineMessage).filter(
+            self.OfflineMessage.created_at < datetime.now() - OFFLINE_MESSAGE_TTL
+        ).delete(synchronize_session=False)
+        self.session.commit()
+
+    def get_rooms(self):
+        rooms = {room.name: set() for room in self.session.query(self.Room)}
+        query = self.session.query(self.Room.name, self.User.username).\
+            join(self.RoomMember, self.RoomMember.room_id == self.Room.id).\
+            join(self.User, self.User.id == self.RoomMember.user_id)
+        for room_name, username in query:
+            rooms[room_name].add(username)
+        return rooms
+
+    def add_room(self, room_name, owner_name):
+        owner = self.get_user_by_name(owner_name)
+        if not owner or self.session.query(self.Room).filter_by(name=room_name).count():
+            return False
+        room = self.Room(room_name, owner.id)
+        self.session.add(room)
+        self.session.flush()
+        self.session.add(self.RoomMember(room.id, owner.id))
+        self.session.commit()
+        return True
+
+    def add_room_member(self, room_name, username):
+        room = self.session.query(self.Room).filter_by(name=room_name).first()
+        user = self.get_user_by_name(username)
+        if not (room and user) or self.session.query(self.RoomMember).\
+                filter_by(room_id=room.id, user_id=user.id).count():
+            return
+        self.session.add(self.RoomMember(room.id, user.id))
+        self.session.commit()
+
+    def del_room_member(self, room_name, username):
+        room = self.session.query(self.Room).filter_by(name=room_name).first()
+        user = self.get_user_by_name(username)
+        if room and user:
+            self.session.query(self.RoomMember).filter_by(room_id=room.id, user_id=user.id).delete()
+            self.session.commit()
+
     def del_user(self, username):
         if user := self.get_user_by_name(username):
+            self.session.query(self.RoomMember).filter_by(user_id=user.id).delete()
+            self.session.query(self.OfflineMessage).filter_by(recipient_id=user.id).delete()
             self.session.query(self.Authorization).filter_by(user_id=user.id).delete()
             self.session.query(self.Connection).filter_by(user_id=user.id).delete()
             self.session.query(self.Contact).filter_by(user_id=user.id).delete()
             self.session.query(self.Contact).filter_by(contact_user_id=user.id).delete()
             self.session.query(self.User).filter_by(id=user.id).delete()
+            self._log_user_changes([username], False)
             self.session.commit()
             return True
         return False
@@ -181,7 +447,42 @@ class ServerDB:
             return
         user = self.User(username, password_hash)
         self.session.add(user)
+        self._log_user_changes([username], True)
+        self.session.commit()
+
+    def add_users(self, users):
+        """Добавляет пользователей [(имя, хеш пароля), ...] одной транзакцией, существующие пропускаются.
+
+        Возвращает число добавленных.
+        """
+        existing = {row.username for row in self.session.query(self.User.username)}
+        added = {username: password_hash for username, password_hash in users if username not in existing}
+        self.session.add_all([self.User(username, password_hash) for username, password_hash in added.items()])
+        self._log_user_changes(added, True)
         self.session.commit()
+        return len(added)
+
+    def _log_user_changes(self, usernames, added):
+        self.session.add_all([self.UserChange(username, added) for username in usernames])
+        self.session.flush()
+        self.session.query(self.UserChange).filter(
+            self.UserChange.id <= self.get_directory_version() - DIRECTORY_CHANGES_LIMIT
+        ).delete(synchronize_session=False)
+
+    def get_directory_version(self):
+        return self.session.query(func.max(self.UserChange.id)).scalar() or 0
+
+    def get_directory_changes(self, version):
+        """Добавленные и удалённые после версии version пользователи или None, если журнал их уже не хранит"""
+        first = self.session.query(func.min(self.UserChange.id)).scalar()
+        if first is not None and version < first - 1:
+            return None
+        changes = {}
+        for change in self.session.query(self.UserChange).filter(self.UserChange.id > version).\
+                order_by(self.UserChange.id):
+            changes[change.username] = change.added
+        return (sorted(name for name, added in changes.items() if added),
+                sorted(name for name, added in changes.items() if not added))
 
     def get_user_by_name(self, username):
         return self.session.query(self.User).filter_by(username=username).first()
@@ -205,7 +506,7 @@ if __name__ == '__main__':
     db.user_login('user2', '192.168.1.5', 7777)
     db.user_login('user3', '192.168.1.6', 4564)
 
-    db.user_logout('user1')
+    db.save_connections([('user2', ('192.168.1.5', 7777, 0)), ('user3', ('192.168.1.6', 4564, 0))])
 
     print('\n====== all users =======')
     for db_user in db.get_users():
@@ -0,0 +1,113 @@
+import secrets
+import time
+from collections import deque
+
+# сколько секунд отключённая сессия ждёт возобновления и сколько последних кадров она хранит
+RESUME_TOKEN_TTL = 60
+RESUME_BUFFER_SIZE = 1000
+
+
+class Session:
+    """Сессия пользователя, которую можно возобновить после обрыва соединения.
+
+    Кадры, отправленные после ответа на presence, нумеруются по порядку (seq), последние из них
+    хранятся в буфере теми же байтами, что ушли в сокет. Клиент считает полученные кадры и при
+    переподключении присылает свой счётчик, сервер досылает только недостающие кадры.
+    """
+    __slots__ = ('token', 'account_name', 'codec', 'compression', 'seq', 'buffer', 'connection',
+                 'expires_at', 'broken')
+
+    def __init__(self, connection, buffer_size=RESUME_BUFFER_SIZE):
+        self.token = secrets.token_urlsafe(24)
+        self.account_name = connection.account_name
+        self.codec = connection.codec
+        self.compression = connection.compression
+        self.seq = 0
+        self.buffer = deque(maxlen=buffer_size)
+        self.connection = connection
+        self.expires_at = None
+        # выброшенные из очереди кадры (политика drop_oldest) ломают нумерацию, такую сессию не возобновить
+        self.broken = False
+
+    def record(self, frame):
+        self.seq += 1
+        self.buffer.append(frame)
+
+    def frames_after(self, seq):
+        missing = self.seq - seq
+        if missing < 0 or missing > len(self.buffer):
+            return None
+        return list(self.buffer)[len(self.buffer) - missing:]
+
+
+class SessionStore:
+    """Возобновляемые сессии сервера по токену, не больше одной на пользователя"""
+
+    def __init__(self, ttl=RESUME_TOKEN_TTL, buffer_size=RESUME_BUFFER_SIZE):
+        self.ttl = ttl
+        self.buffer_size = buffer_size
+        self.sessions = {}
+        self.by_name = {}
+        # отключённые сессии в порядке истечения срока (ttl одинаковый, поэтому очередь упорядочена)
+        self.expiring = deque()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def create(self, connection):
+        """Новая сессия пользователя, к подключению её привязывает сервер после ответа на presence"""
+        self.expire()
+        if previous := self.by_name.get(connection.account_name):
+            self._remove(previous)
+        session = Session(connection, self.buffer_size)
+        self.sessions[session.token] = session
+        self.by_name[session.account_name] = session
+        return session
+
+    def detach(self, connection):
+        if not (session := connection.session):
+            return
+        connection.session = None
+        if session.broken:
+            self._remove(session)
+        elif session.connection is connection:
+            session.connection = None
+            session.expires_at = time.monotonic() + self.ttl
+            self.expiring.append((session.expires_at, session))
+
+    def discard(self, connection):
+        if session := connection.session:
+            connection.session = None
+            self._remove(session)
+
+    def attach(self, session, connection):
+        # кодек и сжатие согласуются при входе уже после создания сессии, запоминаются при привязке
+        session.codec, session.compression = connection.codec, connection.compression
+        session.connection = connection
+        session.expires_at = None
+        connection.session = session
+
+    def resume(self, token, account_name, seq):
+        """Кадры, которых не хватает клиенту, или None, если сессию нельзя возобновить"""
+        self.expire()
+        session = self.sessions.get(token)
+        if not session or session.broken or session.account_name != account_name:
+            return None, None
+        frames = session.frames_after(seq)
+        if frames is None:
+            self._remove(session)
+            return None, None
+        return session, frames
+
+    def expire(self):
+        now = time.monotonic()
+        while self.expiring and self.expiring[0][0] < now:
+            expires_at, session = self.expiring.popleft()
+            # сессия могла быть возобновлена и снова отключена, тогда у неё новый срок
+            if session.expires_at == expires_at:
+                self._remove(session)
+
+    def _remove(self, session):
+        self.sessions.pop(session.token, None)
+        if self.by_name.get(session.account_name) is session:
+            del self.by_name[session.account_name]
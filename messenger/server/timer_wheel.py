@@ -0,0 +1,49 @@
+import math
+
+
+class TimerWheel:
+    """Хешированное колесо таймеров.
+
+    Таймер попадает в ячейку по номеру тика срабатывания, постановка и отмена стоят O(1),
+    за один тик (advance) просматривается только одна ячейка, поэтому стоимость не растёт
+    с общим числом таймеров. Таймеры дальше одного оборота колеса ждут нужное число оборотов.
+    """
+
+    def __init__(self, tick=1.0, size=128):
+        self.tick = tick
+        self.slots = [{} for _ in range(size)]
+        self.position = 0
+        self.timers = {}
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def schedule(self, key, delay, callback):
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self.position + ticks) % len(self.slots)
+        self.slots[slot][key] = [(ticks - 1) // len(self.slots), callback]
+        self.timers[key] = slot
+
+    def cancel(self, key):
+        slot = self.timers.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self):
+        self.position = (self.position + 1) % len(self.slots)
+        slot = self.slots[self.position]
+        expired = []
+        for key, timer in slot.items():
+            if timer[0]:
+                timer[0] -= 1
+            else:
+                expired.append((key, timer[1]))
+        for key, callback in expired:
+            del slot[key]
+            del self.timers[key]
+        for key, callback in expired:
+            callback(key)
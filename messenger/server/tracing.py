@@ -0,0 +1,92 @@
+import random
+import time
+
+# этапы обработки запроса в порядке прохождения
+STAGE_RECEIVE = 'receive'
+STAGE_DECODE = 'decode'
+STAGE_DISPATCH = 'dispatch'
+STAGE_DB = 'db'
+STAGE_ENQUEUE = 'enqueue'
+STAGE_SEND = 'send'
+
+# исходы кадров, которые так и не ушли клиенту
+OUTCOME_DROPPED = 'dropped'
+OUTCOME_CLOSED = 'closed'
+
+
+class Trace:
+    """Отметки времени (time.monotonic) одного запроса по этапам обработки"""
+    __slots__ = ('tracer', 'action', 'account_name', 'stamps', 'pending', 'dispatched', 'outcome')
+
+    def __init__(self, tracer, action, account_name, received_at, decoded_at):
+        self.tracer = tracer
+        self.action = action
+        self.account_name = account_name
+        self.stamps = [(STAGE_RECEIVE, received_at), (STAGE_DECODE, decoded_at)]
+        # сколько поставленных в очереди кадров ещё не отправлено
+        self.pending = 0
+        self.dispatched = False
+        self.outcome = None
+
+    def stamp(self, stage):
+        self.stamps.append((stage, time.monotonic()))
+
+    def enqueued(self, connection):
+        self.stamp(f'{STAGE_ENQUEUE} {connection.account_name}')
+        self.pending += 1
+
+    def sent(self, connection):
+        self.stamp(f'{STAGE_SEND} {connection.account_name}')
+        self._frame_done()
+
+    def abandoned(self, connection, outcome):
+        """Кадр не будет отправлен: выброшен из очереди или подключение закрыто"""
+        self.stamp(f'{outcome} {connection.account_name}')
+        self.outcome = outcome
+        self._frame_done()
+
+    def _frame_done(self):
+        self.pending -= 1
+        if self.dispatched and not self.pending:
+            self.tracer.finish(self)
+
+    def done(self):
+        """Обработчик запроса завершился, трасса закрывается после отправки всех её кадров"""
+        self.dispatched = True
+        if not self.pending:
+            self.tracer.finish(self)
+
+    @property
+    def duration(self):
+        return self.stamps[-1][1] - self.stamps[0][1]
+
+    def format(self):
+        started = self.stamps[0][1]
+        stages = ' '.join(f'{stage} +{(stamp - started) * 1000:.3f}' for stage, stamp in self.stamps)
+        outcome = f' ({self.outcome})' if self.outcome else ''
+        return f'{self.action} {self.account_name}: {self.duration * 1000:.3f} мс{outcome} [{stages}]'
+
+
+class Tracer:
+    """Выборочная трассировка запросов.
+
+    Трассируется доля sample_rate запросов, в журнал трасс пишутся только те, что шли
+    дольше threshold секунд от чтения из сокета до отправки последнего ответного кадра,
+    и все, у которых кадр не дошёл до клиента. При sample_rate = 0 стоимость на запрос - одна проверка.
+    """
+
+    def __init__(self, logger, sample_rate=0.0, threshold=0.0):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+
+    def start(self, action, account_name, received_at, decoded_at):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        trace = Trace(self, action, account_name, received_at, decoded_at)
+        trace.stamp(STAGE_DISPATCH)
+        return trace
+
+    def finish(self, trace):
+        if trace.outcome or trace.duration >= self.threshold:
+            self.logger.info(trace.format())
@@ -0,0 +1,330 @@
+import os
+import selectors
+import socket
+import tempfile
+import threading
+from collections import deque
+
+import common.settings as settings
+from common.tcp_socket import TCPSocket, FrameDecoder
+
+# действия внутреннего протокола между воркерами и маршрутизатором
+ROUTER_HELLO = 'hello'
+ROUTER_ONLINE = 'online'
+ROUTER_OFFLINE = 'offline'
+ROUTER_ROUTE = 'route'
+ROUTER_FAN_OUT = 'fan_out'
+ROUTER_ROOM = 'room'
+ROUTER_DIRECTORY = 'directory'
+REQUEST_WORKER = 'worker'
+REQUEST_ADDRESS = 'address'
+
+
+def get_router_path(port):
+    return os.path.join(tempfile.gettempdir(), f'msg_server_{port}.sock')
+
+
+def compose_router_message(action, data):
+    return TCPSocket.encode_message({settings.REQUEST_ACTION: action, settings.REQUEST_DATA: data})
+
+
+class RouterPeer:
+    """Подключение воркера к маршрутизатору"""
+    __slots__ = ('sock', 'decoder', 'out_buffer', 'worker_id')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = FrameDecoder()
+        self.out_buffer = bytearray()
+        self.worker_id = None
+
+
+class PresenceRouter:
+    """Маршрутизатор мастер-процесса.
+
+    Знает, какой воркер держит подключение каждого пользователя, рассылает воркерам изменения
+    присутствия и пересылает p2p сообщения воркеру получателя. Работает в отдельном потоке
+    на unix-сокете.
+    """
+
+    def __init__(self, path, logger, on_presence=None):
+        self.path = path
+        self.logger = logger
+        self.on_presence = on_presence
+        self.owners = {}
+        self.peers = set()
+        self.selector = selectors.DefaultSelector()
+        self.sock = None
+        # вызовы из других потоков мастера выполняются в потоке маршрутизатора
+        self.callbacks = deque()
+        self.waker, self.waker_trigger = socket.socketpair()
+        self.waker.setblocking(False)
+        self.waker_trigger.setblocking(False)
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(settings.MAX_CONNECTIONS)
+        self.sock.setblocking(False)
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.selector.register(self.waker, selectors.EVENT_READ, self._run_callbacks)
+
+        router_thread = threading.Thread(target=self._run)
+        router_thread.daemon = True
+        router_thread.start()
+
+    def _run(self):
+        while True:
+            for key, mask in self.selector.select():
+                if key.data is None:
+                    self._accept()
+                    continue
+                if not isinstance(key.data, RouterPeer):
+                    key.data()
+                    continue
+                peer = key.data
+                if mask & selectors.EVENT_READ:
+                    self._read(peer)
+                if mask & selectors.EVENT_WRITE and peer in self.peers:
+                    self._write(peer)
+
+    def directory_changed(self, deleted=None):
+        """Список пользователей изменён в мастере, воркеры перечитывают его версию.
+
+        Удалённого пользователя deleted воркеры убирают из комнат.
+        """
+        data = {settings.REQUEST_USERNAME: deleted} if deleted else {}
+        self._call_soon_threadsafe(self._send_all, compose_router_message(ROUTER_DIRECTORY, data))
+
+    def _call_soon_threadsafe(self, callback, *args):
+        self.callbacks.append((callback, args))
+        try:
+            self.waker_trigger.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _run_callbacks(self):
+        try:
+            while self.waker.recv(settings.MAX_PACKAGE_LENGTH):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self.callbacks:
+            callback, args = self.callbacks.popleft()
+            callback(*args)
+
+    def _send_all(self, frame):
+        for peer in self.peers:
+            self._send(peer, frame)
+
+    def _accept(self):
+        try:
+            peer_socket, _ = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        peer_socket.setblocking(False)
+        peer = RouterPeer(peer_socket)
+        self.peers.add(peer)
+        self.selector.register(peer_socket, selectors.EVENT_READ, peer)
+
+    def _read(self, peer):
+        try:
+            data = peer.sock.recv(settings.MAX_PACKAGE_LENGTH)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = None
+        if not data:
+            self._drop(peer)
+            return
+        try:
+            messages = [TCPSocket.decode_message(payload) for payload in peer.decoder.feed(data)]
+        except ValueError:
+            self.logger.error(f'Неверное сообщение от воркера {peer.worker_id}')
+            self._drop(peer)
+            return
+        for message in messages:
+            self._process(peer, message[settings.REQUEST_ACTION], message[settings.REQUEST_DATA])
+
+    def _process(self, peer, action, data):
+        if action == ROUTER_HELLO:
+            peer.worker_id = data[REQUEST_WORKER]
+            self.logger.info(f'Воркер {peer.worker_id} подключён к маршрутизатору')
+            for account_name in self.owners:
+                self._send(peer, compose_router_message(ROUTER_ONLINE, {settings.REQUEST_USERNAME: account_name}))
+
+        elif action == ROUTER_ONLINE:
+            self.owners[data[settings.REQUEST_USERNAME]] = peer
+            self._broadcast(peer, action, data)
+
+        elif action == ROUTER_OFFLINE:
+            if self.owners.get(data[settings.REQUEST_USERNAME]) is peer:
+                del self.owners[data[settings.REQUEST_USERNAME]]
+                self._broadcast(peer, action, data)
+
+        elif action == ROUTER_ROUTE:
+            # если получатель уже ни у кого, сообщение возвращается отправителю, тот сохранит его
+            owner = self.owners.get(data[settings.REQUEST_RECIPIENT], peer)
+            self._send(owner, compose_router_message(action, data))
+
+        elif action == ROUTER_FAN_OUT:
+            # получатели группируются по воркерам, каждому воркеру уходит один кадр
+            recipients_by_owner = {}
+            for recipient in data[settings.REQUEST_USERS]:
+                if owner := self.owners.get(recipient):
+                    recipients_by_owner.setdefault(owner, []).append(recipient)
+            for owner, recipients in recipients_by_owner.items():
+                self._send(owner, compose_router_message(action, {
+                    settings.REQUEST_USERS: recipients,
+                    settings.REQUEST_MESSAGE: data[settings.REQUEST_MESSAGE]
+                }))
+
+        elif action == ROUTER_ROOM:
+            frame = compose_router_message(action, data)
+            for other in self.peers:
+                if other is not peer:
+                    self._send(other, frame)
+
+    def _broadcast(self, sender, action, data):
+        frame = compose_router_message(action, data)
+        for peer in self.peers:
+            if peer is not sender:
+                self._send(peer, frame)
+        if self.on_presence:
+            self.on_presence(data[settings.REQUEST_USERNAME], action == ROUTER_ONLINE, data.get(REQUEST_ADDRESS))
+
+    def _send(self, peer, frame):
+        if not peer.out_buffer:
+            self.selector.modify(peer.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, peer)
+        peer.out_buffer += frame
+
+    def _write(self, peer):
+        try:
+            sent = peer.sock.send(peer.out_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._drop(peer)
+            return
+        del peer.out_buffer[:sent]
+        if not peer.out_buffer:
+            self.selector.modify(peer.sock, selectors.EVENT_READ, peer)
+
+    def _drop(self, peer):
+        self.logger.error(f'Воркер {peer.worker_id} отключился от маршрутизатора')
+        self.peers.discard(peer)
+        self.selector.unregister(peer.sock)
+        peer.sock.close()
+        for account_name in [name for name, owner in self.owners.items() if owner is peer]:
+            del self.owners[account_name]
+            self._broadcast(peer, ROUTER_OFFLINE, {settings.REQUEST_USERNAME: account_name})
+
+
+class WorkerLink:
+    """Связь процесса-воркера с маршрутизатором мастера.
+
+    Хранит множество пользователей, подключённых к другим воркерам. Исходящие кадры копятся
+    в out_buffer и отправляются сетевым циклом воркера по готовности сокета к записи.
+    """
+
+    def __init__(self, server, worker_id, path):
+        self.server = server
+        self.worker_id = worker_id
+        self.remote = set()
+        self.decoder = FrameDecoder()
+        self.out_buffer = bytearray()
+        self.engine = None
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.sock.setblocking(False)
+        self._send(ROUTER_HELLO, {REQUEST_WORKER: worker_id})
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.add_reader(self.sock, self._read)
+        if self.out_buffer:
+            engine.add_writer(self.sock, self._write)
+
+    def is_online(self, account_name):
+        return account_name in self.remote
+
+    def online(self, account_name, address=None):
+        data = {settings.REQUEST_USERNAME: account_name}
+        if address:
+            # адрес клиента нужен мастеру только для окна администратора
+            data[REQUEST_ADDRESS] = list(address[:2])
+        self._send(ROUTER_ONLINE, data)
+
+    def offline(self, account_name):
+        self._send(ROUTER_OFFLINE, {settings.REQUEST_USERNAME: account_name})
+
+    def route(self, recipient, message):
+        self._send(ROUTER_ROUTE, {settings.REQUEST_RECIPIENT: recipient, settings.REQUEST_MESSAGE: message})
+
+    def fan_out(self, recipients, message):
+        self._send(ROUTER_FAN_OUT, {settings.REQUEST_USERS: recipients, settings.REQUEST_MESSAGE: message})
+
+    def room_changed(self, room_name, account_name, joined):
+        self._send(ROUTER_ROOM, {settings.REQUEST_ROOM: room_name, settings.REQUEST_USERNAME: account_name,
+                                 settings.REQUEST_STATUS: joined})
+
+    def _send(self, action, data):
+        if not self.out_buffer and self.engine:
+            self.engine.add_writer(self.sock, self._write)
+        self.out_buffer += compose_router_message(action, data)
+
+    def _write(self):
+        try:
+            sent = self.sock.send(self.out_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._lost_router()
+            return
+        del self.out_buffer[:sent]
+        if not self.out_buffer:
+            self.engine.remove_writer(self.sock)
+
+    def _lost_router(self):
+        self.server.logger.critical(f'Воркер {self.worker_id} потерял связь с маршрутизатором.')
+        self.server._close()
+
+    def _deliver(self, recipient, message):
+        if self.server.connections.get_by_name(recipient):
+            self.server._send_to(recipient, message)
+            return
+        # получатель отключился, пока сообщение шло через маршрутизатор: как и для локального
+        # получателя не в сети, сообщение сохраняется до его следующего входа
+        data = message[settings.REQUEST_DATA]
+        self.server.db.save_offline_message(data[settings.REQUEST_SENDER], recipient, data[settings.REQUEST_MESSAGE])
+
+    def _read(self):
+        try:
+            data = self.sock.recv(settings.MAX_PACKAGE_LENGTH)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = None
+        if not data:
+            self._lost_router()
+            return
+        for payload in self.decoder.feed(data):
+            message = TCPSocket.decode_message(payload)
+            router_data = message[settings.REQUEST_DATA]
+            if message[settings.REQUEST_ACTION] == ROUTER_ONLINE:
+                self.remote.add(router_data[settings.REQUEST_USERNAME])
+            elif message[settings.REQUEST_ACTION] == ROUTER_OFFLINE:
+                self.remote.discard(router_data[settings.REQUEST_USERNAME])
+            elif message[settings.REQUEST_ACTION] == ROUTER_ROUTE:
+                self._deliver(router_data[settings.REQUEST_RECIPIENT], router_data[settings.REQUEST_MESSAGE])
+            elif message[settings.REQUEST_ACTION] == ROUTER_FAN_OUT:
+                self.server._fan_out(router_data[settings.REQUEST_USERS], router_data[settings.REQUEST_MESSAGE])
+            elif message[settings.REQUEST_ACTION] == ROUTER_DIRECTORY:
+                self.server._reload_directory(router_data.get(settings.REQUEST_USERNAME))
+            elif message[settings.REQUEST_ACTION] == ROUTER_ROOM:
+                if router_data[settings.REQUEST_STATUS]:
+                    self.server.rooms.join(router_data[settings.REQUEST_ROOM], router_data[settings.REQUEST_USERNAME])
+                else:
+                    self.server.rooms.leave(router_data[settings.REQUEST_ROOM], router_data[settings.REQUEST_USERNAME])
@@ -0,0 +1,78 @@
+import os
+import sys
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from common.tcp_socket import TCPSocket
+from server.async_engine import AsyncEngine, ClientProtocol
+
+
+class TestAsyncEngine(TestCase):
+    def setUp(self):
+        self.server = mock.Mock()
+        self.server.config = {'SETTINGS': mock.Mock(getint=mock.Mock(return_value=2))}
+        self.server.decode_message = TCPSocket.decode_message
+        self.engine = AsyncEngine(self.server)
+        self.engine.loop = mock.Mock()
+        self.transport = mock.Mock()
+        self.transport.get_extra_info.return_value = ('127.0.0.1', 50001)
+        self.protocol = ClientProtocol(self.engine)
+        self.protocol.connection_made(self.transport)
+        self.connection = self.protocol.connection
+
+    def test_connection_made(self):
+        """Новое подключение передаётся серверу"""
+        self.server._add_client_socket.assert_called_once_with(self.connection)
+        self.assertIs(self.connection.transport, self.transport)
+
+    def test_data_received(self):
+        """Все запросы пачки передаются серверу по порядку, в том числе кадр, пришедший частями"""
+        frame = TCPSocket.encode_message({'action': 'ping'})
+        self.protocol.data_received(frame * 2 + frame[:3])
+        self.assertEqual(self.server._process_message_from_client.call_count, 2)
+        self.protocol.data_received(frame[3:])
+        self.assertEqual(self.server._process_message_from_client.call_count, 3)
+        self.server._close_client_socket.assert_not_called()
+
+    def test_data_received_error(self):
+        """Неверный кадр закрывает подключение без обработки запросов"""
+        self.protocol.data_received(b'\xff' * 8)
+        self.server._process_message_from_client.assert_not_called()
+        self.server._close_client_socket.assert_called_once_with(self.connection)
+
+    def test_flush(self):
+        """Кадры отправляются пачками по write_batch, отправка планируется один раз за итерацию цикла"""
+        for frame in (b'aaa', b'bbb', b'ccc'):
+            self.connection.enqueue(frame)
+        self.engine.loop.call_soon.assert_called_once_with(self.engine._flush)
+        self.engine._flush()
+        self.assertEqual(self.transport.writelines.call_args_list, [mock.call([b'aaa', b'bbb']), mock.call([b'ccc'])])
+        self.assertFalse(self.connection.out_queue)
+        self.assertFalse(self.engine.flush_scheduled)
+        self.server.limiter.drained.assert_called_once_with(self.connection)
+
+    def test_pause_writing(self):
+        """Пока буфер транспорта переполнен, кадры остаются в очереди и отправляются после resume_writing"""
+        self.protocol.pause_writing()
+        self.connection.enqueue(b'aaa')
+        self.engine._flush()
+        self.transport.writelines.assert_not_called()
+        self.assertEqual(list(self.connection.out_queue), [b'aaa'])
+        self.protocol.resume_writing()
+        self.assertIn(self.connection, self.engine.pending)
+        self.engine._flush()
+        self.transport.writelines.assert_called_once_with([b'aaa'])
+
+    def test_connection_lost(self):
+        """Разорванное подключение закрывается сервером и не отправляет кадры"""
+        self.protocol.pause_writing()
+        self.connection.enqueue(b'aaa')
+        self.protocol.connection_lost(None)
+        self.assertTrue(self.connection.closed)
+        self.assertNotIn(self.connection, self.engine.write_paused)
+        self.server._close_client_socket.assert_called_once_with(self.connection)
+        self.engine._flush()
+        self.transport.writelines.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest_main()
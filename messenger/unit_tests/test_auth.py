@@ -0,0 +1,46 @@
+import os
+import sys
+import threading
+from unittest import TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.auth import PasswordHasher
+from common.tcp_socket import TCPSocket
+
+
+class TestPasswordHasher(TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(lambda callback, *args: callback(*args), workers=1)
+        self.done = threading.Event()
+        self.results = []
+
+    def tearDown(self):
+        self.hasher.shutdown()
+
+    def callback(self, password_hash):
+        self.results.append(password_hash)
+        self.done.set()
+
+    def test_hash_in_pool(self):
+        """Хеш из пула процессов совпадает с синхронным вычислением"""
+        self.hasher.hash_password('user1', '123456', self.callback)
+        self.assertTrue(self.done.wait(30))
+        self.assertEqual(self.results, [TCPSocket.get_password_hash('user1', '123456')])
+
+    def test_cached_password(self):
+        """Проверенный пароль берётся из кеша без пула процессов"""
+        self.hasher.remember('user1', '123456', b'hash')
+        self.hasher.hash_password('user1', '123456', self.callback)
+        self.assertEqual(self.results, [b'hash'])
+        self.assertIsNone(self.hasher.executor)
+
+    def test_cache_limit(self):
+        """Кеш ограничен по размеру, вытесняются самые старые записи"""
+        self.hasher.cache_size = 2
+        for i in range(3):
+            self.hasher.remember(f'user{i}', '123456', f'hash{i}')
+        self.assertEqual(len(self.hasher.cache), 2)
+        self.assertNotIn(self.hasher._cache_key('user0', '123456'), self.hasher.cache)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,84 @@
+import os
+import sys
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.backpressure import SlowConsumerLimiter, POLICY_PAUSE, POLICY_DROP_OLDEST, POLICY_DISCONNECT
+from server.connections import ClientConnection
+
+
+class TestSlowConsumerLimiter(TestCase):
+    def setUp(self):
+        self.engine = mock.Mock()
+        self.disconnect = mock.Mock()
+        self.consumer = ClientConnection(self.engine, ('127.0.0.1', 50001))
+        self.sender = ClientConnection(self.engine, ('127.0.0.1', 50002))
+        for _ in range(5):
+            self.consumer.enqueue(b'x' * 10)
+
+    def limiter(self, policy):
+        return SlowConsumerLimiter(self.disconnect, high_watermark=30, low_watermark=20, policy=policy)
+
+    def test_under_watermark(self):
+        """Пока очередь ниже верхней границы, ничего не происходит"""
+        limiter = SlowConsumerLimiter(self.disconnect, high_watermark=100, low_watermark=20, policy=POLICY_DISCONNECT)
+        limiter.check(self.consumer, self.sender)
+        self.disconnect.assert_not_called()
+
+    def test_pause(self):
+        """Чтение отправителя приостанавливается и возобновляется после разгрузки получателя"""
+        limiter = self.limiter(POLICY_PAUSE)
+        limiter.check(self.consumer, self.sender)
+        self.assertTrue(self.sender.paused)
+        self.engine.pause_reading.assert_called_once_with(self.sender)
+        limiter.drained(self.consumer)
+        self.assertTrue(self.sender.paused)
+        self.consumer.queued_bytes = 20
+        limiter.drained(self.consumer)
+        self.assertFalse(self.sender.paused)
+        self.engine.resume_reading.assert_called_once_with(self.sender)
+        self.assertEqual(limiter.counters['paused'], 1)
+        self.assertEqual(limiter.counters['resumed'], 1)
+
+    def test_pause_several_consumers(self):
+        """Отправитель остаётся на паузе, пока его держит хотя бы один получатель"""
+        limiter = self.limiter(POLICY_PAUSE)
+        other = ClientConnection(self.engine, ('127.0.0.1', 50003))
+        other.queued_bytes = 50
+        limiter.check(self.consumer, self.sender)
+        limiter.check(other, self.sender)
+        limiter.release(self.consumer)
+        self.assertTrue(self.sender.paused)
+        limiter.release(other)
+        self.assertFalse(self.sender.paused)
+
+    def test_pause_without_sender(self):
+        """Без известного отправителя выбрасываются старые кадры"""
+        limiter = self.limiter(POLICY_PAUSE)
+        limiter.check(self.consumer)
+        self.assertEqual(self.consumer.queued_bytes, 20)
+
+    def test_drop_oldest(self):
+        """Выбрасываются старые кадры, первый (возможно начатый) остаётся"""
+        self.consumer.out_queue[0] = b'head'
+        self.consumer.queued_bytes -= 6
+        limiter = self.limiter(POLICY_DROP_OLDEST)
+        limiter.check(self.consumer, self.sender)
+        self.assertEqual(list(self.consumer.out_queue), [b'head', b'x' * 10])
+        self.assertEqual(self.consumer.queued_bytes, 14)
+        self.assertEqual(self.consumer.dequeued_bytes, 0)
+        self.assertEqual(limiter.counters['dropped'], 3)
+
+    def test_disconnect(self):
+        """Медленный получатель отключается"""
+        limiter = self.limiter(POLICY_DISCONNECT)
+        limiter.check(self.consumer, self.sender)
+        self.disconnect.assert_called_once_with(self.consumer)
+        self.assertEqual(limiter.counters['disconnected'], 1)
+
+    def test_unknown_policy(self):
+        """Неизвестная политика"""
+        self.assertRaises(ValueError, SlowConsumerLimiter, self.disconnect, policy='wait')
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -3,8 +3,7 @@ import sys
 from unittest import mock, TestCase, main as unittest_main
 sys.path.append(os.path.join(os.getcwd(), '..'))
 from client import MsgClient
-import common.settings as settings
-import json
+from common.tcp_socket import TCPSocket, FRAME_HEADER
 
 
 class TestClient(TestCase):
@@ -15,8 +14,8 @@ class TestClient(TestCase):
 
     def mock_byte_response(self, dict_response: dict):
         """Имитируем получение байтовых данных"""
-        json_data = json.dumps(dict_response)
-        self.mock_socket.return_value.recv.return_value = json_data.encode(settings.ENCODING)
+        frame = TCPSocket.encode_message(dict_response)
+        self.mock_socket.return_value.recv.side_effect = [frame[:FRAME_HEADER.size], frame[FRAME_HEADER.size:]]
 
     def test_get_response_200(self):
         """Обработка верного ответа присутствия"""
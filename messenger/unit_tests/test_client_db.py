@@ -0,0 +1,41 @@
+import os
+import sys
+from unittest import TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from client.client_db import ClientDB
+
+
+class TestClientDBUsers(TestCase):
+    def setUp(self):
+        self.db = ClientDB(':memory:')
+
+    def test_add_users(self):
+        """Уже известные и повторяющиеся имена не дублируются"""
+        self.db.add_users(['user1', 'user2'])
+        self.db.add_users(['user2', 'user3', 'user3'])
+        self.assertEqual(sorted(user.username for user in self.db.get_users()), ['user1', 'user2', 'user3'])
+
+    def test_del_users(self):
+        """Пользователь с историей сообщений не удаляется"""
+        self.db.add_users(['user1', 'user2', 'user3'])
+        self.db.save_message('user1', 'user2', 'msg')
+        self.db.del_users(['user2', 'user3'])
+        self.assertEqual(sorted(user.username for user in self.db.get_users()), ['user1', 'user2'])
+
+    def test_keep_users(self):
+        """Пользователи не из полного списка удаляются, кроме тех, с кем есть переписка"""
+        self.db.add_users(['user1', 'user2', 'user3', 'user4'])
+        self.db.save_message('user1', 'user3', 'msg')
+        self.db.keep_users(['user1', 'user2'])
+        self.assertEqual(sorted(user.username for user in self.db.get_users()), ['user1', 'user2', 'user3'])
+
+    def test_users_version(self):
+        """Версия списка пользователей сохраняется в базе"""
+        self.assertIsNone(self.db.get_users_version())
+        self.db.set_users_version(3)
+        self.db.set_users_version(5)
+        self.assertEqual(self.db.get_users_version(), 5)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,92 @@
+import os
+import sys
+from unittest import TestCase, skipUnless, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from common import codec
+from common.settings import ACTION_P2P_MESSAGE, REQUEST_ACTION, REQUEST_TIME, REQUEST_USER, REQUEST_DATA, \
+    REQUEST_ACCOUNT_NAME, REQUEST_RECIPIENT, REQUEST_MESSAGE, REQUEST_USERS, ACTION_GET_USERS
+from common.tcp_socket import TCPSocket, FrameDecoder, FRAME_HEADER, FRAME_COMPRESSED
+
+
+class TestCodec(TestCase):
+    def setUp(self):
+        self.message = {
+            REQUEST_ACTION: ACTION_P2P_MESSAGE,
+            REQUEST_TIME: 1.1,
+            REQUEST_USER: {REQUEST_ACCOUNT_NAME: 'user1'},
+            REQUEST_DATA: {REQUEST_RECIPIENT: 'user2', REQUEST_MESSAGE: 'Привет'}
+        }
+
+    def test_json_default(self):
+        """По умолчанию сообщение кодируется в JSON"""
+        self.assertEqual(codec.encode(self.message)[:1], b'{')
+        self.assertEqual(codec.decode(codec.encode(self.message)), self.message)
+
+    def test_choose_codec(self):
+        """Неизвестные кодеки клиента заменяются на JSON"""
+        self.assertEqual(codec.choose_codec(['unknown']), codec.CODEC_JSON)
+        self.assertEqual(codec.choose_codec(None), codec.CODEC_JSON)
+
+    def test_choose_codec_not_list(self):
+        """Значение не списком не перебирается"""
+        for client_codecs in (1, codec.CODEC_MSGPACK, {codec.CODEC_MSGPACK: 1}):
+            self.assertEqual(codec.choose_codec(client_codecs), codec.CODEC_JSON)
+
+    @skipUnless(codec.msgpack, 'msgpack не установлен')
+    def test_msgpack_round_trip(self):
+        """Бинарный кодек восстанавливает исходные ключи и действие"""
+        payload = codec.encode(self.message, codec.CODEC_MSGPACK)
+        self.assertEqual(codec.decode(payload), self.message)
+        self.assertLess(len(payload), len(codec.encode(self.message)))
+
+    @skipUnless(codec.msgpack, 'msgpack не установлен')
+    def test_unknown_keys(self):
+        """Ключи вне таблицы передаются строками"""
+        message = {REQUEST_ACTION: 'custom', 'extra': {'key': 1}}
+        self.assertEqual(codec.decode(codec.encode(message, codec.CODEC_MSGPACK)), message)
+
+    @skipUnless(codec.msgpack, 'msgpack не установлен')
+    def test_frame_sniffing(self):
+        """decode_message различает кодек по первому байту тела кадра"""
+        frame = TCPSocket.encode_message(self.message, codec.CODEC_MSGPACK)
+        self.assertEqual(TCPSocket.decode_message(frame[FRAME_HEADER.size:]), self.message)
+
+    @skipUnless(codec.msgpack, 'msgpack не установлен')
+    def test_decode_not_dict(self):
+        """Бинарное сообщение не словарь"""
+        self.assertRaises(ValueError, codec.decode, codec.msgpack.packb([1, 2]))
+
+
+class TestCompression(TestCase):
+    def setUp(self):
+        self.users = {REQUEST_ACTION: ACTION_GET_USERS, REQUEST_DATA: {REQUEST_USERS: [f'user{i}' for i in range(500)]}}
+        self.small = {REQUEST_ACTION: ACTION_GET_USERS, REQUEST_DATA: {REQUEST_USERS: ['user1']}}
+
+    def test_compressed_frame(self):
+        """Большой список сжимается и распаковывается декодером кадров"""
+        frame = TCPSocket.encode_message(self.users, compression=codec.COMPRESSION_ZLIB)
+        header, = FRAME_HEADER.unpack_from(frame)
+        self.assertTrue(header & FRAME_COMPRESSED)
+        self.assertLess(len(frame), len(TCPSocket.encode_message(self.users)))
+        payloads = FrameDecoder().feed(frame)
+        self.assertEqual(TCPSocket.decode_message(payloads[0]), self.users)
+
+    def test_small_not_compressed(self):
+        """Короткие сообщения отправляются без сжатия"""
+        frame = TCPSocket.encode_message(self.small, compression=codec.COMPRESSION_ZLIB)
+        self.assertEqual(frame, TCPSocket.encode_message(self.small))
+
+    def test_decompress_error(self):
+        """Повреждённое сжатое тело"""
+        self.assertRaises(ValueError, FrameDecoder().feed, FRAME_HEADER.pack(3 | FRAME_COMPRESSED) + b'abc')
+
+    def test_choose_compression(self):
+        """Сжатие включается только по запросу клиента"""
+        self.assertEqual(codec.choose_compression([codec.COMPRESSION_ZLIB]), codec.COMPRESSION_ZLIB)
+        self.assertIsNone(codec.choose_compression(None))
+        self.assertIsNone(codec.choose_compression(1))
+        self.assertIsNone(codec.choose_compression(codec.COMPRESSION_ZLIB))
+
+
+if __name__ == '__main__':
+    unittest_main()
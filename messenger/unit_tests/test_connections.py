@@ -0,0 +1,67 @@
+import os
+import sys
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.connections import ClientConnection, ConnectionRegistry
+
+
+class TestConnectionRegistry(TestCase):
+    def setUp(self):
+        self.engine = mock.Mock()
+        self.registry = ConnectionRegistry()
+        self.connection = ClientConnection(self.engine, ('127.0.0.1', 50001))
+        self.registry.add(self.connection)
+
+    def test_login(self):
+        """Поиск подключения по имени после входа"""
+        self.registry.login(self.connection, 'user1')
+        self.assertIs(self.registry.get_by_name('user1'), self.connection)
+        self.assertEqual(self.connection.account_name, 'user1')
+
+    def test_remove(self):
+        """Отключение удаляет оба индекса"""
+        self.registry.login(self.connection, 'user1')
+        self.registry.remove(self.connection)
+        self.assertNotIn(self.connection, self.registry)
+        self.assertIsNone(self.registry.get_by_name('user1'))
+        self.assertEqual(len(self.registry), 0)
+
+    def test_remove_keeps_other_owner(self):
+        """Отключение старого подключения не затирает новое с тем же именем"""
+        other = ClientConnection(self.engine, ('127.0.0.1', 50002))
+        self.registry.add(other)
+        self.registry.login(self.connection, 'user1')
+        self.registry.login(other, 'user1')
+        self.registry.remove(self.connection)
+        self.assertIs(self.registry.get_by_name('user1'), other)
+
+    def test_enqueue(self):
+        """Первый кадр в очереди будит движок на запись"""
+        self.connection.enqueue(b'frame1')
+        self.connection.enqueue(b'frame2')
+        self.engine.want_write.assert_called_once_with(self.connection)
+        self.assertEqual(self.connection.queue_depth, 2)
+
+    def test_discard(self):
+        """Выброшенный кадр не считается отправленным, метки следующих трасс сдвигаются"""
+        traces = [mock.Mock() for _ in range(3)]
+        for frame, trace in zip((b'head', b'dropped', b'tail'), traces):
+            self.connection.enqueue(frame)
+            self.connection.trace(trace)
+        del self.connection.out_queue[1]
+        self.connection.discard(7)
+        self.assertEqual(self.connection.queued_bytes, 8)
+        self.assertEqual(self.connection.dequeued_bytes, 0)
+        self.assertEqual(list(self.connection.traces), [(4, traces[0]), (8, traces[2])])
+        self.connection.dequeued(8)
+        traces[1].sent.assert_not_called()
+        traces[2].sent.assert_called_once_with(self.connection)
+
+    def test_slots(self):
+        """Состояние подключения не имеет __dict__"""
+        with self.assertRaises(AttributeError):
+            self.connection.something = 1
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,48 @@
+import os
+import sys
+from unittest import TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.qt.connections_model import ConnectionEvents, ConnectionsTableModel
+
+
+def connection(username, port='7000'):
+    return {'username': username, 'time': '12:00 01.01.2024', 'ip': '127.0.0.1', 'port': port}
+
+
+class TestConnectionsTableModel(TestCase):
+    def setUp(self):
+        self.model = ConnectionsTableModel()
+        self.model.fill([connection('user1'), connection('user2')])
+
+    def names(self):
+        return [self.model.index(row, 0).data() for row in range(self.model.rowCount())]
+
+    def test_add(self):
+        """Новый пользователь добавляется строкой, повторный вход обновляет его строку"""
+        self.model.add(connection('user3'))
+        self.model.add(connection('user1', '7001'))
+        self.assertEqual(self.names(), ['user1', 'user2', 'user3'])
+        self.assertEqual(self.model.index(0, 3).data(), '7001')
+
+    def test_remove(self):
+        """На место удалённой строки встаёт последняя"""
+        self.model.add(connection('user3'))
+        self.model.remove('user1')
+        self.model.remove('user4')
+        self.assertEqual(self.names(), ['user3', 'user2'])
+        self.model.remove('user2')
+        self.model.remove('user3')
+        self.assertEqual(self.model.rowCount(), 0)
+
+    def test_events(self):
+        """События подключения и отключения меняют таблицу"""
+        events = ConnectionEvents()
+        events.connected.connect(self.model.add)
+        events.disconnected.connect(self.model.remove)
+        events.notify('user3', connection('user3'))
+        events.notify('user1')
+        self.assertEqual(self.names(), ['user3', 'user2'])
+
+
+if __name__ == '__main__':
+    unittest_main()
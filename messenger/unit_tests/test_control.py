@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from common import settings
+from server.control import ControlServer, send_command
+
+
+class TestControlServer(TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'control.sock')
+        self.control = ControlServer(self.path, mock.Mock(), {
+            'add_user': lambda username, password: f'{username}:{password}',
+            'users': lambda: ['user1', 'user2'],
+            'del_user': mock.Mock(side_effect=AttributeError('error')),
+        })
+        self.control.start()
+
+    def tearDown(self):
+        self.control.stop()
+
+    def test_command(self):
+        """Команда выполняется, результат возвращается со статусом 200"""
+        self.assertEqual(send_command(self.path, 'users'), {
+            settings.RESPONSE_STATUS: 200,
+            settings.REQUEST_DATA: ['user1', 'user2']
+        })
+        response = send_command(self.path, 'add_user', username='user3', password='123456')
+        self.assertEqual(response[settings.REQUEST_DATA], 'user3:123456')
+
+    def test_unknown_command(self):
+        """Неизвестная команда"""
+        self.assertEqual(send_command(self.path, 'stop')[settings.RESPONSE_STATUS], 400)
+
+    def test_wrong_params(self):
+        """Команда с неверными параметрами"""
+        self.assertEqual(send_command(self.path, 'add_user', username='user3')[settings.RESPONSE_STATUS], 400)
+
+    def test_not_string_params(self):
+        """Параметры не строками отклоняются до вызова команды"""
+        response = send_command(self.path, 'add_user', username=1, password='x')
+        self.assertEqual(response[settings.RESPONSE_STATUS], 400)
+
+    def test_command_error(self):
+        """Исключение команды возвращается со статусом 500, следующие команды выполняются"""
+        self.assertEqual(send_command(self.path, 'del_user', username='user1')[settings.RESPONSE_STATUS], 500)
+        self.assertEqual(send_command(self.path, 'users')[settings.RESPONSE_STATUS], 200)
+
+
+if __name__ == '__main__':
+    unittest_main()
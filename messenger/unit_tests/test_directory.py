@@ -0,0 +1,91 @@
+import os
+import sys
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from common import settings
+from server import server_db
+from server.directory import UserDirectory
+from server.server_db import ServerDB
+
+
+class TestUserDirectory(TestCase):
+    def setUp(self):
+        self.db = ServerDB(':memory:')
+        for username in ('user1', 'user2'):
+            self.db.add_user(username, '123456')
+        self.directory = UserDirectory(self.db)
+        self.encoded = []
+
+    def get_data(self, known_version, frame_format=('json', None), cursor=None, limit=None):
+        def encode(data):
+            self.encoded.append(data)
+            return data
+        return self.directory.get_frame(known_version, frame_format, encode, cursor, limit)
+
+    def test_full(self):
+        """Клиент без версии получает полный список"""
+        self.assertEqual(self.get_data(None), {
+            settings.REQUEST_VERSION: 2,
+            settings.REQUEST_USERS: ['user1', 'user2']
+        })
+
+    def test_not_modified(self):
+        """Клиент с текущей версией получает 304"""
+        self.assertEqual(self.get_data(2), {settings.REQUEST_VERSION: 2, settings.RESPONSE_STATUS: 304})
+
+    def test_delta(self):
+        """Клиент со старой версией получает только изменения"""
+        self.db.add_user('user3', '123456')
+        self.db.del_user('user1')
+        self.directory.reload()
+        self.assertEqual(self.get_data(2), {
+            settings.REQUEST_VERSION: 4,
+            settings.REQUEST_ADDED: ['user3'],
+            settings.REQUEST_REMOVED: ['user1']
+        })
+
+    def test_unknown_version(self):
+        """Версия новее серверной или старше журнала изменений - полный список"""
+        self.assertIn(settings.REQUEST_USERS, self.get_data(10))
+        with mock.patch.object(server_db, 'DIRECTORY_CHANGES_LIMIT', 2):
+            self.db.add_user('user3', '123456')
+            self.db.add_user('user4', '123456')
+        self.directory.reload()
+        self.assertIn(settings.REQUEST_USERS, self.get_data(1))
+        self.assertIn(settings.REQUEST_ADDED, self.get_data(3))
+
+    def test_pages(self):
+        """Полный список отдаётся страницами, продолжение запрашивается по курсору"""
+        self.db.add_user('user3', '123456')
+        self.directory.reload()
+        first = self.get_data(None, limit=2)
+        self.assertEqual(first, {
+            settings.REQUEST_VERSION: 3,
+            settings.REQUEST_USERS: ['user1', 'user2'],
+            settings.REQUEST_CURSOR: 'user2'
+        })
+        self.assertEqual(self.get_data(None, cursor=first[settings.REQUEST_CURSOR], limit=2), {
+            settings.REQUEST_VERSION: 3,
+            settings.REQUEST_USERS: ['user3']
+        })
+
+    def test_page_size(self):
+        """Размер страницы не больше заданного на сервере"""
+        directory = UserDirectory(self.db, page_size=1)
+        data = directory.get_frame(None, ('json', None), lambda users_data: users_data, limit=100)
+        self.assertEqual(data[settings.REQUEST_USERS], ['user1'])
+
+    def test_cache(self):
+        """Ответ кодируется один раз на версию и формат кадра до изменения списка"""
+        self.get_data(None)
+        self.get_data(None)
+        self.get_data(None, ('msgpack', None))
+        self.assertEqual(len(self.encoded), 2)
+        self.db.add_user('user3', '123456')
+        self.directory.reload()
+        self.assertIn('user3', self.get_data(None)[settings.REQUEST_USERS])
+        self.assertEqual(len(self.encoded), 3)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,26 @@
+import os
+import sys
+from unittest import TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from loadgen import choose_recipient, PATTERN_PAIRS, PATTERN_RANDOM, PATTERN_HOTSPOT
+
+
+class TestChooseRecipient(TestCase):
+    def test_pairs(self):
+        """Клиенты разбиты на пары, лишний клиент пишет первому"""
+        self.assertEqual([choose_recipient(PATTERN_PAIRS, index, 5) for index in range(5)], [1, 0, 3, 2, 0])
+
+    def test_random(self):
+        """Случайный получатель - любой клиент, кроме самого отправителя"""
+        recipients = {choose_recipient(PATTERN_RANDOM, 0, 3) for _ in range(200)}
+        self.assertEqual(recipients, {1, 2})
+
+    def test_hotspot(self):
+        """Получатели только из первых hot клиентов"""
+        recipients = {choose_recipient(PATTERN_HOTSPOT, index, 100, hot=3) for index in range(10, 50)}
+        self.assertTrue(recipients <= {0, 1, 2})
+        self.assertNotIn(1, {choose_recipient(PATTERN_HOTSPOT, 1, 100, hot=2) for _ in range(50)})
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,71 @@
+import os
+import sys
+from unittest import TestCase, main as unittest_main
+from urllib.request import urlopen
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.metrics import Histogram, Metrics, MetricsServer, bucket_index, bucket_upper
+
+
+class TestHistogram(TestCase):
+    def test_buckets(self):
+        """Корзины идут подряд, значение меньше верхней границы своей корзины"""
+        previous = 0
+        for micros in range(100000):
+            index = bucket_index(micros)
+            self.assertIn(index, (previous, previous + 1))
+            self.assertLess(micros, bucket_upper(index))
+            previous = index
+
+    def test_percentile(self):
+        """Процентили с погрешностью не больше 1/8"""
+        histogram = Histogram()
+        for micros in range(1, 1001):
+            histogram.record(micros / 1000000)
+        self.assertEqual(histogram.count, 1000)
+        for q, expected in ((0.5, 0.0005), (0.99, 0.00099)):
+            self.assertAlmostEqual(histogram.percentile(q), expected, delta=expected / 8)
+        self.assertEqual(histogram.percentile(1), 0.001)
+        self.assertEqual(Histogram().percentile(0.99), 0.0)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.inc('frames_in', 'presence')
+        self.metrics.inc('frames_in', 'presence')
+        self.metrics.inc('bytes_in', None, 100)
+        self.metrics.observe('request_seconds', 'presence', 0.001)
+        self.metrics.gauge('connections_open', lambda: 3)
+        self.metrics.gauge('slow_consumer_events', lambda: {'paused': 1})
+
+    def test_render(self):
+        """Текстовый формат Prometheus: счётчики с _total, метки, корзины гистограмм"""
+        text = self.metrics.render()
+        self.assertIn('# TYPE msg_frames_in counter\nmsg_frames_in_total{action="presence"} 2\n', text)
+        self.assertIn('msg_bytes_in_total 100\n', text)
+        self.assertIn('msg_connections_open 3\n', text)
+        self.assertIn('msg_slow_consumer_events_total{event="paused"} 1\n', text)
+        self.assertIn('msg_request_seconds_bucket{action="presence",le="+Inf"} 1\n', text)
+        self.assertIn('msg_request_seconds_count{action="presence"} 1\n', text)
+        self.assertNotIn('frames_out', text)
+
+    def test_summary(self):
+        """Сводка для журнала содержит итоги и процентили"""
+        lines = self.metrics.summary()
+        self.assertTrue(lines[0].startswith('frames_in 2 '))
+        self.assertIn('connections_open 3', lines[1])
+        self.assertTrue(lines[2].startswith('request_seconds[presence]: n=1 '))
+
+    def test_http(self):
+        """HTTP отдаёт метрики по /metrics"""
+        server = MetricsServer(self.metrics, 0)
+        server.start()
+        try:
+            with urlopen(f'http://127.0.0.1:{server.port}/metrics') as response:
+                self.assertEqual(response.read().decode('utf-8'), self.metrics.render())
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,119 @@
+import importlib.util
+import os
+import sys
+import tempfile
+from unittest import mock, skipUnless, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+import common.settings as settings
+from common import codec
+from common.tcp_socket import FrameDecoder
+from server.connections import ClientConnection
+from server.server_db import ServerDB
+
+# server.py называется так же, как пакет server, поэтому модуль загружается по пути к файлу
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+spec = importlib.util.spec_from_file_location('msg_server', os.path.join(BASE_DIR, 'server.py'))
+msg_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(msg_server)
+msg_server.CONFIG_FILE = os.path.join(BASE_DIR, 'server', 'server.ini')
+
+
+class TestMsgServer(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp_dir.name, 'server.sqlite3')
+        with mock.patch.object(msg_server, 'ServerDB', lambda _, **kwargs: ServerDB(db_path, **kwargs)):
+            self.server = msg_server.MsgServer()
+        self.server.logger = mock.Mock()
+        self.server.password_hasher = mock.Mock()
+        self.server.db.add_user('user1', 'hash1')
+        self.engine = mock.Mock()
+
+    def tearDown(self):
+        self.server.sock.close()
+        self.server.db.close_stats()
+        self.server.db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def connect(self, port=50001):
+        connection = ClientConnection(self.engine, ('127.0.0.1', port))
+        self.server.connections.add(connection)
+        # имя подключению присваивает _dispatch_message до вызова обработчика
+        self.server.connections.login(connection, 'user1')
+        return connection
+
+    def frames(self, connection):
+        payloads = FrameDecoder().feed(b''.join(connection.out_queue))
+        return [self.server.decode_message(payload) for payload in payloads]
+
+    def request(self, action, data=None):
+        return self.server.compose_action_request(action, {settings.REQUEST_ACCOUNT_NAME: 'user1'}, data)
+
+    def test_finish_presence(self):
+        """После входа отложенные запросы обрабатываются по порядку"""
+        connection = self.connect()
+        connection.deferred = [(self.request(settings.ACTION_GET_CONTACTS), 0.0, 0.0)]
+        self.server._finish_presence(connection, 'user1', 'password', 'hash1')
+        self.assertIsNone(connection.deferred)
+        self.assertEqual([frame[settings.REQUEST_ACTION] for frame in self.frames(connection)],
+                         [settings.ACTION_PRESENCE, settings.ACTION_GET_CONTACTS])
+
+    @skipUnless(codec.msgpack, 'msgpack не установлен')
+    def test_resume_codec(self):
+        """После возобновления сессии кадры идут в кодеке и со сжатием, согласованными при входе"""
+        connection = self.connect()
+        connection.deferred = []
+        self.server._finish_presence(connection, 'user1', 'password', 'hash1', {
+            settings.REQUEST_CODECS: [codec.CODEC_MSGPACK],
+            settings.REQUEST_COMPRESSION: [codec.COMPRESSION_ZLIB]
+        })
+        token = self.frames(connection)[0][settings.REQUEST_DATA][settings.REQUEST_TOKEN]
+        self.server._close_client_socket(connection)
+
+        resumed = self.connect(50002)
+        self.server._process_resume(resumed, 'user1', self.request(settings.ACTION_RESUME, {
+            settings.REQUEST_TOKEN: token, settings.REQUEST_SEQ: 0
+        }))
+        self.assertEqual((resumed.codec, resumed.compression), (codec.CODEC_MSGPACK, codec.COMPRESSION_ZLIB))
+        response = self.frames(resumed)[0]
+        self.assertEqual(response[settings.REQUEST_DATA][settings.RESPONSE_STATUS], 200)
+        self.assertNotEqual(FrameDecoder().feed(resumed.out_queue[0])[0][:1], b'{')
+        self.assertIs(self.server.connections.get_by_name('user1'), resumed)
+
+    def test_del_user_rooms(self):
+        """Удалённый пользователь выходит из комнат в памяти, новый с тем же именем в них не попадает"""
+        self.server.db.add_user('user2', 'hash2')
+        self.server.rooms.create('room1', 'user1')
+        self.server.rooms.join('room1', 'user2')
+        self.assertTrue(self.server._del_user('user2'))
+        self.assertEqual(self.server.rooms.members('room1'), {'user1'})
+
+    def test_negotiate_not_list(self):
+        """Кодеки не списком игнорируются, клиент остаётся на JSON"""
+        connection = self.connect()
+        self.assertEqual(self.server._negotiate(connection, {settings.REQUEST_CODECS: 1}), {})
+        self.assertEqual(connection.codec, 'json')
+
+    def test_presence_bad_compression(self):
+        """Сжатие не списком не мешает входу"""
+        connection = self.connect()
+        connection.deferred = []
+        self.server._finish_presence(connection, 'user1', 'password', 'hash1', {settings.REQUEST_COMPRESSION: 1})
+        self.assertFalse(connection.closed)
+        self.assertIsNone(connection.compression)
+        self.assertEqual(self.frames(connection)[0][settings.REQUEST_ACTION], settings.ACTION_PRESENCE)
+
+    def test_finish_presence_error(self):
+        """Ошибка при входе закрывает только это подключение и не оставляет его в режиме откладывания"""
+        connection = self.connect()
+        connection.deferred = [(self.request(settings.ACTION_GET_CONTACTS), 0.0, 0.0)]
+        with mock.patch.object(self.server, '_login', side_effect=TypeError):
+            self.server._finish_presence(connection, 'user1', 'password', 'hash1')
+        self.assertIsNone(connection.deferred)
+        self.assertTrue(connection.closed)
+        self.server.logger.exception.assert_called_once()
+        self.assertNotIn(connection, self.server.connections)
+
+
+if __name__ == '__main__':
+    unittest_main()
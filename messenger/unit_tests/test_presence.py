@@ -0,0 +1,38 @@
+import os
+import sys
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.presence import PresenceRegistry
+
+
+class TestPresenceRegistry(TestCase):
+    def setUp(self):
+        self.snapshot = mock.Mock()
+        self.presence = PresenceRegistry(self.snapshot)
+
+    def test_online(self):
+        """Повторный вход обновляет адрес, выход убирает пользователя"""
+        self.presence.set_online('user1', ('127.0.0.1', 7000), 100)
+        self.presence.set_online('user2', ('127.0.0.1', 7001), 200)
+        self.presence.set_online('user1', ('127.0.0.1', 7002), 300)
+        self.presence.set_offline('user2')
+        self.presence.set_offline('user3')
+        self.assertEqual(self.presence.items(), [('user1', ('127.0.0.1', 7002, 300))])
+        self.assertIn('user1', self.presence)
+        self.assertNotIn('user2', self.presence)
+
+    def test_save(self):
+        """Снимок передаётся только после изменения списка"""
+        self.presence.save()
+        self.snapshot.assert_not_called()
+        self.presence.set_online('user1', ('127.0.0.1', 7000), 100)
+        self.presence.save()
+        self.presence.save()
+        self.snapshot.assert_called_once_with([('user1', ('127.0.0.1', 7000, 100))])
+        self.presence.set_offline('user1')
+        self.presence.save()
+        self.snapshot.assert_called_with([])
+
+
+if __name__ == '__main__':
+    unittest_main()
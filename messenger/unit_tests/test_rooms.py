@@ -0,0 +1,66 @@
+import os
+import sys
+from unittest import TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.rooms import RoomRegistry
+from server.server_db import ServerDB
+
+
+class TestRoomRegistry(TestCase):
+    def setUp(self):
+        self.rooms = RoomRegistry({'room1': ['user1']})
+
+    def test_create(self):
+        """Создатель становится участником, повторное создание запрещено"""
+        self.assertTrue(self.rooms.create('room2', 'user2'))
+        self.assertFalse(self.rooms.create('room2', 'user3'))
+        self.assertEqual(self.rooms.members('room2'), {'user2'})
+
+    def test_join_leave(self):
+        """Вход и выход из комнаты"""
+        self.assertTrue(self.rooms.join('room1', 'user2'))
+        self.assertFalse(self.rooms.join('room1', 'user2'))
+        self.assertTrue(self.rooms.is_member('room1', 'user2'))
+        self.assertTrue(self.rooms.leave('room1', 'user2'))
+        self.assertFalse(self.rooms.leave('room1', 'user2'))
+        self.assertEqual(self.rooms.members('room1'), {'user1'})
+
+    def test_unknown_room(self):
+        """Неизвестная комната пуста"""
+        self.assertEqual(self.rooms.members('room3'), set())
+        self.assertFalse(self.rooms.is_member('room3', 'user1'))
+
+
+class TestServerDBRooms(TestCase):
+    def setUp(self):
+        self.db = ServerDB(':memory:')
+        for username in ('user1', 'user2', 'user3'):
+            self.db.add_user(username, '123456')
+
+    def test_rooms(self):
+        """Комнаты и участники сохраняются в базе"""
+        self.assertTrue(self.db.add_room('room1', 'user1'))
+        self.assertFalse(self.db.add_room('room1', 'user2'))
+        self.db.add_room_member('room1', 'user2')
+        self.db.add_room_member('room1', 'user2')
+        self.db.add_room_member('room1', 'user3')
+        self.db.del_room_member('room1', 'user3')
+        self.assertEqual(self.db.get_rooms(), {'room1': {'user1', 'user2'}})
+
+    def test_del_user(self):
+        """Удалённый пользователь выходит из комнат"""
+        self.db.add_room('room1', 'user1')
+        self.db.add_room_member('room1', 'user2')
+        self.db.del_user('user2')
+        self.assertEqual(self.db.get_rooms(), {'room1': {'user1'}})
+
+    def test_remove_user(self):
+        """Удалённый пользователь выходит из всех комнат в памяти"""
+        rooms = RoomRegistry({'room1': {'user1', 'user2'}, 'room2': {'user2'}})
+        rooms.remove_user('user2')
+        self.assertFalse(rooms.is_member('room1', 'user2'))
+        self.assertEqual(rooms.members('room2'), set())
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,69 @@
+import os
+import sys
+from unittest import TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from common import settings
+from common.schemas import NAME, compile_schema, request_action, CLIENT_REQUEST_VALIDATORS, SERVER_MESSAGE_VALIDATORS
+
+
+class TestSchemas(TestCase):
+    def setUp(self):
+        self.validate = compile_schema({
+            settings.REQUEST_TIME: (int, float),
+            settings.REQUEST_DATA: {settings.REQUEST_RECIPIENT: NAME, settings.REQUEST_MESSAGE: str},
+        })
+
+    def test_valid(self):
+        """Сообщение со всеми полями нужных типов"""
+        self.assertIsNone(self.validate({
+            settings.REQUEST_TIME: 1.1,
+            settings.REQUEST_DATA: {settings.REQUEST_RECIPIENT: 'user2', settings.REQUEST_MESSAGE: ''}
+        }))
+
+    def test_missing(self):
+        """Возвращается имя первого отсутствующего поля, в том числе вложенного"""
+        self.assertEqual(self.validate({}), settings.REQUEST_TIME)
+        self.assertEqual(self.validate({settings.REQUEST_TIME: 1}), settings.REQUEST_DATA)
+        self.assertEqual(self.validate({
+            settings.REQUEST_TIME: 1,
+            settings.REQUEST_DATA: {settings.REQUEST_RECIPIENT: 'user2'}
+        }), settings.REQUEST_MESSAGE)
+
+    def test_wrong_type(self):
+        """Поле неверного типа и пустое имя"""
+        self.assertEqual(self.validate({settings.REQUEST_TIME: '1'}), settings.REQUEST_TIME)
+        self.assertEqual(self.validate({settings.REQUEST_TIME: 1, settings.REQUEST_DATA: []}), settings.REQUEST_DATA)
+        self.assertEqual(self.validate({
+            settings.REQUEST_TIME: 1,
+            settings.REQUEST_DATA: {settings.REQUEST_RECIPIENT: '', settings.REQUEST_MESSAGE: 'msg'}
+        }), settings.REQUEST_RECIPIENT)
+
+    def test_client_requests(self):
+        """В запросе presence обязателен пароль"""
+        message = {
+            settings.REQUEST_ACTION: settings.ACTION_PRESENCE,
+            settings.REQUEST_TIME: 1.1,
+            settings.REQUEST_USER: {settings.REQUEST_ACCOUNT_NAME: 'user1'}
+        }
+        self.assertIsNone(CLIENT_REQUEST_VALIDATORS[settings.ACTION_GET_USERS](message))
+        self.assertEqual(CLIENT_REQUEST_VALIDATORS[settings.ACTION_PRESENCE](message), settings.REQUEST_PASSWORD)
+
+    def test_server_messages(self):
+        """Сообщения сервера без обязательных полей"""
+        validate = SERVER_MESSAGE_VALIDATORS[settings.ACTION_RESPONSE]
+        self.assertIsNone(validate({settings.REQUEST_DATA: {settings.RESPONSE_STATUS: 200}}))
+        self.assertEqual(validate({settings.REQUEST_DATA: {}}), settings.RESPONSE_STATUS)
+        self.assertIsNone(SERVER_MESSAGE_VALIDATORS[settings.ACTION_PING]({}))
+
+    def test_request_action(self):
+        """Действие-список или словарь не доходит до поиска в таблице обработчиков"""
+        handlers = {settings.ACTION_PING: None}
+        self.assertEqual(request_action({settings.REQUEST_ACTION: settings.ACTION_PING}), settings.ACTION_PING)
+        for action in ([settings.ACTION_PING], {settings.ACTION_PING: 1}, None):
+            action = request_action({settings.REQUEST_ACTION: action})
+            self.assertIsNone(action)
+            self.assertNotIn(action, handlers)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,98 @@
+import os
+import sys
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from common.tcp_socket import TCPSocket
+from server.connections import ClientConnection
+from server.selector_engine import SelectorEngine
+
+
+class TestSelectorEngineWrite(TestCase):
+    def setUp(self):
+        server = mock.Mock()
+        server.config = {'SETTINGS': mock.Mock(getint=mock.Mock(return_value=2))}
+        self.engine = SelectorEngine(server)
+        self.engine.selector = mock.Mock()
+        self.sock = mock.Mock()
+        self.connection = ClientConnection(self.engine, ('127.0.0.1', 50001), sock=self.sock)
+        self.connection.out_queue.extend([b'aaa', b'bbb', b'ccc'])
+
+    def tearDown(self):
+        self.engine.waker.close()
+        self.engine.waker_trigger.close()
+
+    def test_batch(self):
+        """Кадры отправляются пачкой не больше write_batch за вызов"""
+        self.sock.sendmsg.return_value = 6
+        self.engine._write(self.connection)
+        self.sock.sendmsg.assert_called_once_with([b'aaa', b'bbb'])
+        self.assertEqual(list(self.connection.out_queue), [b'ccc'])
+        self.engine.selector.modify.assert_not_called()
+
+    def test_partial(self):
+        """Неотправленный остаток кадра остаётся в начале очереди"""
+        self.sock.sendmsg.return_value = 4
+        self.engine._write(self.connection)
+        self.assertEqual(list(self.connection.out_queue), [b'bb', b'ccc'])
+
+    def test_queue_empty(self):
+        """После отправки всей очереди сокет снимается с ожидания записи"""
+        self.connection.out_queue.pop()
+        self.sock.sendmsg.return_value = 6
+        self.engine._write(self.connection)
+        self.assertFalse(self.connection.out_queue)
+        self.engine.selector.modify.assert_called_once()
+
+
+class TestSelectorEngineRead(TestCase):
+    def setUp(self):
+        self.server = mock.Mock()
+        self.server.config = {'SETTINGS': mock.Mock(getint=mock.Mock(return_value=2))}
+        self.server.decode_message = TCPSocket.decode_message
+        self.engine = SelectorEngine(self.server)
+        self.engine.selector = mock.Mock()
+        self.sock = mock.Mock()
+        self.connection = ClientConnection(self.engine, ('127.0.0.1', 50001), sock=self.sock)
+        self.sock.recv.return_value = TCPSocket.encode_message({'action': 'ping'}) * 2
+
+    def tearDown(self):
+        self.engine.waker.close()
+        self.engine.waker_trigger.close()
+
+    def test_messages(self):
+        """Все запросы пачки передаются серверу по порядку"""
+        self.engine._read(self.connection)
+        self.assertEqual(self.server._process_message_from_client.call_count, 2)
+        self.server._close_client_socket.assert_not_called()
+
+    def test_handler_error(self):
+        """Исключение обработчика закрывает только это подключение, остаток пачки не обрабатывается"""
+        self.server._process_message_from_client.side_effect = TypeError
+        self.engine._read(self.connection)
+        self.assertEqual(self.server._process_message_from_client.call_count, 1)
+        self.server.logger.exception.assert_called_once()
+        self.server._close_client_socket.assert_called_once_with(self.connection)
+
+
+class TestSelectorEngineCallbacks(TestCase):
+    def setUp(self):
+        self.server = mock.Mock()
+        self.server.config = {'SETTINGS': mock.Mock(getint=mock.Mock(return_value=2))}
+        self.engine = SelectorEngine(self.server)
+
+    def tearDown(self):
+        self.engine.waker.close()
+        self.engine.waker_trigger.close()
+
+    def test_callback_error(self):
+        """Исключение отложенного вызова пишется в журнал, следующие вызовы выполняются"""
+        callback = mock.Mock()
+        self.engine.call_soon_threadsafe(mock.Mock(side_effect=TypeError))
+        self.engine.call_soon_threadsafe(callback, 1)
+        self.engine._run_callbacks()
+        self.server.logger.exception.assert_called_once()
+        callback.assert_called_once_with(1)
+
+
+if __name__ == '__main__':
+    unittest_main()
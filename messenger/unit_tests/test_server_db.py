@@ -0,0 +1,191 @@
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock, TestCase, main as unittest_main
+from sqlalchemy.exc import OperationalError
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from common.settings import SERVER_LOGGER_NAME
+from server import server_db
+from server.server_db import ServerDB, MessageStats
+
+
+class TestOfflineMessages(TestCase):
+    def setUp(self):
+        self.db = ServerDB(':memory:')
+        for username in ('user1', 'user2'):
+            self.db.add_user(username, '123456')
+
+    def test_pop(self):
+        """Сообщения отдаются по порядку и удаляются после выдачи"""
+        self.db.save_offline_message('user1', 'user2', 'msg1')
+        self.db.save_offline_message('user1', 'user2', 'msg2')
+        messages = self.db.pop_offline_messages('user2')
+        self.assertEqual([(sender, message) for sender, message, _ in messages], [('user1', 'msg1'), ('user1', 'msg2')])
+        self.assertEqual(self.db.pop_offline_messages('user2'), [])
+
+    def test_pop_empty(self):
+        """Если сообщений нет, в базу ничего не пишется"""
+        with mock.patch.object(self.db.session, 'commit') as commit:
+            self.assertEqual(self.db.pop_offline_messages('user2'), [])
+        commit.assert_not_called()
+
+    def test_unknown_recipient(self):
+        """Для несуществующего пользователя сообщение не сохраняется"""
+        self.assertFalse(self.db.save_offline_message('user1', 'user3', 'msg1'))
+
+    def test_limit(self):
+        """При превышении лимита удаляются самые старые сообщения"""
+        with mock.patch.object(server_db, 'OFFLINE_MESSAGES_LIMIT', 2):
+            for i in range(4):
+                self.db.save_offline_message('user1', 'user2', f'msg{i}')
+        messages = self.db.pop_offline_messages('user2')
+        self.assertEqual([message for _, message, _ in messages], ['msg2', 'msg3'])
+
+    def test_ttl(self):
+        """Просроченные сообщения не доставляются"""
+        self.db.save_offline_message('user1', 'user2', 'msg1')
+        self.db.session.query(ServerDB.OfflineMessage).update({'created_at': datetime(2000, 1, 1)})
+        self.db.session.commit()
+        self.db.save_offline_message('user1', 'user2', 'msg2')
+        self.assertEqual([message for _, message, _ in self.db.pop_offline_messages('user2')], ['msg2'])
+
+
+class TestUsersPage(TestCase):
+    def setUp(self):
+        self.db = ServerDB(':memory:')
+        for username in ('user3', 'user1', 'user4', 'user2', 'user5'):
+            self.db.add_user(username, '123456')
+
+    def test_pages(self):
+        """Страницы идут по алфавиту, последняя без курсора"""
+        self.assertEqual(self.db.get_users_page(None, 2), (['user1', 'user2'], 'user2'))
+        self.assertEqual(self.db.get_users_page('user2', 2), (['user3', 'user4'], 'user4'))
+        self.assertEqual(self.db.get_users_page('user4', 2), (['user5'], None))
+
+    def test_exact_page(self):
+        """Если имён ровно на страницу, следующей страницы нет"""
+        self.assertEqual(self.db.get_users_page('user3', 2), (['user4', 'user5'], None))
+
+
+class TestConnections(TestCase):
+    def setUp(self):
+        self.db = ServerDB(':memory:')
+        for username in ('user1', 'user2'):
+            self.db.add_user(username, '123456')
+
+    def test_login(self):
+        """Вход пишет историю, но не таблицу подключений"""
+        self.assertIs(self.db.user_login('user1', '123456', '127.0.0.1', 7000), True)
+        self.assertEqual(len(self.db.get_authorizations('user1')), 1)
+        self.assertEqual(self.db.get_connections(), [])
+
+    def test_save_connections(self):
+        """Снимок заменяет таблицу подключений, неизвестные имена пропускаются"""
+        self.db.save_connections([('user1', ('127.0.0.1', 7000, 0)), ('user3', ('127.0.0.1', 7001, 0))])
+        self.db.save_connections([('user2', ('127.0.0.1', 7002, 0))])
+        self.assertEqual([(el.user.username, el.port) for el in self.db.get_connections()], [('user2', 7002)])
+
+
+class TestAddUsers(TestCase):
+    def test_add_users(self):
+        """Пользователи добавляются одной пачкой, существующие пропускаются, версия списка растёт"""
+        db = ServerDB(':memory:')
+        db.add_user('user1', '123456')
+        self.assertEqual(db.add_users([('user1', 'x'), ('user2', 'y'), ('user3', 'z')]), 2)
+        self.assertEqual(db.get_user_by_name('user1').password_hash, '123456')
+        self.assertEqual(db.get_directory_changes(1), (['user2', 'user3'], []))
+
+
+class TestMessageStats(TestCase):
+    def setUp(self):
+        # у базы в памяти своё соединение в каждом потоке, а счётчики пишет поток статистики
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = ServerDB(os.path.join(self.tmp_dir.name, 'server.sqlite3'))
+        for username in ('user1', 'user2', 'user3'):
+            self.db.add_user(username, '123456')
+        self.sessions = []
+        self.stats = MessageStats(self._session, ServerDB.User, interval=60, threshold=100)
+
+    def tearDown(self):
+        self.stats.close()
+        self.db.close_stats()
+        self.db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def _session(self):
+        session = self.db.session_factory()
+        session.commit = mock.Mock(wraps=session.commit)
+        self.sessions.append(session)
+        return session
+
+    def _counters(self):
+        return {user.username: (user.sent, user.received) for user in self.db.get_users()}
+
+    def test_add(self):
+        """Счётчики копятся в памяти, база не трогается"""
+        self.stats.add('user1', 'user2')
+        self.stats.add_many('user1', ['user2', 'user3'])
+        self.assertEqual(self.stats.pending, {'user1': [2, 0], 'user2': [0, 2], 'user3': [0, 1]})
+        self.assertEqual(self.sessions, [])
+        self.assertEqual(self._counters()['user1'], (0, 0))
+
+    def test_flush(self):
+        """Все счётчики записываются одной транзакцией и обнуляются"""
+        self.stats.add('user1', 'user2')
+        self.stats.add_many('user2', ['user1', 'user3'])
+        self.stats.flush()
+        self.assertEqual(len(self.sessions), 1)
+        self.sessions[0].commit.assert_called_once()
+        self.assertEqual(self._counters(), {'user1': (1, 1), 'user2': (1, 1), 'user3': (0, 1)})
+        self.assertEqual(self.stats.pending, {})
+        self.stats.flush()
+        self.assertEqual(len(self.sessions), 1)
+
+    def test_threshold(self):
+        """При накоплении порога поток записи сбрасывает счётчики, не дожидаясь таймера"""
+        session_factory = mock.Mock()
+        stats = MessageStats(session_factory, ServerDB.User, interval=60, threshold=2)
+        stats.add('user1', 'user2')
+        time.sleep(0.1)
+        session_factory.assert_not_called()
+        stats.add('user1', 'user2')
+        for _ in range(100):
+            if session_factory.called:
+                break
+            time.sleep(0.01)
+        session_factory.return_value.commit.assert_called_once()
+        stats.close()
+
+    def test_flush_error(self):
+        """Если запись не удалась, счётчики не теряются, а поток записи продолжает работу"""
+        session_factory = mock.Mock()
+        session_factory.return_value.commit.side_effect = OperationalError('UPDATE', {}, Exception('locked'))
+        stats = MessageStats(session_factory, ServerDB.User, interval=60, threshold=1)
+        stats.add('user1', 'user2')
+        stats.add('user2', 'user1')
+        self.assertRaises(OperationalError, stats.flush)
+        self.assertEqual(stats.pending, {'user1': [1, 1], 'user2': [1, 1]})
+        self.assertEqual(stats.pending_count, 2)
+        with self.assertLogs(SERVER_LOGGER_NAME, 'ERROR') as logs:
+            stats.wake.set()
+            for _ in range(100):
+                if logs.records:
+                    break
+                time.sleep(0.01)
+        self.assertTrue(stats.writer.is_alive())
+        session_factory.return_value.commit.side_effect = None
+        stats.close()
+        self.assertEqual(stats.pending, {})
+
+    def test_close(self):
+        """При закрытии поток записи останавливается, остаток счётчиков записывается"""
+        self.stats.add('user1', 'user2')
+        self.stats.close()
+        self.assertFalse(self.stats.writer.is_alive())
+        self.assertEqual(self._counters()['user2'], (0, 1))
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,72 @@
+import os
+import sys
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.connections import ClientConnection
+from server.sessions import SessionStore
+
+
+class TestSessionStore(TestCase):
+    def setUp(self):
+        self.store = SessionStore(ttl=60, buffer_size=3)
+        self.connection = ClientConnection(mock.Mock(), ('127.0.0.1', 50001))
+        self.connection.account_name = 'user1'
+        self.session = self.store.create(self.connection)
+        self.store.attach(self.session, self.connection)
+
+    def test_attach_codec(self):
+        """Сессия запоминает кодек и сжатие, согласованные после её создания"""
+        session = self.store.create(self.connection)
+        self.connection.codec, self.connection.compression = 'msgpack', 'zlib'
+        self.store.attach(session, self.connection)
+        self.assertEqual((session.codec, session.compression), ('msgpack', 'zlib'))
+
+    def test_record(self):
+        """Отправленные кадры нумеруются и хранятся в буфере ограниченного размера"""
+        for frame in (b'1', b'2', b'3', b'4'):
+            self.connection.enqueue(frame)
+        self.assertEqual(self.session.seq, 4)
+        self.assertEqual(list(self.session.buffer), [b'2', b'3', b'4'])
+
+    def test_resume(self):
+        """Возобновление отдаёт только недостающие кадры"""
+        for frame in (b'1', b'2', b'3'):
+            self.connection.enqueue(frame)
+        self.store.detach(self.connection)
+        session, frames = self.store.resume(self.session.token, 'user1', 1)
+        self.assertIs(session, self.session)
+        self.assertEqual(frames, [b'2', b'3'])
+
+    def test_resume_gap_too_large(self):
+        """Если недостающих кадров уже нет в буфере, сессия не возобновляется"""
+        for frame in (b'1', b'2', b'3', b'4'):
+            self.connection.enqueue(frame)
+        self.assertEqual(self.store.resume(self.session.token, 'user1', 0), (None, None))
+        self.assertEqual(len(self.store), 0)
+
+    def test_resume_wrong_user(self):
+        """Токен чужой сессии"""
+        self.assertEqual(self.store.resume(self.session.token, 'user2', 0), (None, None))
+
+    def test_expire(self):
+        """Отключённая сессия удаляется по истечении срока"""
+        self.store.detach(self.connection)
+        with mock.patch('server.sessions.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(self.store.resume(self.session.token, 'user1', 0), (None, None))
+        self.assertEqual(len(self.store), 0)
+
+    def test_broken(self):
+        """Сессия с выброшенными кадрами не возобновляется"""
+        self.session.broken = True
+        self.store.detach(self.connection)
+        self.assertEqual(len(self.store), 0)
+
+    def test_new_login(self):
+        """Новый вход заменяет прежнюю сессию пользователя"""
+        self.store.create(self.connection)
+        self.assertEqual(self.store.resume(self.session.token, 'user1', 0), (None, None))
+        self.assertEqual(len(self.store), 1)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -1,9 +1,8 @@
 import os
 import sys
-import json
 from unittest import mock, TestCase, main as unittest_main
 sys.path.append(os.path.join(os.getcwd(), '..'))
-from common.tcp_socket import TCPSocket
+from common.tcp_socket import TCPSocket, FrameDecoder, FRAME_HEADER
 import common.settings as settings
 
 
@@ -15,8 +14,8 @@ class TestTCPSocket(TestCase):
 
     def mock_byte_response(self, dict_response: dict):
         """Имитируем получение байтовых данных"""
-        json_data = json.dumps(dict_response)
-        self.mock_socket.recv.return_value = json_data.encode(settings.ENCODING)
+        frame = TCPSocket.encode_message(dict_response)
+        self.mock_socket.recv.side_effect = [frame[:FRAME_HEADER.size], frame[FRAME_HEADER.size:]]
 
     def test_get_message(self):
         """Получение сообщения"""
@@ -30,6 +29,26 @@ class TestTCPSocket(TestCase):
         with self.assertRaises(ValueError):
             TCPSocket.get_message(self.mock_socket)
 
+    def test_get_message_by_parts(self):
+        """Получение сообщения, пришедшего несколькими частями"""
+        frame = TCPSocket.encode_message(self.some_dict)
+        self.mock_socket.recv.side_effect = [frame[:2], frame[2:FRAME_HEADER.size], frame[FRAME_HEADER.size:10],
+                                             frame[10:]]
+        result = TCPSocket.get_message(self.mock_socket)
+        self.assertEqual(result, self.some_dict)
+
+    def test_get_message_closed(self):
+        """Соединение закрыто до получения сообщения"""
+        self.mock_socket.recv.return_value = b''
+        with self.assertRaises(ConnectionError):
+            TCPSocket.get_message(self.mock_socket)
+
+    def test_get_message_too_long(self):
+        """Заголовок с недопустимой длиной сообщения"""
+        self.mock_socket.recv.return_value = FRAME_HEADER.pack(settings.MAX_MESSAGE_LENGTH + 1)
+        with self.assertRaises(ValueError):
+            TCPSocket.get_message(self.mock_socket)
+
     def test_send_message(self):
         """Отправка верного сообщения"""
         result = TCPSocket.send_message(self.mock_socket, self.some_dict)
@@ -40,6 +59,38 @@ class TestTCPSocket(TestCase):
         with self.assertRaises(ValueError):
             TCPSocket.send_message(self.mock_socket, self.some_string)
 
+    def test_frame_decoder_coalesced(self):
+        """Несколько кадров в одном чтении"""
+        second_dict = {'message': 'Второе сообщение'}
+        decoder = FrameDecoder()
+        payloads = decoder.feed(TCPSocket.encode_message(self.some_dict) + TCPSocket.encode_message(second_dict))
+        self.assertEqual([TCPSocket.decode_message(payload) for payload in payloads], [self.some_dict, second_dict])
+        self.assertEqual(decoder.buffer, b'')
+
+    def test_frame_decoder_partial(self):
+        """Кадр, разбитый на несколько чтений"""
+        frame = TCPSocket.encode_message(self.some_dict)
+        decoder = FrameDecoder()
+        self.assertEqual(decoder.feed(frame[:3]), [])
+        self.assertEqual(decoder.feed(frame[3:-1]), [])
+        payloads = decoder.feed(frame[-1:])
+        self.assertEqual(TCPSocket.decode_message(payloads[0]), self.some_dict)
+
+    def test_frame_decoder_large(self):
+        """Сообщение длиннее буфера чтения"""
+        big_dict = {'users': [f'user{i}' for i in range(settings.MAX_PACKAGE_LENGTH)]}
+        frame = TCPSocket.encode_message(big_dict)
+        decoder = FrameDecoder()
+        payloads = []
+        for i in range(0, len(frame), settings.MAX_PACKAGE_LENGTH):
+            payloads += decoder.feed(frame[i:i + settings.MAX_PACKAGE_LENGTH])
+        self.assertEqual(TCPSocket.decode_message(payloads[0]), big_dict)
+
+    def test_frame_decoder_too_long(self):
+        """Кадр с недопустимой длиной"""
+        with self.assertRaises(ValueError):
+            FrameDecoder().feed(FRAME_HEADER.pack(settings.MAX_MESSAGE_LENGTH + 1))
+
     def test_int_port(self):
         """Преобразование порта в int"""
         result = TCPSocket.int_port('2222')
@@ -0,0 +1,59 @@
+import os
+import sys
+from unittest import TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.timer_wheel import TimerWheel
+
+
+class TestTimerWheel(TestCase):
+    def setUp(self):
+        self.wheel = TimerWheel(tick=1, size=8)
+        self.fired = []
+
+    def advance(self, ticks):
+        for _ in range(ticks):
+            self.wheel.advance()
+
+    def test_schedule(self):
+        """Таймер срабатывает на нужном тике один раз"""
+        self.wheel.schedule('conn1', 3, self.fired.append)
+        self.advance(2)
+        self.assertEqual(self.fired, [])
+        self.advance(1)
+        self.assertEqual(self.fired, ['conn1'])
+        self.advance(8)
+        self.assertEqual(self.fired, ['conn1'])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_long_delay(self):
+        """Таймер дальше одного оборота колеса ждёт нужное число оборотов"""
+        self.wheel.schedule('conn1', 20, self.fired.append)
+        self.advance(19)
+        self.assertEqual(self.fired, [])
+        self.advance(1)
+        self.assertEqual(self.fired, ['conn1'])
+
+    def test_cancel(self):
+        """Отменённый таймер не срабатывает"""
+        self.wheel.schedule('conn1', 2, self.fired.append)
+        self.wheel.cancel('conn1')
+        self.wheel.cancel('conn2')
+        self.advance(8)
+        self.assertEqual(self.fired, [])
+        self.assertNotIn('conn1', self.wheel)
+
+    def test_reschedule(self):
+        """Повторная постановка заменяет прежний таймер, в том числе из обработчика"""
+        def callback(key):
+            self.fired.append(key)
+            if len(self.fired) < 3:
+                self.wheel.schedule(key, 2, callback)
+
+        self.wheel.schedule('conn1', 1, callback)
+        self.wheel.schedule('conn1', 2, callback)
+        self.advance(10)
+        self.assertEqual(self.fired, ['conn1'] * 3)
+
+
+if __name__ == '__main__':
+    unittest_main()
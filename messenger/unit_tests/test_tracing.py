@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+from server.connections import ClientConnection
+from server.tracing import Tracer, OUTCOME_CLOSED
+
+
+class TestTracer(TestCase):
+    def setUp(self):
+        self.logger = mock.Mock()
+        self.tracer = Tracer(self.logger, sample_rate=1.0)
+        self.sender = ClientConnection(mock.Mock(), ('127.0.0.1', 50001))
+        self.recipient = ClientConnection(mock.Mock(), ('127.0.0.1', 50002))
+        self.recipient.account_name = 'user2'
+        self.received_at = time.monotonic()
+
+    def start(self, action):
+        return self.tracer.start(action, 'user1', self.received_at, self.received_at)
+
+    def stages(self, trace):
+        return [stage for stage, _ in trace.stamps]
+
+    def test_sampling(self):
+        """При нулевой доле запросы не трассируются"""
+        self.assertIsNone(Tracer(self.logger).start('p2p_message', 'user1', self.received_at, self.received_at))
+
+    def test_send(self):
+        """Трасса закрывается, когда из очереди ушли все байты её кадра"""
+        self.recipient.enqueue(b'before')
+        trace = self.start('p2p_message')
+        self.recipient.enqueue(b'frame')
+        self.recipient.trace(trace)
+        trace.done()
+        self.logger.info.assert_not_called()
+        self.recipient.dequeued(8)
+        self.logger.info.assert_not_called()
+        self.recipient.dequeued(3)
+        self.assertEqual(self.stages(trace), ['receive', 'decode', 'dispatch', 'enqueue user2', 'send user2'])
+        self.logger.info.assert_called_once_with(trace.format())
+
+    def test_dropped(self):
+        """Трасса выброшенного кадра закрывается с исходом dropped и пишется в журнал при любом времени"""
+        self.tracer.threshold = 3600
+        self.recipient.enqueue(b'head')
+        trace = self.start('p2p_message')
+        self.recipient.enqueue(b'frame')
+        self.recipient.trace(trace)
+        trace.done()
+        del self.recipient.out_queue[1]
+        self.recipient.discard(5)
+        self.assertEqual(trace.outcome, 'dropped')
+        self.assertEqual(self.stages(trace)[-1], 'dropped user2')
+        self.assertFalse(self.recipient.traces)
+        self.logger.info.assert_called_once_with(trace.format())
+        self.assertIn('(dropped)', trace.format())
+
+    def test_closed(self):
+        """При закрытии подключения кадры ждущих трасс считаются неотправленными, исход closed"""
+        trace = self.start('p2p_message')
+        self.recipient.enqueue(b'frame')
+        self.recipient.trace(trace)
+        self.recipient.abandon_traces(OUTCOME_CLOSED)
+        self.logger.info.assert_not_called()
+        trace.done()
+        self.assertEqual(trace.outcome, 'closed')
+        self.logger.info.assert_called_once_with(trace.format())
+
+    def test_threshold(self):
+        """Быстрые трассы в журнал не пишутся"""
+        self.tracer.threshold = 3600
+        self.start('get_contacts').done()
+        self.logger.info.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -0,0 +1,74 @@
+import os
+import socket
+import sys
+import tempfile
+from unittest import mock, TestCase, main as unittest_main
+sys.path.append(os.path.join(os.getcwd(), '..'))
+import common.settings as settings
+from common.tcp_socket import TCPSocket, FrameDecoder
+from server.workers import WorkerLink, compose_router_message, ROUTER_HELLO, ROUTER_ROUTE, ROUTER_DIRECTORY
+
+
+class TestWorkerLink(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp_dir.name, 'router.sock')
+        self.router = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.router.bind(path)
+        self.router.listen(1)
+        self.server = mock.Mock()
+        self.engine = mock.Mock()
+        self.link = WorkerLink(self.server, 0, path)
+        self.peer, _ = self.router.accept()
+        self.peer.settimeout(1)
+
+    def tearDown(self):
+        self.link.sock.close()
+        self.peer.close()
+        self.router.close()
+        self.tmp_dir.cleanup()
+
+    def received(self):
+        return [TCPSocket.decode_message(payload) for payload in FrameDecoder().feed(self.peer.recv(65536))]
+
+    def route(self, recipient):
+        message = {settings.REQUEST_ACTION: settings.ACTION_P2P_MESSAGE,
+                   settings.REQUEST_DATA: {settings.REQUEST_SENDER: 'user1', settings.REQUEST_MESSAGE: 'msg'}}
+        self.peer.sendall(compose_router_message(ROUTER_ROUTE, {settings.REQUEST_RECIPIENT: recipient,
+                                                                settings.REQUEST_MESSAGE: message}))
+        self.link._read()
+        return message
+
+    def test_send(self):
+        """Кадры не пишутся в сокет сразу, а отправляются сетевым циклом по готовности к записи"""
+        self.link.attach(self.engine)
+        self.engine.add_writer.assert_called_once_with(self.link.sock, self.link._write)
+        self.link.offline('user1')
+        self.engine.add_writer.assert_called_once()
+        self.link._write()
+        self.engine.remove_writer.assert_called_once_with(self.link.sock)
+        self.assertFalse(self.link.out_buffer)
+        self.assertEqual([message[settings.REQUEST_ACTION] for message in self.received()], [ROUTER_HELLO, 'offline'])
+
+    def test_route(self):
+        """Пересланное сообщение доставляется подключённому получателю"""
+        message = self.route('user2')
+        self.server._send_to.assert_called_once_with('user2', message)
+        self.server.db.save_offline_message.assert_not_called()
+
+    def test_route_offline(self):
+        """Если получатель отключился, пока сообщение шло через маршрутизатор, оно сохраняется"""
+        self.server.connections.get_by_name.return_value = None
+        self.route('user2')
+        self.server._send_to.assert_not_called()
+        self.server.db.save_offline_message.assert_called_once_with('user1', 'user2', 'msg')
+
+    def test_directory_deleted_user(self):
+        """Удаление пользователя в мастере убирает его из комнат воркера"""
+        self.peer.sendall(compose_router_message(ROUTER_DIRECTORY, {settings.REQUEST_USERNAME: 'user2'}))
+        self.link._read()
+        self.server._reload_directory.assert_called_once_with('user2')
+
+
+if __name__ == '__main__':
+    unittest_main()